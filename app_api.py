@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
 from werkzeug.utils import secure_filename
 from ultralytics import YOLO
 import cv2
 import uuid
+import json
+
+from utils_local.video_probe import ProbeError, check_limits, probe_video
 
 app = Flask(__name__)
 
@@ -11,6 +14,7 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov'}
+MAX_WIDTH, MAX_HEIGHT = 3840, 2160  # Максимальное разрешение загружаемого видео
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
@@ -23,6 +27,42 @@ model = YOLO('yolov8m.pt')  # Убедитесь, что файл лежит в
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+
+def flag_arg(name, default=False):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def iter_detections(save_path, unique_id, save_video):
+    """
+    Детекции по кадрам как генератор строк NDJSON.
+
+    model.predict(stream=True) отдает Results по одному кадру, поэтому память не зависит
+    от длины видео: каждый кадр сериализуется и сразу отбрасывается.
+    """
+    results = model.predict(
+        source=save_path,
+        project=app.config['UPLOAD_FOLDER'],
+        name=unique_id,
+        save=save_video,  # Видео с разметкой кодируется только по запросу
+        conf=0.5,  # Порог уверенности
+        stream=True,
+        verbose=False,
+    )
+    for frame_number, result in enumerate(results):
+        boxes = result.boxes
+        classes = boxes.cls.int().tolist()
+        detections = {
+            'frame': frame_number,
+            'boxes': [[round(value, 1) for value in box] for box in boxes.xyxy.tolist()],
+            'conf': [round(value, 3) for value in boxes.conf.tolist()],
+            'cls': classes,
+            'names': [result.names[cls] for cls in classes],
+        }
+        yield json.dumps(detections) + '\n'
+
 @app.route('/upload', methods=['POST'])
 def upload_video():
     if 'file' not in request.files:
@@ -40,23 +80,49 @@ def upload_video():
     save_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
     file.save(save_path)
 
-    # Обработка видео
+    # Проверка метаданных без декодирования кадров: пустые, нечитаемые и 8K видео не доходят до модели
     try:
-        results = model.predict(
-            source=save_path,
-            project=app.config['UPLOAD_FOLDER'],
-            name=unique_id,
-            save=True,
-            conf=0.5  # Порог уверенности
+        video_info = probe_video(save_path)
+        check_limits(video_info, MAX_WIDTH, MAX_HEIGHT)
+    except ProbeError as e:
+        os.remove(save_path)
+        return jsonify({'error': str(e), 'reason': e.reason}), 422
+
+    # ?stream=true — детекции по кадрам в ответе (NDJSON, chunked), иначе — в файл результатов;
+    # ?save_video=true — дополнительно сохранить видео с разметкой
+    stream = flag_arg('stream')
+    save_video = flag_arg('save_video')
+    output_video = os.path.join(app.config['UPLOAD_FOLDER'], unique_id, filename) if save_video else None
+
+    if stream:
+        def generate():
+            try:
+                yield from iter_detections(save_path, unique_id, save_video)
+            except Exception as e:
+                # Статус ответа уже отправлен, поэтому ошибка передается последней строкой
+                yield json.dumps({'error': str(e)}) + '\n'
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson',
+            headers={'X-Video-Id': unique_id, 'X-Video-Info': json.dumps(video_info.to_dict())},
         )
-        
-        # Путь к результатам
-        output_video = os.path.join(app.config['UPLOAD_FOLDER'], unique_id, filename)
-        
+
+    # Обработка видео с построчной записью детекций в файл
+    results_path = os.path.join(RESULTS_FOLDER, f"{unique_id}.ndjson")
+    try:
+        frames = 0
+        with open(results_path, 'w') as results_file:
+            for line in iter_detections(save_path, unique_id, save_video):
+                results_file.write(line)
+                frames += 1
+
         return jsonify({
             'message': 'Detection complete',
             'video_path': output_video,
-            'results': results[0].tojson()  # JSON с детекциями
+            'results_path': results_path,  # NDJSON с детекциями по кадрам
+            'frames': frames,
+            'video': video_info.to_dict(),
         }), 200
 
     except Exception as e:
@@ -0,0 +1,78 @@
+"""Сравнение сериализации FrameElement: json.dumps(__dict__) против схемной сериализации.
+
+Запуск из корня репозитория: python -m benchmarks.bench_frame_serialization
+"""
+import json
+import time
+
+import numpy as np
+
+from elements.FrameElement import FrameElement
+from elements.TracksStore import TracksStore
+from utils_local.serialization import (
+    frame_element_to_binary,
+    frame_element_from_binary,
+    frame_element_to_json,
+)
+
+N_ITERS = 500
+N_BOXES = 60
+
+
+def make_frame_element() -> FrameElement:
+    rng = np.random.default_rng(0)
+    boxes = rng.integers(0, 1920, size=(N_BOXES, 4)).tolist()
+    frame_element = FrameElement(
+        source="bench",
+        frame=np.zeros((1080, 1920, 3), dtype=np.uint8),
+        timestamp=123.45,
+        frame_num=1,
+        roads_info={"1": list(range(10))},
+        file_id="bench_file_id",
+        detected_conf=rng.random(N_BOXES).tolist(),
+        detected_cls=["car"] * N_BOXES,
+        detected_xyxy=boxes,
+        tracked_conf=rng.random(N_BOXES).tolist(),
+        tracked_cls=["car"] * N_BOXES,
+        tracked_xyxy=boxes,
+        id_list=list(range(N_BOXES)),
+    )
+    frame_element.buffer_tracks.add(np.arange(2000), timestamp=0.0)
+    frame_element.info = {"cars_amount": N_BOXES, "roads_activity": {1: 2.0, 2: 4.0}}
+    return frame_element
+
+
+def bench(name, func, n_iters: int = N_ITERS) -> None:
+    t_start = time.perf_counter()
+    for _ in range(n_iters):
+        out = func()
+    dt_ms = (time.perf_counter() - t_start) / n_iters * 1000
+    size = len(out) if isinstance(out, (bytes, str)) else 0
+    print(f"{name:<32} {dt_ms:8.3f} ms/frame {size:>10} bytes")
+
+
+def to_jsonable(obj):
+    # То, что пришлось бы делать текущему пути, чтобы json.dumps(__dict__) вообще отработал
+    if isinstance(obj, TracksStore):
+        return obj.records.tolist()
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+def current_path(frame_element: FrameElement) -> str:
+    # Текущий путь: json.dumps(__dict__) + json.loads на каждом кадре
+    serialized = json.dumps(frame_element.__dict__, default=to_jsonable)
+    json.loads(serialized)
+    return serialized
+
+
+if __name__ == "__main__":
+    frame_element = make_frame_element()
+    try:
+        json.dumps(frame_element.__dict__)
+    except TypeError as e:
+        print(f"json.dumps(frame_element.__dict__) fails: {e}")
+    bench("json.dumps(__dict__) + json.loads", lambda: current_path(frame_element), n_iters=3)
+    bench("frame_element_to_json", lambda: frame_element_to_json(frame_element))
+    bench("frame_element_to_binary", lambda: frame_element_to_binary(frame_element))
+    payload = frame_element_to_binary(frame_element)
+    bench("frame_element_from_binary", lambda: frame_element_from_binary(payload) and payload)
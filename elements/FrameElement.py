@@ -2,6 +2,8 @@ import numpy as np
 import time
 import logging
 
+from elements.TracksStore import TracksStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,13 +25,16 @@ class FrameElement:
         tracked_cls: list = None,
         tracked_xyxy: list = None,
         id_list: list = None,
-        buffer_tracks: dict = None,
+        removed_ids: list = None,
+        buffer_tracks: TracksStore = None,
+        roads_version: int = 0,
     ) -> None:
         self.source = source
         self.frame = frame
         self.timestamp = timestamp
         self.frame_num = frame_num
         self.roads_info = roads_info
+        self.roads_version = roads_version  # Версия конфигурации дорог, с которой получен кадр
         self.file_id = file_id  # Уникальный идентификатор файла
         self.data = data if data is not None else {}  # Дополнительные данные
 
@@ -46,7 +51,8 @@ class FrameElement:
         self.tracked_cls = tracked_cls if tracked_cls is not None else []
         self.tracked_xyxy = tracked_xyxy if tracked_xyxy is not None else []
         self.id_list = id_list if id_list is not None else []
-        self.buffer_tracks = buffer_tracks if buffer_tracks is not None else {}
+        self.removed_ids = removed_ids if removed_ids is not None else []  # Треки, удаленные трекером на кадре
+        self.buffer_tracks = buffer_tracks if buffer_tracks is not None else TracksStore()
         self.send_info_of_frame_to_db = True  # Флаг для отправки данных в базу
         logger.debug(f"Created FrameElement with file_id={file_id}, timestamp={timestamp}")
 
@@ -56,6 +62,7 @@ class FrameElement:
             "timestamp": self.timestamp,
             "frame_num": self.frame_num,
             "roads_info": self.roads_info,
+            "roads_version": self.roads_version,
             "file_id": self.file_id,
             "data": self.data,
             "detected_conf": self.detected_conf,
@@ -65,5 +72,6 @@ class FrameElement:
             "tracked_cls": self.tracked_cls,
             "tracked_xyxy": self.tracked_xyxy,
             "id_list": self.id_list,
+            "removed_ids": self.removed_ids,
             "buffer_tracks": self.buffer_tracks,
         }
\ No newline at end of file
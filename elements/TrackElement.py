@@ -1,10 +1,14 @@
 class TrackElement:
     # Класс, содержаций информацию о конкретном треке машины
+    # (в буфере треки хранятся построчно в TracksStore, TrackElement — отдельная запись)
+    __slots__ = ("id", "timestamp_first", "timestamp_last", "start_road", "timestamp_init_road", "end_road")
+
     def __init__(
         self,
         id: int,
         timestamp_first: float,
         start_road: int | None = None,
+        end_road: int | None = None,
     ) -> None:
         self.id = id  # Номер этого трека
         self.timestamp_first = timestamp_first  # Таймстемп инициализации (в сек)
@@ -12,6 +16,7 @@ class TrackElement:
         self.start_road = start_road  # Номер дороги, с которой приехал
         self.timestamp_init_road = timestamp_first  # Таймстемп инициализации номера дороги (в сек)
         # ps: если дорога не будет определена, то значение останется равным первому появлению
+        self.end_road = end_road  # Номер дороги, по которой уехал (последняя посещенная, != start_road)
 
     def update(self, timestamp):
         # Обновление времени последнего обнаружения
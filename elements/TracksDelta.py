@@ -0,0 +1,16 @@
+import numpy as np
+
+from elements.TracksStore import TRACK_DTYPE
+
+
+class TracksDelta:
+    # Изменения буфера треков за один кадр (вместо передачи всего буфера между процессами)
+    def __init__(
+        self,
+        updated: np.ndarray | None = None,
+        removed: np.ndarray | None = None,
+    ) -> None:
+        # Строки TracksStore новых и обновленных на кадре треков
+        self.updated = updated if updated is not None else np.empty(0, dtype=TRACK_DTYPE)
+        # Удаленные из буфера айдишники
+        self.removed = removed if removed is not None else np.empty(0, dtype=np.int64)
@@ -0,0 +1,135 @@
+import numpy as np
+
+from elements.TrackElement import TrackElement
+
+NO_ROAD = -1  # Значение start_road/end_road, пока дорога не определена
+NO_CLASS = -1  # Значение cls, пока класс объекта не известен
+
+# Одна строка буфера на трек: ~38 байт вместо сотен байт у объекта с __dict__
+TRACK_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("timestamp_first", np.float64),
+        ("timestamp_last", np.float64),
+        ("timestamp_init_road", np.float64),
+        ("start_road", np.int16),
+        ("end_road", np.int16),
+        ("cls", np.int16),  # код класса в словаре классов узла трекинга
+    ]
+)
+
+
+class TracksStore:
+    # Компактный буфер треков: структурированный numpy массив, отсортированный по id трека
+    # (id трекера растут монотонно, поэтому новые треки почти всегда дописываются в конец)
+    def __init__(self, records: np.ndarray | None = None) -> None:
+        self.records = records if records is not None else np.empty(0, dtype=TRACK_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, id: int) -> bool:
+        return self.find_rows(np.array([id]))[0] >= 0
+
+    def __getitem__(self, id: int) -> TrackElement:
+        row = self.find_rows(np.array([id]))[0]
+        if row < 0:
+            raise KeyError(id)
+        return self._to_track_element(self.records[row])
+
+    def values(self):
+        # Построчный обход (для отладки и совместимости; в горячем пути используются маски)
+        for record in self.records:
+            yield self._to_track_element(record)
+
+    def find_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Номера строк для массива id (-1 для отсутствующих в буфере)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.records["id"], ids)
+        found = rows < len(self.records)
+        found[found] = self.records["id"][rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    def add(self, ids: np.ndarray, timestamp: float) -> None:
+        """Заводит новые треки с временем первого обнаружения timestamp."""
+        if len(ids) == 0:
+            return
+        records = np.zeros(len(ids), dtype=TRACK_DTYPE)
+        records["id"] = ids
+        records["timestamp_first"] = timestamp
+        records["timestamp_last"] = timestamp
+        records["timestamp_init_road"] = timestamp
+        records["start_road"] = NO_ROAD
+        records["end_road"] = NO_ROAD
+        records["cls"] = NO_CLASS
+        self.upsert(records)
+
+    def upsert(self, records: np.ndarray) -> None:
+        """Обновляет существующие строки и добавляет новые, сохраняя сортировку по id."""
+        if len(records) == 0:
+            return
+        rows = self.find_rows(records["id"])
+        exists = rows >= 0
+        self.records[rows[exists]] = records[exists]
+        new_records = np.sort(records[~exists], order="id")
+        if len(new_records) == 0:
+            return
+        if len(self.records) and new_records["id"][0] < self.records["id"][-1]:
+            self.records = np.sort(np.concatenate((self.records, new_records)), order="id")
+        else:
+            self.records = np.concatenate((self.records, new_records))
+
+    def remove(self, ids: np.ndarray) -> np.ndarray:
+        """Удаляет треки по id и возвращает их строки."""
+        rows = self.find_rows(ids)
+        rows = rows[rows >= 0]
+        removed = self.records[rows]
+        self.records = np.delete(self.records, rows)
+        return removed
+
+    def select(self, ids: np.ndarray) -> np.ndarray:
+        """Копия строк для массива id (отсутствующие пропускаются)."""
+        rows = self.find_rows(ids)
+        return self.records[rows[rows >= 0]]
+
+    def expired(self, timestamp: float, size_buffer: float) -> np.ndarray:
+        """id треков, прожитых в буфере не менее size_buffer секунд с первого обнаружения."""
+        return self.records["id"][timestamp - self.records["timestamp_first"] >= size_buffer]
+
+    def alive_longer_than(self, secs: float) -> np.ndarray:
+        """Маска треков, живущих после определения дороги дольше secs секунд."""
+        return self.records["timestamp_last"] - self.records["timestamp_init_road"] > secs
+
+    def has_road(self) -> np.ndarray:
+        """Маска треков с определенной дорогой въезда."""
+        return self.records["start_road"] != NO_ROAD
+
+    def count_by_start_road(self, mask: np.ndarray) -> dict[int, int]:
+        """Число треков по дорогам въезда среди строк mask."""
+        roads, counts = np.unique(self.records["start_road"][mask], return_counts=True)
+        return {int(road): int(count) for road, count in zip(roads, counts) if road != NO_ROAD}
+
+    def start_roads(self, ids: np.ndarray) -> list[int | None]:
+        """Дороги въезда для массива id (None — дорога неизвестна или трек уже удален)."""
+        rows = self.find_rows(ids)
+        if len(self.records) == 0:
+            return [None] * len(rows)
+        roads = np.where(rows >= 0, self.records["start_road"][np.clip(rows, 0, None)], NO_ROAD)
+        return [None if road == NO_ROAD else int(road) for road in roads]
+
+    def apply_delta(self, tracks_delta) -> None:
+        """Применяет покадровые изменения буфера (зеркало на стороне потребителя)."""
+        self.upsert(tracks_delta.updated)
+        self.remove(tracks_delta.removed)
+
+    @staticmethod
+    def _to_track_element(record: np.void) -> TrackElement:
+        track_element = TrackElement(
+            id=int(record["id"]),
+            timestamp_first=float(record["timestamp_first"]),
+            start_road=None if record["start_road"] == NO_ROAD else int(record["start_road"]),
+            end_road=None if record["end_road"] == NO_ROAD else int(record["end_road"]),
+        )
+        track_element.timestamp_last = float(record["timestamp_last"])
+        track_element.timestamp_init_road = float(record["timestamp_init_road"])
+        return track_element
@@ -1,22 +1,40 @@
 import os
 import uuid
-from fastapi import FastAPI, UploadFile, BackgroundTasks, File
-from fastapi.responses import JSONResponse, Response
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import start_http_server, Counter, generate_latest
-import hydra
-from hydra.core.config_store import ConfigStore
-from hydra.core.global_hydra import GlobalHydra
-from nodes.VideoReader import VideoReader
-from nodes.DetectionTrackingNodes import DetectionTrackingNodes
-from nodes.TrackerInfoUpdateNode import TrackerInfoUpdateNode
-from nodes.CalcStatisticsNode import CalcStatisticsNode
-from nodes.SendInfoDBNode import SendInfoDBNode
-from nodes.FlaskServerVideoNode import VideoServer
-from elements.VideoEndBreakElement import VideoEndBreakElement
+from starlette.concurrency import run_in_threadpool
+from prometheus_client import start_http_server, CollectorRegistry, Counter, Gauge, generate_latest
+from hydra import compose, initialize_config_dir
+from utils_local.roads_registry import get_roads_registry
+from utils_local.worker_pool import PRIORITY_CLASSES, PoolOverloaded, ProcessingWorkerPool, WorkerMetricsCollector
+from utils_local.job_registry import FINISHED_STATUSES, JobRegistry
+from utils_local.uploads import MalformedUpload, MultipartUpload, UploadTooLarge, stream_upload
+from utils_local.video_probe import ProbeError, check_limits, probe_video
+from utils_local.content_store import ContentStore, config_hash
+from utils_local.batch_inference import MicroBatcher
+from utils_local.db_pool import DBConnectionPool, connection_params, get_db_pool
+from utils_local.response_cache import ResponseCache
+from utils_local.db_schema import (
+    TRAFFIC_INFO_COLUMNS,
+    apply_migrations,
+    find_processed_video,
+    processed_videos_migrations,
+    record_processed_video,
+)
+from utils_local.quantile_sketch import merge_serialized, summarize
+from utils_local.export import ENCODERS, EXPORT_FORMATS, ExportBody, ExportSlots, RowChunks, available_formats
 from dataclasses import dataclass
-from some_module.AppConfig import AppConfig
-import psycopg2
+from some_module.AppConfig import AppConfig, load_app_config
+from datetime import datetime
 from contextlib import asynccontextmanager
 import time
 from elements.FrameElement import FrameElement
@@ -41,23 +59,115 @@ def validate_config(config):
         if not hasattr(config, param):
             raise ValueError(f"Missing required configuration parameter: {param}")
 
+CONFIG_DIR = "/app/configs"
+
+
+def load_config():
+    """Конфигурация приложения, собранная Hydra один раз при старте сервиса"""
+    with initialize_config_dir(version_base=None, config_dir=CONFIG_DIR):
+        cfg = compose(config_name="app_config")
+    validate_config(cfg)
+    return cfg
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Запуск метрик при старте
-    start_http_server(8000)
+    global WORKER_POOL, APP_CONFIG, DB_POOL, DB_EXECUTOR, EXPORT_POOL, EXPORT_SLOTS
+    cfg = load_config()
+    APP_CONFIG = load_app_config(cfg)
+    # Пул подключений API из конфигурации (тот же connection_info, что у узлов записи).
+    # Блокирующие запросы выполняются в DB_EXECUTOR, по подключению на поток, поэтому
+    # открытыми держатся все maxconn подключений
+    config_pool = APP_CONFIG.db_pool
+    DB_POOL = get_db_pool(
+        connection_params(APP_CONFIG.send_info_db_node.connection_info),
+        minconn=config_pool.maxconn,
+        maxconn=config_pool.maxconn,
+        checkout_timeout=config_pool.checkout_timeout,
+        health_check_secs=config_pool.health_check_secs,
+        connect_timeout=config_pool.connect_timeout,
+    )
+    DB_EXECUTOR = ThreadPoolExecutor(max_workers=config_pool.maxconn, thread_name_prefix="db")
+    # Выгрузки держат подключение на все время ответа, поэтому у них свой пул и ограничение числа,
+    # иначе несколько долгих выгрузок исчерпали бы пул запросов /stats и /status
+    EXPORT_SLOTS = ExportSlots(APP_CONFIG.export.max_concurrent)
+    EXPORT_POOL = DBConnectionPool(
+        connection_params(APP_CONFIG.send_info_db_node.connection_info),
+        minconn=0,
+        maxconn=APP_CONFIG.export.max_concurrent,
+        checkout_timeout=config_pool.checkout_timeout,
+        health_check_secs=config_pool.health_check_secs,
+        connect_timeout=config_pool.connect_timeout,
+        name="export",
+    )
+    try:
+        await run_db(ensure_schema)
+    except Exception as e:
+        logger.error(f"Failed to apply DB migrations: {e}")
+    # Пул долгоживущих процессов обработки: модель загружается один раз на процесс
+    WORKER_POOL = ProcessingWorkerPool(
+        APP_CONFIG,
+        num_workers=APP_CONFIG.worker_pool.num_workers,
+        on_finished=save_to_db,
+        on_commit=invalidate_file_cache,
+        registry=JOB_REGISTRY,
+        progress_secs=APP_CONFIG.worker_pool.progress_secs,
+        max_backlog_secs=APP_CONFIG.worker_pool.max_backlog_secs,
+    )
+    WORKER_POOL.start()
+    # Запуск метрик при старте: метрики API вместе с метриками писателей БД из процессов обработки
+    METRICS_REGISTRY.register(WorkerMetricsCollector(WORKER_POOL.metrics_dir))
+    start_http_server(8000, registry=METRICS_REGISTRY)
+    # Модель /detect загружается здесь, а не при импорте: процессы пула запускаются через spawn
+    # и при запуске main.py напрямую импортируют его как __mp_main__, лишняя копия модели им не нужна
+    global DETECT_MODEL
+    DETECT_MODEL = YOLO(DETECT_WEIGHTS)
+    DETECT_BATCHER.start()
     yield
+    await DETECT_BATCHER.stop()
+    WORKER_POOL.stop()
+    DB_EXECUTOR.shutdown(wait=False)
+    EXPORT_POOL.close()
 
 app = FastAPI(lifespan=lifespan)
 
 torch.serialization.add_safe_globals([DetectionModel])
 
-# Загрузка модели
-model = YOLO("/usr/src/app/yolov8m.pt")
+# Модель /detect (загружается в lifespan)
+DETECT_WEIGHTS = "/usr/src/app/yolov8m.pt"
+DETECT_MODEL: YOLO | None = None
+
+# Инференс /detect: одновременные запросы собираются в микробатчи и выполняются
+# в отдельном потоке, а не в event loop
+DETECT_MAX_BATCH_SIZE = 8
+DETECT_MAX_WAIT_MS = 10
+DETECT_IMGSZ = 640
+DETECT_CONFIDENCE = 0.25
+
+
+def detect_batch(images):
+    """Инференс батча изображений; для каждого — компактные массивы боксов, уверенностей и классов"""
+    results = DETECT_MODEL.predict(images, imgsz=DETECT_IMGSZ, conf=DETECT_CONFIDENCE, verbose=False)
+    return [
+        {
+            "boxes": result.boxes.xyxy.cpu().int().tolist(),
+            "conf": [round(conf, 3) for conf in result.boxes.conf.cpu().tolist()],
+            "cls": result.boxes.cls.cpu().int().tolist(),
+        }
+        for result in results
+    ]
+
+
+DETECT_BATCHER = MicroBatcher(detect_batch, max_batch_size=DETECT_MAX_BATCH_SIZE, max_wait_ms=DETECT_MAX_WAIT_MS)
+
 
 @app.post("/detect")
-async def detect(file: bytes):
-    results = model.predict(file)
-    return {"results": results}
+async def detect(file: UploadFile = File(...)):
+    image = cv2.imdecode(np.frombuffer(await file.read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return JSONResponse(content={"error": "Cannot decode image"}, status_code=400)
+    detections = await DETECT_BATCHER.predict(image)
+    return {**detections, "names": {cls: DETECT_MODEL.names[cls] for cls in set(detections["cls"])}}
 
 
 # Добавление CORS middleware
@@ -69,32 +179,54 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешить все заголовки
 )
 
-# Метрики Prometheus
-REQUEST_COUNT = Counter('processed_videos', 'Total processed videos')
-PROCESSING_TIME = Counter('processing_seconds', 'Total processing time')
+# Общий пул подключений к PostgreSQL (создается в lifespan из db_pool и connection_info конфигурации)
+DB_POOL: DBConnectionPool | None = None
 
-@app.post("/process")
-async def process_frame():
-    # Создаем объект FrameElement
-    frame_element = FrameElement(
-        source="test_source",
-        frame=None,
-        timestamp=123.45,
-        frame_num=1,
-        roads_info={},
-        file_id="test_file_id",
-        data={"key": "value"},
-    )
 
-    # Проверка сериализации
-    try:
-        serialized_data = json.dumps(frame_element.__dict__)
-        logger.debug(f"Serialized data: {serialized_data}")
-    except Exception as e:
-        logger.error(f"Serialization error: {e}")
+def get_db():
+    return DB_POOL
+
+
+# Блокирующие запросы psycopg2 выполняются в отдельном пуле потоков, а не в event loop uvicorn:
+# медленный запрос задерживает только свой запрос. Потоков не больше, чем подключений в пуле.
+DB_EXECUTOR: ThreadPoolExecutor | None = None
+
+# Пул подключений и места потоковых выгрузок /export (создаются в lifespan)
+EXPORT_POOL: DBConnectionPool | None = None
+EXPORT_SLOTS: ExportSlots | None = None
+
 
-    # Отправка данных
-    return {"status": "success", "data": serialized_data}
+async def run_db(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, functools.partial(func, *args))
+
+# Кэш ответов /stats и /status: данные меняются не чаще раза в how_often_add_info секунд,
+# поэтому опрос дашбордами обслуживается из памяти. Записи /status сбрасываются, когда процесс
+# обработки сообщает через пул о коммите новых строк по file_id, /stats — при записи processed_videos
+RESPONSE_CACHE = ResponseCache(ttl_secs=5, max_entries=1024)
+
+
+def invalidate_file_cache(file_id):
+    RESPONSE_CACHE.invalidate(f"file:{file_id}")
+
+
+def cached_response(entry, request: Request) -> Response:
+    """Ответ из кэша с ETag; 304 если клиент прислал совпадающий If-None-Match"""
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={int(RESPONSE_CACHE.ttl_secs)}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if entry.etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, status_code=entry.status_code, media_type="application/json", headers=headers)
+
+# Метрики Prometheus
+REQUEST_COUNT = Counter('processed_videos', 'Total processed videos')
+PROCESSING_TIME = Counter('processing_seconds', 'Total processing time')
+REJECTED_COUNT = Counter('rejected_videos', 'Videos rejected by admission control')
+QUEUED_VIDEO_SECONDS = Gauge('queued_video_seconds', 'Seconds of video queued or still being processed')
+QUEUED_VIDEO_SECONDS.set_function(lambda: WORKER_POOL.backlog_secs() if WORKER_POOL is not None else 0.0)
+# Реестр ответа /metrics и порта 8000 (наполняется в lifespan)
+METRICS_REGISTRY = CollectorRegistry()
 
 # Маршрут для получения результатов
 @app.get("/results")
@@ -102,181 +234,437 @@ async def get_results():
     # Логика получения результатов
     return {"status": "success", "data": []}
 
+WORKER_POOL: ProcessingWorkerPool | None = None
+# Состояние и прогресс задач обработки в памяти: опрос прогресса не ходит в PostgreSQL
+JOB_REGISTRY = JobRegistry()
+PROGRESS_POLL_SECS = 0.5  # Как часто SSE поток проверяет изменения задачи
+PROGRESS_HEARTBEAT_SECS = 15  # Комментарий keep-alive, если задача долго не меняется
+
+# Загрузки пишутся на диск порциями с проверкой лимита размера по ходу чтения
+UPLOAD_DIR = "/app/uploads"
+UPLOAD_MAX_BYTES = 4 * 1024**3
+UPLOAD_CHUNK_BYTES = 1024**2
+# Загрузки хранятся по sha256 содержимого: повторная загрузка того же видео не занимает места
+CONTENT_STORE = ContentStore(UPLOAD_DIR)
+APP_CONFIG: AppConfig | None = None
+
+# Задачи в очереди и в обработке по (хэш содержимого, хэш конфигурации): повторная загрузка
+# во время обработки получает id уже идущей задачи
+INFLIGHT_JOBS: dict = {}
+JOB_HASHES: dict = {}
+INFLIGHT_LOCK = threading.Lock()
+
+# Отклоненные проверкой видео по sha256 (reason, сообщение): объект хранилища после отказа удаляется,
+# а повторная загрузка того же содержимого отклоняется без повторной проверки
+PROBE_REJECTIONS: OrderedDict = OrderedDict()
+PROBE_REJECTIONS_MAX = 1024
+
+
+def remember_rejection(sha256, error):
+    PROBE_REJECTIONS[sha256] = (error.reason, str(error))
+    PROBE_REJECTIONS.move_to_end(sha256)
+    while len(PROBE_REJECTIONS) > PROBE_REJECTIONS_MAX:
+        PROBE_REJECTIONS.popitem(last=False)
+
+
+def discard_rejected_upload(upload):
+    """Удаляет отклоненный объект хранилища, если его не использует задача в очереди или обработке"""
+    with INFLIGHT_LOCK:
+        if any(sha256 == upload.sha256 for sha256, _ in INFLIGHT_JOBS):
+            return
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass  # уже удален параллельной загрузкой того же содержимого
+
+
+def query_processed_video(content_hash, config_hash):
+    with get_db().connection() as conn, conn.cursor() as cursor:
+        return find_processed_video(cursor, content_hash, config_hash)
+
+
+def probe_upload(path):
+    """Метаданные загрузки и проверка ограничений (кадры не декодируются)"""
+    info = probe_video(path)
+    limits = APP_CONFIG.video_probe
+    check_limits(info, limits.max_width, limits.max_height, limits.max_duration_secs)
+    return info
+
+
+def overloaded_response(retry_after):
+    """429 с оценкой, когда в очереди освободится место"""
+    REJECTED_COUNT.inc()
+    return JSONResponse(
+        content={"error": "Processing queue is full", "retry_after": round(retry_after)},
+        status_code=429,
+        headers={"Retry-After": str(max(1, int(retry_after + 0.5)))},
+    )
+
+
 @app.post("/process")
-async def process_video(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def process_video(request: Request, priority: str = "normal"):
+    """Видео в поле file тела multipart/form-data; тело читается потоково, а не через UploadFile"""
     REQUEST_COUNT.inc()
-    
-    # Сохранение файла
-    file_id = uuid.uuid4().hex
-    filename = f"{file_id}_{file.filename}"
-    save_path = f"/app/uploads/{filename}"
-    
-    with open(save_path, "wb") as buffer:
-        buffer.write(await file.read())
-
-    # Запуск обработки в фоне
-    background_tasks.add_task(run_processing, save_path, file_id)
-    
+    if priority not in PRIORITY_CLASSES:
+        return JSONResponse(
+            content={"error": f"Unknown priority {priority}, expected one of {list(PRIORITY_CLASSES)}"},
+            status_code=400,
+        )
+    # Очередь уже заполнена — отказываем до чтения тела запроса
+    retry_after = WORKER_POOL.retry_after()
+    if retry_after is not None:
+        return overloaded_response(retry_after)
+
+    # Потоковое сохранение файла порциями с хэшированием содержимого прямо из тела запроса
+    file = MultipartUpload(request)
+    try:
+        upload = await CONTENT_STORE.put(file, max_bytes=UPLOAD_MAX_BYTES, chunk_bytes=UPLOAD_CHUNK_BYTES)
+    except UploadTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except MalformedUpload as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    # Пустые, нечитаемые и слишком большие видео отклоняются до очереди и не занимают обработчик
+    rejection = PROBE_REJECTIONS.get(upload.sha256)
+    if rejection is None:
+        try:
+            video_info = await run_in_threadpool(probe_upload, upload.path)
+        except ProbeError as e:
+            remember_rejection(upload.sha256, e)
+            rejection = PROBE_REJECTIONS[upload.sha256]
+        except FileNotFoundError:
+            # Объект удалила параллельная загрузка того же содержимого, уже отклоненная проверкой
+            rejection = PROBE_REJECTIONS.get(upload.sha256)
+            if rejection is None:
+                raise
+    if rejection is not None:
+        discard_rejected_upload(upload)
+        reason, message = rejection
+        return JSONResponse(content={"error": message, "reason": reason}, status_code=422)
+    roads_info = current_roads().roads_info
+    job_key = (upload.sha256, config_hash(APP_CONFIG, roads_info))
+
+    # То же видео с той же конфигурацией уже обработано — сразу отдаем сохраненный результат
+    try:
+        processed = await run_db(query_processed_video, *job_key)
+    except Exception as e:
+        logger.error(f"Dedup lookup failed: {e}")
+        processed = None
+    if processed is not None:
+        return JSONResponse(
+            content={"status": "completed", "id": processed[0], "result": processed[1], "deduplicated": True},
+            status_code=200,
+        )
+
+    with INFLIGHT_LOCK:
+        file_id = INFLIGHT_JOBS.get(job_key)
+        if file_id is not None:
+            return JSONResponse(
+                content={"status": "processing", "id": file_id, "deduplicated": True},
+                status_code=202,
+            )
+        file_id = uuid.uuid4().hex
+        INFLIGHT_JOBS[job_key] = file_id
+        JOB_HASHES[file_id] = job_key
+
+    # Задача уходит в очередь пула обработчиков с уже загруженной моделью; внутри класса
+    # приоритета короткие видео обрабатываются раньше длинных
+    try:
+        WORKER_POOL.submit(
+            upload.path,
+            file_id,
+            filename=os.path.basename(file.filename or upload.sha256),
+            priority=priority,
+            expected_secs=video_info.duration_secs or 0.0,
+            video_info=video_info.to_dict(),
+        )
+    except PoolOverloaded as e:
+        with INFLIGHT_LOCK:
+            JOB_HASHES.pop(file_id, None)
+            INFLIGHT_JOBS.pop(job_key, None)
+        return overloaded_response(e.retry_after)
+
     return JSONResponse(
-        content={"status": "processing", "id": file_id},
+        content={"status": "processing", "id": file_id, "video": video_info.to_dict()},
         status_code=202
     )
 
-def run_processing(video_path, file_id):
-    try:
-        # Очистка состояния Hydra перед каждым вызовом
-        if GlobalHydra.instance().is_initialized():
-            GlobalHydra.instance().clear()
-
-        @hydra.main(version_base=None, config_path="/app/configs", config_name="app_config")
-        def wrapped_main(cfg):
-            validate_config(cfg)
-            cfg.video_reader.src = video_path
-            pipeline = init_pipeline(cfg)
-            
-            for frame_element in pipeline["video_reader"].process():
-                frame_element = pipeline["detection_node"].process(frame_element)
-                frame_element = pipeline["tracker_node"].process(frame_element)
-                frame_element = pipeline["stats_node"].process(frame_element)
-                
-                if pipeline["db_node"]:
-                    frame_element = pipeline["db_node"].process(frame_element)
-                    
-                if pipeline["video_server"]:
-                    if isinstance(frame_element, VideoEndBreakElement):
-                        break
-                    pipeline["video_server"].update_image(frame_element.frame_result)
-        
-        wrapped_main()
-        print(f"Processing completed for video: {file_id}")
-        save_to_db(file_id, os.path.basename(video_path), "completed", {"objects_detected": 10})
+@app.post("/cancel/{file_id}")
+async def cancel_job(file_id: str):
+    """Отмена задачи: из очереди снимается сразу, выполняемая останавливается на ближайшем кадре"""
+    if not WORKER_POOL.cancel(file_id):
+        return JSONResponse(content={"error": "Job not found or already finished"}, status_code=404)
+    return JSONResponse(content=JOB_REGISTRY.get(file_id), status_code=202)
 
-    except Exception as e:
-        print(f"Error processing video {file_id}: {e}")
-        save_to_db(file_id, os.path.basename(video_path), "failed")
 
-def init_pipeline(config):
-    """Инициализация всех узлов обработки"""
-    return {
-        "video_reader": VideoReader(config.video_reader),
-        "detection_node": DetectionTrackingNodes(config),
-        "tracker_node": TrackerInfoUpdateNode(config),
-        "stats_node": CalcStatisticsNode(config),
-        "db_node": SendInfoDBNode(config) if config.pipeline.send_info_db else None,
-        "video_server": VideoServer(config) if config.pipeline.show_in_web else None
-    }
+@app.get("/progress/{file_id}")
+async def get_progress(file_id: str):
+    """Статус, прогресс, fps и оценка завершения задачи (из реестра задач, без запросов к БД)"""
+    job = JOB_REGISTRY.get(file_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    return job
+
+
+@app.get("/progress/{file_id}/events")
+async def stream_progress(file_id: str):
+    """Server-sent events с прогрессом задачи; поток закрывается после завершения задачи"""
+    if JOB_REGISTRY.get(file_id) is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+
+    async def events():
+        version = None
+        last_sent = time.monotonic()
+        while True:
+            job = JOB_REGISTRY.get(file_id)
+            if job is None:
+                break
+            if job["version"] != version:
+                version = job["version"]
+                last_sent = time.monotonic()
+                yield f"data: {json.dumps(job)}\n\n"
+                if job["status"] in FINISHED_STATUSES:
+                    break
+            elif time.monotonic() - last_sent >= PROGRESS_HEARTBEAT_SECS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(PROGRESS_POLL_SECS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 
 def save_to_db(file_id, filename, status, result=None):
-    """Сохранение данных в PostgreSQL"""
+    """Сохранение данных в PostgreSQL (вызывается потоком пула обработчиков по завершении задачи)"""
+    with INFLIGHT_LOCK:
+        job_key = JOB_HASHES.get(file_id, (None, None))
+    job = JOB_REGISTRY.get(file_id)
     try:
-        conn = psycopg2.connect(
-            dbname="traffic_analyzer_db",
-            user="user",
-            password="pwd",
-            host="pg_data_wh",
-            port=5432
-        )
-        cursor = conn.cursor()
-        query = """
-        INSERT INTO processed_videos (file_id, filename, status, result)
-        VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(query, (file_id, filename, status, result))
-        conn.commit()
+        with get_db().connection() as conn, conn.cursor() as cursor:
+            record_processed_video(
+                cursor, file_id, filename, status, result, *job_key, video_info=job and job["video"]
+            )
+            conn.commit()
+        RESPONSE_CACHE.invalidate("stats")
         print(f"Saved to DB: file_id={file_id}, status={status}")
     except Exception as e:
         print(f"Error saving to DB: {e}")
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        # Задача снимается с учета только после записи результата, чтобы повторная
+        # загрузка в этот момент не запустила обработку заново
+        with INFLIGHT_LOCK:
+            JOB_HASHES.pop(file_id, None)
+            INFLIGHT_JOBS.pop(job_key, None)
+
+
+def ensure_schema():
+    """Применение миграций таблиц сервиса (processed_videos и ее сводки)"""
+    with get_db().connection() as conn:
+        apply_migrations(conn, "processed_videos", processed_videos_migrations())
 
 @app.get("/")
 def read_root():
     return {"message": "API is running"}
 
 @app.post("/upload/")
-async def upload_file(file: UploadFile = File(...)):
-    content = await file.read()
+async def upload_file(request: Request):
+    file = MultipartUpload(request)
+    try:
+        upload = await stream_upload(file, max_bytes=UPLOAD_MAX_BYTES, chunk_bytes=UPLOAD_CHUNK_BYTES)
+    except UploadTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except MalformedUpload as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     return {
         "filename": file.filename,
         "content_type": file.content_type,
-        "size": len(content)
+        "size": upload.size,
+        "sha256": upload.sha256,
     }
 
+def query_stats(start: datetime | None = None, end: datetime | None = None):
+    """Почасовая статистика по загруженным видео из сводной таблицы (выполняется в DB_EXECUTOR)"""
+    query = """
+    SELECT hour, total_videos, total_objects_detected
+    FROM processed_videos_hourly
+    WHERE (%(start)s IS NULL OR hour >= %(start)s) AND (%(end)s IS NULL OR hour < %(end)s)
+    ORDER BY hour;
+    """
+    with get_db().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query, {"start": start, "end": end})
+        return cursor.fetchall()
+
+
 @app.get("/stats")
-async def get_stats():
-    """Получение статистики по загруженным видео"""
+async def get_stats(request: Request, start: datetime | None = None, end: datetime | None = None):
+    """Получение статистики по загруженным видео (опционально за интервал [start, end))"""
+    cache_key = ("stats", start, end)
+    entry = RESPONSE_CACHE.get(cache_key)
+    if entry is not None:
+        return cached_response(entry, request)
     try:
-        conn = psycopg2.connect(
-            dbname="traffic_analyzer_db",
-            user="user",
-            password="pwd",
-            host="pg_data_wh"
-        )
-        cursor = conn.cursor()
-        query = """
-        SELECT 
-            date_trunc('hour', upload_time) AS hour,
-            COUNT(*) AS total_videos,
-            SUM((result->>'objects_detected')::INT) AS total_objects_detected
-        FROM 
-            processed_videos
-        GROUP BY 
-            hour
-        ORDER BY 
-            hour;
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        rows = await run_db(query_stats, start, end)
 
         # Преобразуем результаты в JSON
         stats = [
             {"hour": row[0].isoformat(), "total_videos": row[1], "total_objects_detected": row[2]}
             for row in rows
         ]
-        return JSONResponse(content=stats)
+        entry = RESPONSE_CACHE.put(cache_key, stats, tags=["stats"])
+        return cached_response(entry, request)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.get("/export")
+def export_traffic_info(start: datetime, end: datetime, file_id: str | None = None, format: str = "csv"):
+    """Потоковая выгрузка traffic_info за интервал [start, end) в CSV, NDJSON или Arrow IPC.
+
+    Строки читаются серверным курсором порциями и сразу отдаются клиенту (chunked),
+    поэтому память не зависит от длины интервала.
+    """
+    if format not in available_formats():
+        return JSONResponse(
+            content={"error": f"Unsupported format '{format}', available: {available_formats()}"},
+            status_code=400,
+        )
+    if start >= end:
+        return JSONResponse(content={"error": "start must be earlier than end"}, status_code=400)
+    slot = EXPORT_SLOTS.acquire()
+    if slot is None:
+        return JSONResponse(
+            content={"error": f"Too many concurrent exports (max {EXPORT_SLOTS.max_concurrent})"},
+            status_code=429,
+        )
+    table_name = APP_CONFIG.send_info_db_node.table_name
+    chunks = RowChunks(
+        EXPORT_POOL, table_name, TRAFFIC_INFO_COLUMNS, start, end, file_id, chunk_rows=APP_CONFIG.export.chunk_rows
+    )
+    filename = f"{table_name}_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{format}"
+    # Подключение и место освобождаются в конце потока, а при отключении клиента — фоновой задачей ответа
+    body = ExportBody(ENCODERS[format](TRAFFIC_INFO_COLUMNS, chunks), slot)
+    return StreamingResponse(
+        body.chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(body.close),
+    )
+
+
+def roads_registry():
+    """Реестр дорог API с тем же периодом наблюдения за файлом, что и у воркеров"""
+    config = APP_CONFIG.video_reader
+    return get_roads_registry(config.roads_info, watch_secs=config.roads_info_watch_secs)
+
+
+def current_roads():
+    """Актуальная версия дорог: файл сверяется по mtime при каждом обращении, поэтому config_hash
+    считается по тем же полигонам, что прочитает задача, даже между проверками наблюдателя"""
+    registry = roads_registry()
+    try:
+        return registry.refresh()
+    except Exception as e:
+        logger.error(f"Failed to refresh roads info from {registry.path}: {e}")
+        return registry.current
+
+
+@app.get("/roads_info")
+def get_roads_info():
+    """Текущая версия конфигурации дорог"""
+    roads = current_roads()
+    return {"version": roads.version, "roads_info": roads.roads_info}
+
+
+@app.put("/roads_info")
+def update_roads_info(roads_info: dict):
+    """Горячая замена полигонов дорог без перезапуска обработки (тот же файл, что читают задачи и config_hash)"""
+    try:
+        roads = roads_registry().update(roads_info)
+    except (TypeError, ValueError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return {"version": roads.version, "roads_info": roads.roads_info}
+
 @app.get("/metrics")
 async def metrics():
     """Эндпоинт для Prometheus"""
     return Response(
-        content=generate_latest(),
+        content=generate_latest(METRICS_REGISTRY),
         media_type="text/plain"
     )
 
+def query_status(file_id: str):
+    """Последняя запись traffic_info по file_id (блокирующий запрос, выполняется в DB_EXECUTOR)"""
+    # Последняя запись по индексу (file_id, timestamp)
+    query = f"""
+    SELECT file_id, timestamp, data FROM {APP_CONFIG.send_info_db_node.table_name}
+    WHERE file_id = %s ORDER BY timestamp DESC LIMIT 1
+    """
+    with get_db().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query, (file_id,))
+        return cursor.fetchone()
+
+
 @app.get("/status/{file_id}")
-def get_status(file_id: str):
+async def get_status(file_id: str, request: Request):
+    cache_key = ("status", file_id)
+    entry = RESPONSE_CACHE.get(cache_key)
+    if entry is not None:
+        return cached_response(entry, request)
     try:
-        conn = psycopg2.connect(
-            dbname="traffic_analyzer_db",
-            user="user",
-            password="pwd",
-            host="pg_data_wh"
-        )
-        cursor = conn.cursor()
-        query = "SELECT * FROM traffic_info WHERE file_id = %s"
-        cursor.execute(query, (file_id,))
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        row = await run_db(query_status, file_id)
 
+        # Ответ (в том числе 404) кэшируется до TTL или до новой записи по file_id
         if row is None:
-            return {"error": "File ID not found"}, 404
+            entry = RESPONSE_CACHE.put(
+                cache_key, {"error": "File ID not found"}, status_code=404, tags=[f"file:{file_id}"]
+            )
+            return cached_response(entry, request)
 
         # Возвращаем данные из базы данных
-        return {
-            "file_id": row[1],
-            "timestamp": row[2],
-            "data": row[3]
+        status = {
+            "file_id": row[0],
+            "timestamp": row[1],
+            "data": row[2]
         }
+        entry = RESPONSE_CACHE.put(cache_key, status, tags=[f"file:{file_id}"])
+        return cached_response(entry, request)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+def query_time_sketches(file_id: str, start: float | None):
+    """Сохраненные скетчи времени в кадре по file_id в порядке времени видео (выполняется в DB_EXECUTOR)"""
+    # Строка на момент t содержит только корзины, начавшиеся не позже t, поэтому более ранние строки не нужны
+    query = f"""
+    SELECT data->'time_sketches' FROM {APP_CONFIG.send_info_db_node.table_name}
+    WHERE file_id = %(file_id)s AND data ? 'time_sketches' AND (%(start)s IS NULL OR timestamp >= %(start)s)
+    ORDER BY timestamp
+    """
+    with get_db().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query, {"file_id": file_id, "start": start})
+        return [row[0] for row in cursor.fetchall()]
+
+
+@app.get("/time_in_scene/{file_id}")
+async def get_time_in_scene(file_id: str, request: Request, start: float | None = None, end: float | None = None):
+    """Медиана и p90 времени в кадре по дорогам въезда за интервал видео [start, end) (в сек)
+
+    Сохраненные по корзинам скетчи объединяются без потерь точности, поэтому интервал может
+    быть любым, а не только окном последних корзин из time_in_scene.
+    """
+    cache_key = ("time_in_scene", file_id, start, end)
+    entry = RESPONSE_CACHE.get(cache_key)
+    if entry is not None:
+        return cached_response(entry, request)
+    try:
+        snapshots = await run_db(query_time_sketches, file_id, start)
+        if not snapshots:
+            entry = RESPONSE_CACHE.put(
+                cache_key, {"error": "File ID not found"}, status_code=404, tags=[f"file:{file_id}"]
+            )
+            return cached_response(entry, request)
+        merged = merge_serialized(snapshots, start, end)
+        result = {"file_id": file_id, "start": start, "end": end, "time_in_scene": summarize(merged)}
+        entry = RESPONSE_CACHE.put(cache_key, result, tags=[f"file:{file_id}"])
+        return cached_response(entry, request)
     except Exception as e:
-        return {"error": str(e)}, 500
+        return JSONResponse(content={"error": str(e)}, status_code=500)
 
 if __name__ == "__main__":
     import uvicorn
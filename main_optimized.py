@@ -11,18 +11,21 @@ from nodes.DetectionTrackingNodes import DetectionTrackingNodes
 from nodes.TrackerInfoUpdateNode import TrackerInfoUpdateNode
 from nodes.CalcStatisticsNode import CalcStatisticsNode
 from nodes.SendInfoDBNode import SendInfoDBNode
+from nodes.SendTracksDBNode import SendTracksDBNode
 from nodes.FlaskServerVideoNode import VideoServer
 
 from elements.VideoEndBreakElement import VideoEndBreakElement
+from elements.TracksStore import TracksStore
+from some_module.AppConfig import AppConfig, load_app_config
 
 PRINT_PROFILE_INFO = False
 
 
-def proc_frame_reader_and_detection(queue_out: Queue, config: dict, time_sleep_start: int):
+def proc_frame_reader_and_detection(queue_out: Queue, config: AppConfig, time_sleep_start: int):
     sleep_message = f"Система разогревается.. sleep({time_sleep_start})"
     for _ in tqdm(range(time_sleep_start), desc=sleep_message):
         sleep(1)
-    video_reader = VideoReader(config["video_reader"])
+    video_reader = VideoReader(config.video_reader)
     detection_node = DetectionTrackingNodes(config)
     for frame_element in video_reader.process():
         ts0 = time()
@@ -39,12 +42,15 @@ def proc_frame_reader_and_detection(queue_out: Queue, config: dict, time_sleep_s
             break
 
 
-def proc_tracker_update_and_calc(queue_in: Queue, queue_out: Queue, config: dict):
+def proc_tracker_update_and_calc(queue_in: Queue, queue_out: Queue, config: AppConfig):
     tracker_info_update_node = TrackerInfoUpdateNode(config)
     calc_statistics_node = CalcStatisticsNode(config)
-    send_info_db = config["pipeline"]["send_info_db"]
+    send_info_db = config.pipeline.send_info_db
     if send_info_db:
         send_info_db_node = SendInfoDBNode(config)
+    send_tracks_db = config.pipeline.send_tracks_db
+    if send_tracks_db:
+        send_tracks_db_node = SendTracksDBNode(config)
     while True:
         ts0 = time()
         frame_element = queue_in.get()
@@ -53,6 +59,10 @@ def proc_tracker_update_and_calc(queue_in: Queue, queue_out: Queue, config: dict
         frame_element = calc_statistics_node.process(frame_element)
         if send_info_db:
             frame_element = send_info_db_node.process(frame_element)
+        if send_tracks_db:
+            frame_element = send_tracks_db_node.process(frame_element)
+        # Весь буфер треков не сериализуем в очередь: ShowNode восстанавливает его из tracks_delta
+        frame_element.buffer_tracks = TracksStore()
         ts2 = time()
         queue_out.put(frame_element)
         if PRINT_PROFILE_INFO:
@@ -66,12 +76,12 @@ def proc_tracker_update_and_calc(queue_in: Queue, queue_out: Queue, config: dict
             break
 
 
-def proc_show_node(queue_in: Queue, config: dict):
+def proc_show_node(queue_in: Queue, config: AppConfig):
     show_node = ShowNode(config)
-    save_video = config["pipeline"]["save_video"]
-    show_in_web = config["pipeline"]["show_in_web"]
+    save_video = config.pipeline.save_video
+    show_in_web = config.pipeline.show_in_web
     if save_video:
-        video_saver_node = VideoSaverNode(config["video_saver_node"])
+        video_saver_node = VideoSaverNode(config.video_saver_node)
     if show_in_web:
         video_server_node = VideoServer(config)
     while True:
@@ -98,8 +108,10 @@ def proc_show_node(queue_in: Queue, config: dict):
 
 
 @hydra.main(version_base=None, config_path="configs", config_name="app_config")
-def main(config) -> None:
+def main(cfg) -> None:
     time_sleep_start = 5
+    # Конфигурация компилируется один раз и передается процессам как неизменяемый AppConfig
+    config = load_app_config(cfg)
 
     queue_frame_reader_and_detect_out = Queue(maxsize=50)
     queue_track_update_out = Queue(maxsize=50)
@@ -4,21 +4,18 @@ import numpy as np
 from elements.FrameElement import FrameElement
 from elements.VideoEndBreakElement import VideoEndBreakElement
 from utils_local.utils import profile_time
+from some_module.AppConfig import AppConfig
 
 
 class CalcStatisticsNode:
     """Модуль для расчета загруженности дорог (вычисление статистик)"""
 
-    def __init__(self, config: dict) -> None:
-        config_general = config["general"]
+    def __init__(self, config: AppConfig) -> None:
+        config_general = config.general
 
-        self.time_buffer_analytics = config_general[
-            "buffer_analytics"
-        ]  # размер времени буфера в минутах
-        self.min_time_life_track = config_general[
-            "min_time_life_track"
-        ]  # минимальное время жизни трека в сек
-        self.count_cars_buffer_frames = config_general["count_cars_buffer_frames"]
+        self.time_buffer_analytics = config_general.buffer_analytics  # размер времени буфера в минутах
+        self.min_time_life_track = config_general.min_time_life_track  # минимальное время жизни трека в сек
+        self.count_cars_buffer_frames = config_general.count_cars_buffer_frames
         self.cars_buffer = deque(maxlen=self.count_cars_buffer_frames)  # создали буфер значений
 
     @profile_time 
@@ -43,20 +40,19 @@ class CalcStatisticsNode:
         }  # всего 5 дорог (занулим стартовое значение)
 
         # Посчитаем чило машин которые довно живут и имеют значения дороги приезда
-        for _, track_element in buffer_tracks.items():
-            if (
-                track_element.timestamp_last - track_element.timestamp_init_road
-                > self.min_time_life_track
-                and track_element.start_road is not None
-            ):
-                key = track_element.start_road
-                roads_activity[key] += 1
+        mask = buffer_tracks.alive_longer_than(self.min_time_life_track) & buffer_tracks.has_road()
+        for key, count in buffer_tracks.count_by_start_road(mask).items():
+            roads_activity[key] = roads_activity.get(key, 0) + count
 
         # Переведем значения в размерность машин/мин согласно известному размеру буфера
         for key in roads_activity:
             roads_activity[key] /= self.time_buffer_analytics
 
         info_dictionary['roads_activity'] = roads_activity
+        info_dictionary['od_matrix'] = getattr(frame_element, "od_matrix", {})
+        # Медиана и p90 времени в кадре (dwell) и проезда от дороги въезда (travel), в сек
+        info_dictionary['time_in_scene'] = getattr(frame_element, "time_in_scene", {})
+        info_dictionary['time_sketches'] = getattr(frame_element, "time_sketches", {})
 
         # Запись результатов обработки:
         frame_element.info = info_dictionary
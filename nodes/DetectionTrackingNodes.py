@@ -6,31 +6,39 @@ from utils_local.utils import profile_time
 from elements.FrameElement import FrameElement
 from elements.VideoEndBreakElement import VideoEndBreakElement
 from byte_tracker.byte_tracker_model import BYTETracker as ByteTracker
+from byte_tracker.utils.basetrack import BaseTrack
+from some_module.AppConfig import AppConfig
 
 
 class DetectionTrackingNodes:
     """Модуль инференса модели детекции + трекинг алгоритма"""
 
-    def __init__(self, config) -> None:
+    def __init__(self, config: AppConfig) -> None:
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f'Детекция будет производиться на {device}')
 
-        config_yolo = config["detection_node"]
-        self.model = YOLO(config_yolo["weight_pth"], task='detect')
+        config_yolo = config.detection_node
+        self.model = YOLO(config_yolo.weight_pth, task='detect')
         self.classes = self.model.names
-        self.conf = config_yolo["confidence"]
-        self.iou = config_yolo["iou"]
-        self.imgsz = config_yolo["imgsz"]
-        self.classes_to_detect = config_yolo["classes_to_detect"]
+        self.conf = config_yolo.confidence
+        self.iou = config_yolo.iou
+        self.imgsz = config_yolo.imgsz
+        self.classes_to_detect = config_yolo.classes_to_detect
 
-        config_bytetrack= config["tracking_node"]
+        self.config_bytetrack = config.tracking_node
+        self.reset()
+
+    def reset(self) -> None:
+        """Новый трекер для следующего видео (модель детекции остается загруженной)."""
+        config_bytetrack = self.config_bytetrack
 
         # ByteTrack param
-        first_track_thresh = config_bytetrack["first_track_thresh"]
-        second_track_thresh = config_bytetrack["second_track_thresh"]
-        match_thresh = config_bytetrack["match_thresh"]
-        track_buffer = config_bytetrack["track_buffer"]
+        first_track_thresh = config_bytetrack.first_track_thresh
+        second_track_thresh = config_bytetrack.second_track_thresh
+        match_thresh = config_bytetrack.match_thresh
+        track_buffer = config_bytetrack.track_buffer
         fps = 30  # ставим равным 30 чтобы track_buffer мерился в кадрах
+        BaseTrack._count = 0  # id треков каждого видео начинаются с 1, как в новом процессе
         self.tracker = ByteTracker(
             fps, first_track_thresh, second_track_thresh, match_thresh, track_buffer, 1
         )
@@ -75,6 +83,9 @@ class DetectionTrackingNodes:
         # Получение conf scores
         frame_element.tracked_conf = [t.score for t in track_list]
 
+        # id треков, которые трекер окончательно удалил на этом кадре (трек завершен)
+        frame_element.removed_ids = [int(t.track_id) for t in self.tracker.frame_removed_stracks]
+
         return frame_element
 
     def _get_results_dor_tracker(self, results) -> np.ndarray:
@@ -88,17 +99,15 @@ class DetectionTrackingNodes:
                 bbox = result.boxes.xyxy.cpu().numpy()
                 confidence = result.boxes.conf.cpu().numpy()
 
-                class_id_value = (
-                    2  # Будем все трекуемые объекты считать классом car чтобы не было ошибок
-                )
-
                 merged_detection = [
                     bbox[0][0],
                     bbox[0][1],
                     bbox[0][2],
                     bbox[0][3],
                     confidence[0],
-                    class_id_value,
+                    # Сопоставление в трекере идет только по IoU, класс трека обновляется
+                    # по последней детекции и попадает в tracked_cls и колонку class фактов треков
+                    class_id[0],
                 ]
 
                 detections_list.append(merged_detection)
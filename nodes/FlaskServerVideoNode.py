@@ -4,6 +4,7 @@ import numpy as np
 import cv2
 import signal
 import os
+from some_module.AppConfig import AppConfig
 
 
 class EndpointAction(object):
@@ -19,15 +20,15 @@ class EndpointAction(object):
 
 class VideoServer(object):
     app = None
-    def __init__(self, config):
-        config_server = config["video_server_node"]
-        self.app = Flask(__name__, template_folder=config_server["template_folder"])
+    def __init__(self, config: AppConfig):
+        config_server = config.video_server_node
+        self.app = Flask(__name__, template_folder=config_server.template_folder)
         self.app.add_url_rule('/', 'index', EndpointAction(self._index))
         self.app.add_url_rule('/video', 'video', self._update_page)
 
-        self.host_ip = config_server["host_ip"]
-        self.port = config_server["port"]
-        self.index_page = config_server["index_page"]
+        self.host_ip = config_server.host_ip
+        self.port = config_server.port
+        self.index_page = config_server.index_page
         
         self._frame = np.zeros(shape=(640, 480), dtype=np.uint8)
         self.run()
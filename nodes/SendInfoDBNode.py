@@ -1,21 +1,37 @@
 import time
 import logging
-import psycopg2
 import json
+from datetime import datetime, timezone
 
 from elements.FrameElement import FrameElement
 from elements.VideoEndBreakElement import VideoEndBreakElement
 from utils_local.utils import profile_time
+from utils_local.db_writer import writer_from_config
+from utils_local.db_schema import (
+    N_ROAD_COLUMNS,
+    ROLLUP_GRANULARITIES,
+    TRAFFIC_INFO_COLUMNS,
+    PartitionManager,
+    apply_migrations,
+    reset_component,
+    traffic_info_migrations,
+    traffic_info_rollup_migrations,
+    traffic_info_rollup_upsert,
+)
+from utils_local.serialization import frame_element_to_json
+from some_module.AppConfig import AppConfig
 
 logger = logging.getLogger(__name__)
 
+# Покорзинные снимки из TrackerInfoUpdateNode: пишутся в data не в каждую строку, а раз в корзину
+SNAPSHOT_KEYS = ("od_matrix", "time_in_scene", "time_sketches")
 
 class SendInfoDBNode:
-    def __init__(self, config: dict) -> None:
-        config_db = config["send_info_db_node"]
-        self.drop_table = config_db["drop_table"]
-        self.how_often_add_info = config_db["how_often_add_info"]
-        self.table_name = config_db["table_name"]
+    def __init__(self, config: AppConfig) -> None:
+        config_db = config.send_info_db_node
+        self.drop_table = config_db.drop_table
+        self.how_often_add_info = config_db.how_often_add_info
+        self.table_name = config_db.table_name
         self.last_db_update = time.time()
 
         # Логирование имени таблицы
@@ -23,79 +39,68 @@ class SendInfoDBNode:
 
         self.last_db_update = time.time()
 
-        # Параметры подключения к базе данных
-        db_connection = config_db["connection_info"]
-        conn_params = {
-            "user": db_connection["user"],
-            "password": db_connection["password"],
-            "host": db_connection["host"],
-            "port": "5432",
-            "database": db_connection["database"],
-        }
+        # Матрица корреспонденций и распределения времени в кадре меняются покорзинно, поэтому
+        # пишутся раз в snapshot_secs секунд видео и последней строкой видео
+        self.snapshot_secs = min(config.general.od_bucket_secs, config.general.time_stats_bucket_secs)
+        self.last_snapshot_timestamp = None
 
         # Время буферизации данных
         self.buffer_analytics_sec = (
-            config["general"]["buffer_analytics"] * 60
-            + config["general"]["min_time_life_track"]
+            config.general.buffer_analytics * 60
+            + config.general.min_time_life_track
         )
 
-        # Подключение к базе данных
-        try:
-            self.connection = psycopg2.connect(**conn_params)
-            logger.info("Successfully connected to PostgreSQL")
-        except (Exception, psycopg2.Error) as error:
-            logger.error(f"Error while connecting to PostgreSQL: {error}")
-            raise  # Прерываем выполнение, если не удалось подключиться
+        # Версионированная схема: партиционированная по дням таблица с типизированными колонками
+        self.partitions = PartitionManager(
+            self.table_name,
+            retention_days=config_db.retention_days,
+            partitions_ahead=config_db.partitions_ahead,
+        )
 
-        # Создание курсора для выполнения SQL-запросов
-        self.cursor = self.connection.cursor()
+        # Фоновая пакетная запись: поток обработки кадров не ждет БД,
+        # миграции выполняются потоком записи при первом успешном подключении
+        self.writer = writer_from_config(
+            config_db,
+            config.db_pool,
+            TRAFFIC_INFO_COLUMNS,
+            on_flush=traffic_info_rollup_upsert(self.table_name),
+            maintenance=self.partitions.maintain,
+            maintenance_secs=config_db.maintenance_secs,
+            prepare=self._prepare_schema,
+        )
 
+    def _prepare_schema(self, connection) -> None:
         # Удаление таблицы, если требуется
+        rollups_component = f"{self.table_name}_rollups"
         if self.drop_table:
-            drop_table_query = f"DROP TABLE IF EXISTS {self.table_name};"
-            try:
-                self.cursor.execute(drop_table_query)
-                self.connection.commit()
-                logger.info(f"The table {self.table_name} has been deleted")
-            except (Exception, psycopg2.Error) as error:
-                logger.error(f"Error while dropping table: {error}")
-
-        # Создание таблицы
-        create_table_query = f"""
-        CREATE TABLE IF NOT EXISTS {self.table_name} (
-            id SERIAL PRIMARY KEY,
-            file_id VARCHAR(255),
-            timestamp FLOAT,
-            data JSONB  -- Используем тип JSONB для хранения словарей
-        );
-        """
-        try:
-            self.cursor.execute(create_table_query)
-            self.connection.commit()
-            logger.info(f"Table {self.table_name} created successfully")
-        except (Exception, psycopg2.Error) as error:
-            logger.error(f"Error while creating table: {error}")
-            raise  # Прерываем выполнение, если не удалось создать таблицу
+            reset_component(connection, self.table_name, [self.table_name])
+            reset_component(
+                connection,
+                rollups_component,
+                [f"{self.table_name}_{suffix}" for suffix in ROLLUP_GRANULARITIES],
+            )
+            logger.info(f"The table {self.table_name} has been deleted")
+        version = apply_migrations(connection, self.table_name, traffic_info_migrations(self.table_name))
+        # Поминутная и почасовая сводки для дашборда, обновляются писателем при каждой записи
+        apply_migrations(connection, rollups_component, traffic_info_rollup_migrations(self.table_name))
+        self.partitions.maintain(connection)
+        logger.info(f"Table {self.table_name} is at schema version {version}")
 
     @profile_time
     def process(self, frame_element) -> FrameElement:
         # Обработка VideoEndBreakElement
         if isinstance(frame_element, VideoEndBreakElement):
-            logger.info("Received VideoEndBreakElement. Skipping database save.")
+            logger.info("Received VideoEndBreakElement. Flushing pending rows.")
+            snapshots = {key: getattr(frame_element, key) for key in SNAPSHOT_KEYS if hasattr(frame_element, key)}
+            if snapshots:
+                data = {"file_id": frame_element.file_id, **snapshots}
+                self.save_to_db(frame_element.file_id, frame_element.timestamp, data)
+            self.writer.close()
             return frame_element
 
-        try:
-            serialized_data = json.dumps(frame_element.__dict__)
-            logger.debug(f"Serialized data: {serialized_data}")
-        except Exception as e:
-            logger.error(f"Serialization error: {e}")
-
-        # Десериализация
-        try:
-            deserialized_data = json.loads(serialized_data)
-            logger.debug(f"Deserialized data: {deserialized_data}")
-        except Exception as e:
-            logger.error(f"Deserialization error: {e}")
+        # Компактная сериализация кадра только если включен отладочный лог
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Frame element: {frame_element_to_json(frame_element).decode()}")
 
         # Проверка типа входного элемента
         assert isinstance(
@@ -107,8 +112,8 @@ class SendInfoDBNode:
             logger.error("Missing required attributes in FrameElement")
             raise ValueError("FrameElement is missing required attributes")
 
-        # Получение значений для записи в базу данных
-        info_dictionary = getattr(frame_element, "data", {})
+        # Получение значений для записи в базу данных (вместе со статистикой кадра из CalcStatisticsNode)
+        info_dictionary = {**getattr(frame_element, "data", {}), **getattr(frame_element, "info", {})}
         timestamp = getattr(frame_element, "timestamp", None)
 
         # Проверка наличия обязательных ключей в info_dictionary
@@ -120,53 +125,39 @@ class SendInfoDBNode:
         # Проверка, нужно ли отправлять информацию в базу данных
         current_time = time.time()
         if current_time - self.last_db_update >= self.how_often_add_info:
-            self._insert_in_db(info_dictionary, timestamp)
+            self._insert_in_db(info_dictionary, timestamp, frame_element)
             frame_element.send_info_of_frame_to_db = True
             self.last_db_update = current_time  # Обновление времени последнего обновления
 
         return frame_element
 
-    def _insert_in_db(self, info_dictionary: dict, timestamp: float) -> None:
-        insert_query = f"""
-        INSERT INTO {self.table_name} (file_id, timestamp, data)
-        VALUES (%s, %s, %s);
-        """
-        try:
-            file_id = info_dictionary.get("file_id")
-            if not file_id:
-                raise ValueError("Missing 'file_id' in info_dictionary")
-            data_json = json.dumps(info_dictionary)  # Преобразование словаря в JSON
-            logger.debug(f"Inserting data into DB: file_id={file_id}, timestamp={timestamp}, data={info_dictionary}")
-            logger.debug(f"Data to be saved in DB: {data_json}")
-            self.cursor.execute(insert_query, (file_id, timestamp, data_json))
-            self.connection.commit()
-            logger.info("Successfully inserted data into PostgreSQL")
-            self.cursor.execute(
-                insert_query,
-                (
-                    info_dictionary.get("file_id"),
-                    info_dictionary.get("timestamp"),
-                    data_json,  # Преобразованный словарь
-                ),
+    def _insert_in_db(self, info_dictionary: dict, timestamp: float, frame_element: FrameElement) -> None:
+        # Строка ставится в очередь фонового писателя, запись в БД идет пакетами
+        file_id = info_dictionary.get("file_id")
+        if not file_id:
+            raise ValueError("Missing 'file_id' in info_dictionary")
+        if self.last_snapshot_timestamp is not None and timestamp - self.last_snapshot_timestamp < self.snapshot_secs:
+            info_dictionary = {key: value for key, value in info_dictionary.items() if key not in SNAPSHOT_KEYS}
+        else:
+            self.last_snapshot_timestamp = timestamp
+        data_json = json.dumps(info_dictionary)  # Преобразование словаря в JSON
+        logger.debug(f"Queueing data for DB: file_id={file_id}, timestamp={timestamp}")
+        roads_activity = info_dictionary.get("roads_activity", {})
+        self.writer.write(
+            (
+                datetime.fromtimestamp(frame_element.timestamp_date, tz=timezone.utc),
+                file_id,
+                timestamp,
+                frame_element.frame_num,
+                info_dictionary.get("cars_amount"),
+                *(roads_activity.get(i) for i in range(1, N_ROAD_COLUMNS + 1)),
+                data_json,
             )
-            self.connection.commit()
-            logger.info("Successfully inserted data into PostgreSQL")
-        except (Exception, psycopg2.Error) as error:
-            logger.error(f"Error while inserting data into PostgreSQL: {error}")
-            self.connection.rollback()  # Откат транзакции
-            raise
+        )
 
     def save_to_db(self, file_id, timestamp, data_dict):
-        insert_query = f"""
-        INSERT INTO {self.table_name} (file_id, timestamp, data)
-        VALUES (%s, %s, %s);
-        """
-        try:
-            data_json = json.dumps(data_dict)  # Преобразование словаря в JSON
-            self.cursor.execute(insert_query, (file_id, timestamp, data_json))
-            self.connection.commit()
-            logger.info("Successfully inserted data into PostgreSQL")
-        except (Exception, psycopg2.Error) as error:
-            logger.error(f"Error while inserting data into PostgreSQL: {error}")
-            self.connection.rollback()
-            raise
+        self.writer.write(
+            (datetime.now(timezone.utc), file_id, timestamp, None, None)
+            + (None,) * N_ROAD_COLUMNS
+            + (json.dumps(data_dict),)
+        )
@@ -0,0 +1,72 @@
+import logging
+
+import numpy as np
+
+from elements.FrameElement import FrameElement
+from elements.TracksStore import NO_CLASS, NO_ROAD
+from elements.VideoEndBreakElement import VideoEndBreakElement
+from utils_local.utils import profile_time
+from utils_local.db_writer import writer_from_config
+from utils_local.db_schema import (
+    TRACK_FACTS_COLUMNS,
+    apply_migrations,
+    reset_component,
+    track_facts_migrations,
+)
+from some_module.AppConfig import AppConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SendTracksDBNode:
+    """Модуль записи фактов треков: одна строка на трек при его завершении"""
+
+    def __init__(self, config: AppConfig) -> None:
+        config_db = config.send_tracks_db_node
+        self.drop_table = config_db.drop_table
+        self.table_name = config_db.table_name
+
+        # Треки завершаются пачками, поэтому строки пишутся большими пакетами в фоне
+        # (пул подключений общий с SendInfoDBNode при тех же параметрах подключения)
+        self.writer = writer_from_config(
+            config_db,
+            config.db_pool,
+            TRACK_FACTS_COLUMNS,
+            prepare=self._prepare_schema,
+        )
+
+    def _prepare_schema(self, connection) -> None:
+        if self.drop_table:
+            reset_component(connection, self.table_name, [self.table_name])
+            logger.info(f"The table {self.table_name} has been deleted")
+        version = apply_migrations(connection, self.table_name, track_facts_migrations(self.table_name))
+        logger.info(f"Table {self.table_name} is at schema version {version}")
+
+    @profile_time
+    def process(self, frame_element: FrameElement) -> FrameElement:
+        # TrackerInfoUpdateNode кладет в finished_tracks строки треков, удаленных на этом кадре
+        # (на VideoEndBreakElement — все оставшиеся треки)
+        finished_tracks = getattr(frame_element, "finished_tracks", None)
+        if finished_tracks is not None and len(finished_tracks):
+            self._write_tracks(frame_element.file_id, finished_tracks, frame_element.track_classes)
+
+        if isinstance(frame_element, VideoEndBreakElement):
+            logger.info("Received VideoEndBreakElement. Flushing pending track facts.")
+            self.writer.close()
+        return frame_element
+
+    def _write_tracks(self, file_id: str, finished_tracks: np.ndarray, track_classes: list) -> None:
+        for record in finished_tracks:
+            cls = int(record["cls"])
+            self.writer.write(
+                (
+                    file_id,
+                    int(record["id"]),
+                    None if cls == NO_CLASS else track_classes[cls],
+                    None if record["start_road"] == NO_ROAD else int(record["start_road"]),
+                    None if record["end_road"] == NO_ROAD else int(record["end_road"]),
+                    float(record["timestamp_first"]),
+                    None if record["start_road"] == NO_ROAD else float(record["timestamp_init_road"]),
+                    float(record["timestamp_last"]),
+                )
+            )
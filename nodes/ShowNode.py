@@ -4,32 +4,39 @@ import numpy as np
 from utils_local.utils import profile_time, FPS_Counter
 from elements.VideoEndBreakElement import VideoEndBreakElement
 from elements.FrameElement import FrameElement
+from utils_local.roads_registry import RoadsGeometry
+from elements.TracksStore import TracksStore
 import logging
+from some_module.AppConfig import AppConfig
 
 # Инициализация логгера
 logger = logging.getLogger(__name__)
 
 class ShowNode:
-    def __init__(self, config) -> None:
-        data_colors = config["general"]["colors_of_roads"]
+    def __init__(self, config: AppConfig) -> None:
+        data_colors = config.general.colors_of_roads
         self.colors_roads = {key: tuple(value) for key, value in data_colors.items()}
         self.buffer_analytics_sec = (
-            config["general"]["buffer_analytics"] * 60 + config["general"]["min_time_life_track"]
+            config.general.buffer_analytics * 60 + config.general.min_time_life_track
         )  # столько по времени буфер набирается и информацию о статистеке выводить рано
 
-        config_show_node = config["show_node"]
-        self.scale = config_show_node["scale"]
-        self.fps_counter_N_frames_stat = config_show_node["fps_counter_N_frames_stat"]
+        config_show_node = config.show_node
+        self.scale = config_show_node.scale
+        self.fps_counter_N_frames_stat = config_show_node.fps_counter_N_frames_stat
         self.default_fps_counter = FPS_Counter(self.fps_counter_N_frames_stat)
-        self.draw_fps_info = config_show_node["draw_fps_info"]
-        self.show_roi = config_show_node["show_roi"]
-        self.overlay_transparent_mask = config_show_node["overlay_transparent_mask"]
-        self.imshow = config_show_node["imshow"]
-        self.show_only_yolo_detections = config_show_node["show_only_yolo_detections"]
-        self.show_track_id_different_colors = config_show_node["show_track_id_different_colors"]
-        self.show_info_statistics = config_show_node["show_info_statistics"]
+        self.draw_fps_info = config_show_node.draw_fps_info
+        self.show_roi = config_show_node.show_roi
+        self.overlay_transparent_mask = config_show_node.overlay_transparent_mask
+        self.imshow = config_show_node.imshow
+        self.show_only_yolo_detections = config_show_node.show_only_yolo_detections
+        self.show_track_id_different_colors = config_show_node.show_track_id_different_colors
+        self.show_info_statistics = config_show_node.show_info_statistics
 
         self.show_number_of_road = True  # отображение номеров дорог
+        # Скомпилированная геометрия дорог (пересобирается только при смене версии)
+        self.roads_geometry = RoadsGeometry({}, version=0)
+        # Буфер треков восстанавливается из покадровых изменений (tracks_delta)
+        self.tracks_mirror = TracksStore()
 
         # Параметры для шрифтов:
         self.fontFace = 1
@@ -55,6 +62,8 @@ class ShowNode:
         logger.debug(f"Detected objects: {frame_element.detected_xyxy}")
         logger.debug(f"Tracked objects: {frame_element.tracked_xyxy}")
 
+        if hasattr(frame_element, "tracks_delta"):
+            self.tracks_mirror.apply_delta(frame_element.tracks_delta)
         frame_result = frame_element.frame.copy()
 
         # Отображение лишь результатов детекции:
@@ -76,8 +85,13 @@ class ShowNode:
 
         else:
             # Отображение результатов трекинга:
-            for box, class_name, id in zip(
-                frame_element.tracked_xyxy, frame_element.tracked_cls, frame_element.id_list
+            # Дороги въезда всех видимых треков одним запросом к зеркалу буфера
+            start_roads = self.tracks_mirror.start_roads(frame_element.id_list)
+            for box, class_name, id, start_road in zip(
+                frame_element.tracked_xyxy,
+                frame_element.tracked_cls,
+                frame_element.id_list,
+                start_roads,
             ):
                 x1, y1, x2, y2 = box
                 # Отрисовка прямоугольника
@@ -87,13 +101,11 @@ class ShowNode:
                     color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
                 else:
                     # Отображаем каждый трек согласно цвету пересечения с дорогой
-                    try:
-                        start_road = frame_element.buffer_tracks[int(id)].start_road
-                        if start_road is not None:
-                            color = self.colors_roads[int(start_road)]
-                        else:  # бокс черным цветом если еще нет информации о стартовой дороге
-                            color = (0, 0, 0)
-                    except KeyError:  # На случай если машина еще в кадре а трек уже удален
+                    # Черный бокс если еще нет информации о стартовой дороге
+                    # или машина еще в кадре, а трек уже удален
+                    if start_road is not None:
+                        color = self.colors_roads[start_road]
+                    else:
                         color = (0, 0, 0)
 
                 cv2.rectangle(frame_result, (x1, y1), (x2, y2), color, self.thickness_lines)
@@ -110,10 +122,12 @@ class ShowNode:
 
         # Построение полигонов дорог
         if self.show_roi:
-            for road_id, points in frame_element.roads_info.items():
-                color = self.colors_roads[int(road_id)]
-                points = np.array(points, np.int32)
-                points = points.reshape((-1, 1, 2))
+            if frame_element.roads_version != self.roads_geometry.version:
+                self.roads_geometry = RoadsGeometry(
+                    frame_element.roads_info, frame_element.roads_version
+                )
+            for road_id, points in self.roads_geometry.points.items():
+                color = self.colors_roads[road_id]
                 cv2.polylines(
                     frame_result,
                     [points],
@@ -124,42 +138,40 @@ class ShowNode:
 
                 if self.overlay_transparent_mask:
                     frame_result = self._overlay_transparent_mask(
-                        frame_result, points, mask_color=color, alpha=0.3
+                        frame_result, road_id, mask_color=color, alpha=0.3
                     )
 
                 # Отображение номера дороги в залитой окружности
-                if self.show_number_of_road:
-                    moments = cv2.moments(points)  # Найти центр области
-                    if moments["m00"] != 0:
-                        cx = int(moments["m10"] / moments["m00"])
-                        cy = int(moments["m01"] / moments["m00"])
+                centroid = self.roads_geometry.centroids[road_id]
+                if self.show_number_of_road and centroid is not None:
+                    cx, cy = centroid
 
-                        (label_width, label_height), _ = cv2.getTextSize(
-                            str(road_id),
-                            fontFace=self.fontFace,
-                            fontScale=self.fontScale * 1.3,
-                            thickness=self.thickness,
-                        )
-                        # Определение размеров круга
-                        circle_radius = max(label_width, label_height) // 2
-                        # Рисование круга
-                        cv2.circle(
-                            frame_result,
-                            (cx, cy),
-                            circle_radius + 6,  # Добавляем небольшой отступ для текста
-                            (200, 200, 200),
-                            -1
-                        )
-                        # Нанесение подписи road_id в центре области
-                        cv2.putText(
-                            frame_result,
-                            str(road_id),
-                            (cx + 2 - label_width // 2, cy + 2 + label_height // 2),
-                            fontFace=self.fontFace,
-                            fontScale=self.fontScale * 1.3,
-                            thickness=self.thickness,
-                            color=(0, 0, 0),
-                        )
+                    (label_width, label_height), _ = cv2.getTextSize(
+                        str(road_id),
+                        fontFace=self.fontFace,
+                        fontScale=self.fontScale * 1.3,
+                        thickness=self.thickness,
+                    )
+                    # Определение размеров круга
+                    circle_radius = max(label_width, label_height) // 2
+                    # Рисование круга
+                    cv2.circle(
+                        frame_result,
+                        (cx, cy),
+                        circle_radius + 6,  # Добавляем небольшой отступ для текста
+                        (200, 200, 200),
+                        -1
+                    )
+                    # Нанесение подписи road_id в центре области
+                    cv2.putText(
+                        frame_result,
+                        str(road_id),
+                        (cx + 2 - label_width // 2, cy + 2 + label_height // 2),
+                        fontFace=self.fontFace,
+                        fontScale=self.fontScale * 1.3,
+                        thickness=self.thickness,
+                        color=(0, 0, 0),
+                    )
 
         # Подсчет fps и отрисовка
         if self.draw_fps_info:
@@ -264,8 +276,8 @@ class ShowNode:
 
         return frame_element
 
-    def _overlay_transparent_mask(self, img, points, mask_color=(0, 255, 255), alpha=0.3):
-        binary_mask = np.zeros((img.shape[0], img.shape[1]), dtype=np.uint8)
-        binary_mask = cv2.fillPoly(binary_mask, pts=[points], color=1)
+    def _overlay_transparent_mask(self, img, road_id, mask_color=(0, 255, 255), alpha=0.3):
+        # Бинарная маска дороги строится один раз на версию дорог и размер кадра
+        binary_mask = self.roads_geometry.masks(img.shape[:2])[road_id]
         colored_mask = (binary_mask[:, :, np.newaxis] * mask_color).astype(np.uint8)
         return cv2.addWeighted(img, 1, colored_mask, alpha, 0)
@@ -1,9 +1,16 @@
 import logging
 
+import numpy as np
+
 from elements.FrameElement import FrameElement
-from elements.TrackElement import TrackElement
+from elements.TracksDelta import TracksDelta
+from elements.TracksStore import TracksStore, NO_CLASS, NO_ROAD
 from elements.VideoEndBreakElement import VideoEndBreakElement
-from utils_local.utils import profile_time, intersects_central_point
+from utils_local.utils import profile_time
+from utils_local.roads_registry import RoadsGeometry
+from utils_local.od_matrix import ODMatrixCounter
+from utils_local.quantile_sketch import RoadTimeSketches
+from some_module.AppConfig import AppConfig
 
 logger = logging.getLogger("buffer_tracks")
 
@@ -11,21 +18,48 @@ logger = logging.getLogger("buffer_tracks")
 class TrackerInfoUpdateNode:
     """Модуль обновления актуальных треков"""
 
-    def __init__(self, config: dict) -> None:
-        config_general = config["general"]
+    def __init__(self, config: AppConfig) -> None:
+        config_general = config.general
 
         self.size_buffer_analytics = (
-            config_general["buffer_analytics"] * 60
+            config_general.buffer_analytics * 60
         )  # число секунд в буфере аналитики
         # добавим мин времени жизни чтобы при расчете статистики были именно
         # машины за последие buffer_analytics минут:
-        self.size_buffer_analytics += config_general["min_time_life_track"]
-        self.buffer_tracks = {}  # Буфер актуальных треков
+        self.size_buffer_analytics += config_general.min_time_life_track
+        self.buffer_tracks = TracksStore()  # Буфер актуальных треков
+        # Треки, живые в трекере: от первого обнаружения до удаления трекером (не ограничены окном
+        # буфера аналитики), по ним считаются завершенные треки, корреспонденции и время в кадре
+        self.live_tracks = TracksStore()
+        # Словарь классов объектов: в буфере хранится int16 код класса, имя — по коду
+        self.class_names: list[str] = []
+        self.class_codes: dict[str, int] = {}
+        # Скомпилированная геометрия дорог (пересобирается только при смене версии)
+        self.roads_geometry = RoadsGeometry({}, version=0)
+        # Потоковая матрица корреспонденций (дорога въезда -> дорога выезда)
+        self.od_counter = ODMatrixCounter(
+            bucket_secs=config_general.od_bucket_secs,
+            max_buckets=config_general.od_max_buckets,
+        )
+        # Потоковые распределения времени в кадре и времени проезда по дорогам въезда
+        self.time_stats = RoadTimeSketches(
+            bucket_secs=config_general.time_stats_bucket_secs,
+            max_buckets=config_general.time_stats_max_buckets,
+            relative_accuracy=config_general.time_stats_accuracy,
+        )
 
     @profile_time 
     def process(self, frame_element: FrameElement) -> FrameElement:
-        # Выйти из обработки если это пришел VideoEndBreakElement а не FrameElement
+        # При завершении видео учитываем в матрице корреспонденций все оставшиеся треки
         if isinstance(frame_element, VideoEndBreakElement):
+            keys_to_remove = self.buffer_tracks.records["id"].copy()
+            self.buffer_tracks.remove(keys_to_remove)
+            frame_element.finished_tracks = self._finish_tracks(self.live_tracks.records["id"].copy())
+            frame_element.track_classes = self.class_names
+            frame_element.tracks_delta = TracksDelta(removed=keys_to_remove)
+            frame_element.od_matrix = self.od_counter.snapshot()
+            frame_element.time_in_scene = self.time_stats.snapshot()
+            frame_element.time_sketches = self.time_stats.serialized()
             return frame_element
         assert isinstance(
             frame_element, FrameElement
@@ -33,42 +67,99 @@ class TrackerInfoUpdateNode:
 
         id_list = frame_element.id_list
 
-        for i, id in enumerate(id_list):
-            # Обновление или создание нового трека
-            if id not in self.buffer_tracks:
-                # Создаем новый ключ
-                self.buffer_tracks[id] = TrackElement(
-                    id=id,
-                    timestamp_first=frame_element.timestamp,
-                )
-            else:
-                # Обновление времени последнего обнаружения
-                self.buffer_tracks[id].update(frame_element.timestamp)
-
-            # Поиск первого пересечения с полигонами дорог
-            if self.buffer_tracks[id].start_road is None:
-                self.buffer_tracks[id].start_road = intersects_central_point(
-                    tracked_xyxy=frame_element.tracked_xyxy[i],
-                    polygons=frame_element.roads_info,
-                )
-                # Проверка того, что отработка функции дала наконец-то актуальный номер дороги:
-                if self.buffer_tracks[id].start_road is not None:
-                    # Тогда сохраняем время такого момента:
-                    self.buffer_tracks[id].timestamp_init_road = frame_element.timestamp
-
-        # Удаление старых айдишников из словаря если их время жизни > size_buffer_analytics
-        keys_to_remove = []
-        for key, track_element in sorted(self.buffer_tracks.items()):  # Сортируем элементы по ключу
-            if frame_element.timestamp - track_element.timestamp_first < self.size_buffer_analytics:
-                break  # Прерываем цикл, если значение time_delta больше check
-            else:
-                keys_to_remove.append(key)  # Добавляем ключ для удаления
-
-        for key in keys_to_remove:
-            self.buffer_tracks.pop(key)  # Удаляем элемент из словаря
-            logger.info(f"Removed tracker with key {key}")
+        if frame_element.roads_version != self.roads_geometry.version:
+            self.roads_geometry = RoadsGeometry(frame_element.roads_info, frame_element.roads_version)
+        # Дорога, в полигоне которой находится центр каждого bbox
+        current_roads = self.roads_geometry.find_roads(frame_element.tracked_xyxy)
+
+        ids = np.asarray(id_list, dtype=np.int64)
+        roads = np.array(
+            [NO_ROAD if road is None else road for road in current_roads], dtype=np.int16
+        )
+
+        class_codes = self._class_codes_for(frame_element.tracked_cls)
+        for store in (self.buffer_tracks, self.live_tracks):
+            self._update_tracks(store, ids, roads, class_codes, frame_element.timestamp)
+
+        # Удаление старых айдишников из буфера если их время жизни > size_buffer_analytics
+        keys_to_remove = self.buffer_tracks.expired(
+            frame_element.timestamp, self.size_buffer_analytics
+        )
+        self.buffer_tracks.remove(keys_to_remove)
+
+        # Трек завершен, когда трекер его удалил (потерян дольше track_buffer кадров). Треки, которые
+        # не видны дольше окна буфера, завершаем и без этого, чтобы живые треки не копились
+        stale = self.live_tracks.records["id"][
+            frame_element.timestamp - self.live_tracks.records["timestamp_last"] > self.size_buffer_analytics
+        ]
+        removed_ids = np.asarray(getattr(frame_element, "removed_ids", []), dtype=np.int64)
+        finished_tracks = self._finish_tracks(np.union1d(removed_ids, stale))
 
         # Запись результатов обработки:
         frame_element.buffer_tracks = self.buffer_tracks
+        # Завершенные на этом кадре треки (для записи фактов треков в БД)
+        frame_element.finished_tracks = finished_tracks
+        frame_element.track_classes = self.class_names
+        # Покадровые изменения буфера: все мутации треков происходят только с видимыми на кадре id
+        frame_element.tracks_delta = TracksDelta(
+            updated=self.buffer_tracks.select(ids),
+            removed=keys_to_remove,
+        )
+        frame_element.od_matrix = self.od_counter.snapshot()
+        frame_element.time_in_scene = self.time_stats.snapshot()
+        # Скетчи по корзинам сохраняются вместе со сводкой, чтобы объединять их за произвольный интервал
+        frame_element.time_sketches = self.time_stats.serialized()
 
         return frame_element
+
+    @staticmethod
+    def _update_tracks(
+        store: TracksStore, ids: np.ndarray, roads: np.ndarray, class_codes: np.ndarray, timestamp: float
+    ) -> None:
+        # Создание новых треков и обновление времени последнего обнаружения
+        store.add(ids[store.find_rows(ids) < 0], timestamp)
+        rows = store.find_rows(ids)
+        records = store.records
+        records["timestamp_last"][rows] = timestamp
+        # Класс трека — последний класс, присвоенный ему трекером
+        records["cls"][rows] = class_codes
+
+        # Первое пересечение с полигоном дороги задает дорогу въезда и время ее определения
+        start_roads = records["start_road"][rows]
+        init_road = (start_roads == NO_ROAD) & (roads != NO_ROAD)
+        records["start_road"][rows[init_road]] = roads[init_road]
+        records["timestamp_init_road"][rows[init_road]] = timestamp
+        # Последняя посещенная дорога, отличная от дороги въезда, считается дорогой выезда
+        exit_road = (start_roads != NO_ROAD) & (roads != NO_ROAD) & (roads != start_roads)
+        records["end_road"][rows[exit_road]] = roads[exit_road]
+
+    def _class_codes_for(self, class_names: list) -> np.ndarray:
+        codes = np.full(len(class_names), NO_CLASS, dtype=np.int16)
+        for i, name in enumerate(class_names):
+            code = self.class_codes.get(name)
+            if code is None:
+                code = self.class_codes[name] = len(self.class_names)
+                self.class_names.append(name)
+            codes[i] = code
+        return codes
+
+    def _finish_tracks(self, keys: np.ndarray) -> np.ndarray:
+        # Завершение треков с учетом их пар въезд/выезд в матрице корреспонденций
+        # и времени в кадре в распределениях по дорогам въезда; возвращает удаленные строки
+        finished_tracks = self.live_tracks.remove(keys)
+        for record in finished_tracks:
+            start_road = None if record["start_road"] == NO_ROAD else int(record["start_road"])
+            timestamp_last = float(record["timestamp_last"])
+            self.od_counter.add(
+                start_road=start_road,
+                end_road=None if record["end_road"] == NO_ROAD else int(record["end_road"]),
+                timestamp=timestamp_last,
+            )
+            self.time_stats.add(
+                start_road=start_road,
+                dwell=timestamp_last - float(record["timestamp_first"]),
+                travel=timestamp_last - float(record["timestamp_init_road"]),
+                timestamp=timestamp_last,
+            )
+            logger.info(f"Removed tracker with key {record['id']}")
+        return finished_tracks
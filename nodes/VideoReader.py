@@ -1,11 +1,12 @@
 import os
-import json
 import time
 import logging
 from typing import Generator
 import cv2
 from elements.FrameElement import FrameElement
 from elements.VideoEndBreakElement import VideoEndBreakElement
+from utils_local.roads_registry import get_roads_registry
+from some_module.AppConfig import VideoReaderConfig
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +20,11 @@ def check_video_file(video_path):
     return True
 
 class VideoReader:
-    def __init__(self, config: dict) -> None:
-        self.video_pth = config["src"]
+    def __init__(self, config: VideoReaderConfig) -> None:
+        self.video_pth = config.src
         self.video_source = f"Processing of {self.video_pth}"
+        # Идентификатор задачи (file_id из API), по умолчанию — путь до видео
+        self.file_id = str(config.file_id or self.video_pth)
         
         # Проверка существования файла или камеры
         if not (
@@ -33,9 +36,12 @@ class VideoReader:
 
         # Инициализация видеопотока
         self.stream = cv2.VideoCapture(self.video_pth)
+        # Число кадров в файле (0 для камеры и потоков) — для оценки прогресса обработки
+        self.total_frames = max(int(self.stream.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        self.frames_read = 0  # Прочитано кадров (включая пропущенные по skip_secs)
 
         # Параметры пропуска кадров
-        self.skip_secs = config.get("skip_secs", 0)
+        self.skip_secs = config.skip_secs
         self.last_frame_timestamp = -1  # Отрицательное значение для инициализации
         self.first_timestamp = 0  # Время первого кадра
 
@@ -46,65 +52,28 @@ class VideoReader:
             self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
             self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
 
-        # Загрузка данных о дорогах из JSON-файла
-        try:
-            with open(config["roads_info"], "r") as file:
-                data_json = json.load(file)
-            self.roads_info = {
-                key: [int(value) for value in values] for key, values in data_json.items()
-            }
-        except Exception as e:
-            logger.error(f"Failed to load roads info from {config['roads_info']}: {e}")
-            self.roads_info = {}
+        # Реестр дорог: json перечитывается при изменении без перезапуска пайплайна
+        self.roads_registry = get_roads_registry(
+            config.roads_info, watch_secs=config.roads_info_watch_secs
+        )
 
     def process(self) -> Generator[FrameElement, None, None]:
         frame_number = 0
 
-        # Создание объекта FrameElement
-        frame_element = FrameElement(
-            source="video.mp4",
-            frame=np.zeros((1080, 1920, 3)),
-            timestamp=123.45,
-            frame_num=1,
-            roads_info={},
-            file_id="test_file_id",
-            data={"key": "value"},
-        )
-
-        # Проверка сериализации
-        try:
-            serialized_data = json.dumps(frame_element.__dict__)
-            logger.debug(f"Serialized data: {serialized_data}")
-        except Exception as e:
-            logger.error(f"Serialization error: {e}")
-
-        # Десериализация
-        try:
-            deserialized_data = json.loads(serialized_data)
-            logger.debug(f"Deserialized data: {deserialized_data}")
-        except Exception as e:
-            logger.error(f"Deserialization error: {e}")
-
         while True:
             ret, frame = self.stream.read()
             if not ret:
                 logger.warning("Can't receive frame (stream end?). Exiting ...")
-                if not self.break_element_sent:
-                    self.break_element_sent = True
-
-                    if not self.video_pth:
-                        logger.error("Video path is not set. Cannot create VideoEndBreakElement.")
-                        break
-            if not ret:
-                logger.warning("Can't receive frame (stream end?). Exiting ...")
+                self.stream.release()
                 if not self.break_element_sent:
                     self.break_element_sent = True
                     yield VideoEndBreakElement(
                         video_source=self.video_pth,
                         timestamp=self.last_frame_timestamp,
-                        file_id=str(self.video_pth),  # Преобразуем file_id в строку
+                        file_id=self.file_id,
                     )
                 break
+            self.frames_read += 1
 
             # Вычисление временной метки
             if isinstance(self.video_pth, int) or "://" in self.video_pth:
@@ -128,13 +97,14 @@ class VideoReader:
             self.last_frame_timestamp = timestamp
             frame_number += 1
 
-            file_id = str(self.video_pth) if isinstance(self.video_pth, (str, int)) else "unknown"
+            roads = self.roads_registry.current  # согласованный снимок (roads_info, version)
             yield FrameElement(
                 source=self.video_source,
                 frame=frame,
                 timestamp=timestamp,
                 frame_num=frame_number,
-                roads_info=self.roads_info,
-                file_id=str(self.video_pth),  # Преобразуем file_id в строку
-                data={"file_id": str(self.video_pth), "key": "value"},  # Пример данных
+                roads_info=roads.roads_info,
+                roads_version=roads.version,
+                file_id=self.file_id,
+                data={"file_id": self.file_id, "key": "value"},  # Пример данных
             )
\ No newline at end of file
@@ -5,6 +5,7 @@ import cv2
 
 from elements.FrameElement import FrameElement
 from elements.VideoEndBreakElement import VideoEndBreakElement
+from some_module.AppConfig import VideoSaverConfig
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +13,10 @@ logger = logging.getLogger(__name__)
 class VideoSaverNode:
     """Модуль для сохранения видеопотока"""
 
-    def __init__(self, config: dict) -> None:
+    def __init__(self, config: VideoSaverConfig) -> None:
         self.fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-        self.fps = config["fps"]
-        self.out_folder = config["out_folder"]
+        self.fps = config.fps
+        self.out_folder = config.out_folder
         self._cv2_writer = None
 
     def process(self, frame_element: FrameElement) -> None:
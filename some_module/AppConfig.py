@@ -1,8 +1,226 @@
 # some_module/AppConfig.py
-from dataclasses import dataclass
+"""
+Типизированная неизменяемая конфигурация приложения.
 
-@dataclass
+Конфигурация Hydra/OmegaConf собирается один раз при старте (сервиса или main_optimized)
+и компилируется в frozen dataclass-ы: узлы читают параметры обычным доступом к атрибутам,
+без обращений к DictConfig. Параметры конкретной задачи (путь до видео, file_id)
+подставляются копией через dataclasses.replace без повторной сборки конфигурации.
+"""
+import typing
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+from omegaconf import DictConfig, OmegaConf
+
+# Ключи корня app_config.yaml, которые относятся к самой Hydra, а не к приложению
+HYDRA_KEYS = ("defaults", "hydra")
+
+
+@dataclass(frozen=True)
+class ConnectionInfo:
+    user: str
+    password: str
+    host: str
+    port: int
+    database: str
+
+
+@dataclass(frozen=True)
+class DbPoolConfig:
+    minconn: int = 2
+    maxconn: int = 10
+    checkout_timeout: float = 5
+    health_check_secs: float = 30
+    connect_timeout: float = 5
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    save_video: bool = False
+    send_info_db: bool = True
+    send_tracks_db: bool = True
+    show_in_web: bool = False
+
+
+@dataclass(frozen=True)
+class WorkerPoolConfig:
+    num_workers: int = 1
+    progress_secs: float = 1.0
+    max_backlog_secs: float = 7200
+
+
+@dataclass(frozen=True)
+class VideoProbeConfig:
+    max_width: int = 3840
+    max_height: int = 2160
+    max_duration_secs: float = 0
+
+
+@dataclass(frozen=True)
+class ExportConfig:
+    max_concurrent: int = 2
+    chunk_rows: int = 5000
+
+
+@dataclass(frozen=True)
+class GeneralConfig:
+    colors_of_roads: Dict[int, Tuple[int, ...]]
+    buffer_analytics: float = 0.5
+    min_time_life_track: float = 3
+    count_cars_buffer_frames: int = 25
+    od_bucket_secs: float = 60
+    od_max_buckets: int = 10
+    time_stats_bucket_secs: float = 60
+    time_stats_max_buckets: int = 10
+    time_stats_accuracy: float = 0.02
+
+
+@dataclass(frozen=True)
+class VideoReaderConfig:
+    src: Union[str, int]
+    roads_info: str
+    skip_secs: float = 0
+    roads_info_watch_secs: float = 0
+    file_id: Optional[str] = None  # Идентификатор задачи (задается на каждую задачу)
+
+
+@dataclass(frozen=True)
+class DetectionConfig:
+    weight_pth: str
+    classes_to_detect: Tuple[int, ...]
+    confidence: float = 0.10
+    iou: float = 0.7
+    imgsz: int = 640
+
+
+@dataclass(frozen=True)
+class TrackingConfig:
+    first_track_thresh: float = 0.5
+    second_track_thresh: float = 0.10
+    match_thresh: float = 0.95
+    track_buffer: int = 125
+
+
+@dataclass(frozen=True)
+class ShowConfig:
+    scale: float = 0.6
+    imshow: bool = True
+    fps_counter_N_frames_stat: int = 15
+    draw_fps_info: bool = True
+    show_roi: bool = True
+    overlay_transparent_mask: bool = False
+    show_only_yolo_detections: bool = False
+    show_track_id_different_colors: bool = False
+    show_info_statistics: bool = True
+
+
+@dataclass(frozen=True)
+class VideoSaverConfig:
+    out_folder: str
+    fps: float = 24
+
+
+@dataclass(frozen=True)
+class DbWriterConfig:
+    """Общие параметры узлов фоновой записи в БД (пакеты, повторы, локальный спул)."""
+
+    connection_info: ConnectionInfo
+    table_name: str
+    drop_table: bool = False
+    batch_size: int = 50
+    flush_secs: float = 1.0
+    max_queue: int = 10000
+    max_retries: int = 3
+    spool_dir: Optional[str] = None  # None — без спула, строки отбрасываются
+    spool_segment_mb: int = 16
+    spool_max_mb: int = 1024
+    spool_fsync_secs: float = 1.0
+    spool_replay_secs: float = 5.0
+
+
+@dataclass(frozen=True)
+class SendInfoDBConfig(DbWriterConfig):
+    how_often_add_info: float = 5
+    retention_days: int = 90
+    partitions_ahead: int = 3
+    maintenance_secs: float = 3600
+
+
+@dataclass(frozen=True)
+class SendTracksDBConfig(DbWriterConfig):
+    pass
+
+
+@dataclass(frozen=True)
+class VideoServerConfig:
+    template_folder: str
+    index_page: str = "index.html"
+    host_ip: str = "0.0.0.0"
+    port: int = 8100
+
+
+@dataclass(frozen=True)
 class AppConfig:
-    # Определите поля конфигурации здесь
-    param1: str = "default_value"
-    param2: int = 42
\ No newline at end of file
+    db_name: str
+    db_user: str
+    db_password: str
+    db_host: str
+    db_port: int
+    general: GeneralConfig
+    video_reader: VideoReaderConfig
+    detection_node: DetectionConfig
+    send_info_db_node: SendInfoDBConfig
+    send_tracks_db_node: SendTracksDBConfig
+    video_saver_node: VideoSaverConfig
+    video_server_node: VideoServerConfig
+    db_pool: DbPoolConfig = field(default_factory=DbPoolConfig)
+    pipeline: PipelineConfig = field(default_factory=PipelineConfig)
+    worker_pool: WorkerPoolConfig = field(default_factory=WorkerPoolConfig)
+    video_probe: VideoProbeConfig = field(default_factory=VideoProbeConfig)
+    export: ExportConfig = field(default_factory=ExportConfig)
+    tracking_node: TrackingConfig = field(default_factory=TrackingConfig)
+    show_node: ShowConfig = field(default_factory=ShowConfig)
+
+    @classmethod
+    def from_container(cls, data: Mapping[str, Any]) -> "AppConfig":
+        """Сборка из обычного dict (OmegaConf.to_container), ключи Hydra пропускаются."""
+        return _build(cls, {key: value for key, value in data.items() if key not in HYDRA_KEYS})
+
+    def for_job(self, src: Union[str, int], file_id: Optional[str] = None) -> "AppConfig":
+        """Копия конфигурации с видео и идентификатором конкретной задачи."""
+        return replace(self, video_reader=replace(self.video_reader, src=src, file_id=file_id))
+
+
+def load_app_config(cfg: DictConfig) -> AppConfig:
+    """Компиляция конфигурации Hydra (с подстановкой интерполяций) в AppConfig."""
+    return AppConfig.from_container(OmegaConf.to_container(cfg, resolve=True))
+
+
+def _build(cls, data: Mapping[str, Any]):
+    hints = typing.get_type_hints(cls)
+    names = {config_field.name for config_field in fields(cls)}
+    unknown = set(data) - names
+    if unknown:
+        raise ValueError(f"{cls.__name__}: unknown configuration parameters {sorted(unknown)}")
+    return cls(**{name: _convert(hints[name], value) for name, value in data.items()})
+
+
+def _convert(hint, value):
+    if value is None:
+        return None
+    if is_dataclass(hint):
+        return _build(hint, value)
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin is Union:
+        # Optional[dataclass] и подобные: приводим к первому подходящему dataclass-типу
+        for arg in args:
+            if is_dataclass(arg):
+                return _build(arg, value)
+        return value
+    if origin is tuple:
+        return tuple(_convert(args[0], item) for item in value)
+    if origin is dict:
+        return {key: _convert(args[1], item) for key, item in value.items()}
+    return value
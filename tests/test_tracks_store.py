@@ -0,0 +1,24 @@
+import numpy as np
+
+from elements.TracksStore import TracksStore
+
+
+def test_start_roads_empty_store():
+    assert TracksStore().start_roads(np.array([5, 7])) == [None, None]
+
+
+def test_start_roads_missing_and_unknown_ids():
+    store = TracksStore()
+    store.add(np.array([1, 2, 3]), timestamp=0.0)
+    store.records["start_road"][store.find_rows(np.array([2]))] = 4
+
+    # 0 и 9 отсутствуют в буфере, у 1 дорога еще не определена
+    assert store.start_roads(np.array([0, 1, 2, 9])) == [None, None, 4, None]
+
+
+def test_start_roads_after_remove():
+    store = TracksStore()
+    store.add(np.array([5]), timestamp=0.0)
+    store.remove(np.array([5]))
+
+    assert store.start_roads(np.array([5])) == [None]
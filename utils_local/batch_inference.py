@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from prometheus_client import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus микробатчинга инференса
+INFERENCE_BATCH_SIZE = Histogram(
+    'inference_batch_size', 'Requests per inference micro-batch', buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+INFERENCE_QUEUE_WAIT = Histogram('inference_queue_wait_seconds', 'Time a request waits for its micro-batch')
+INFERENCE_BATCH_TIME = Histogram('inference_batch_seconds', 'Micro-batch inference latency')
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ) -> None:
+        """
+        Сборка одновременных запросов инференса в микробатчи.
+
+        Запросы копятся в очереди asyncio; батч отправляется, когда набрано max_batch_size
+        запросов или с момента первого запроса в батче прошло max_wait_ms миллисекунд.
+        predict_batch выполняется в отдельном однопоточном пуле, поэтому event loop не
+        блокируется, а модель не вызывается из нескольких потоков одновременно.
+
+        Args:
+            predict_batch (Callable): функция от списка входов, возвращающая список результатов той же длины.
+            max_batch_size (int): максимальный размер батча.
+            max_wait_ms (float): максимальное ожидание добора батча (в мс).
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_secs = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запуск цикла сборки батчей (вызывается из работающего event loop)."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def predict(self, item: Any) -> Any:
+        """Результат инференса для одного входа (в составе ближайшего батча)."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.monotonic()))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_secs
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _, _ in batch]
+            now = time.monotonic()
+            for _, _, enqueued_at in batch:
+                INFERENCE_QUEUE_WAIT.observe(now - enqueued_at)
+            INFERENCE_BATCH_SIZE.observe(len(batch))
+            try:
+                with INFERENCE_BATCH_TIME.time():
+                    results = await loop.run_in_executor(self._executor, self.predict_batch, items)
+            except Exception as error:
+                logger.error(f"Inference batch of {len(batch)} failed: {error}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
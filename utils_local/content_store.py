@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import asdict
+
+from prometheus_client import Counter
+
+from some_module.AppConfig import AppConfig
+from utils_local.uploads import MultipartUpload, StoredUpload, stream_upload
+
+# Метрики Prometheus хранилища загрузок
+CONTENT_STORE_DUPLICATES = Counter('content_store_duplicates', 'Uploads whose content was already stored')
+
+# Секции конфигурации, от которых зависит результат обработки видео
+RESULT_CONFIG_SECTIONS = ("detection_node", "tracking_node", "general")
+
+
+class ContentStore:
+    def __init__(self, root: str) -> None:
+        """
+        Хранилище загрузок, адресуемое содержимым: файл лежит в objects/<sha[:2]>/<sha>.
+
+        Одинаковое содержимое хранится один раз, сколько бы раз его ни загружали.
+        """
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], sha256)
+
+    async def put(self, file: MultipartUpload, max_bytes: int, chunk_bytes: int) -> StoredUpload:
+        """Потоково сохраняет загрузку, хэшируя ее по ходу, и кладет по адресу sha256."""
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        upload = await stream_upload(file, tmp_path, max_bytes=max_bytes, chunk_bytes=chunk_bytes)
+        path = self.path(upload.sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            CONTENT_STORE_DUPLICATES.inc()
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return StoredUpload(path=path, size=upload.size, sha256=upload.sha256)
+
+
+def config_hash(config: AppConfig, roads_info: dict) -> str:
+    """Хэш эффективной конфигурации обработки: секции, влияющие на результат, и полигоны дорог."""
+    effective = {section: asdict(getattr(config, section)) for section in RESULT_CONFIG_SECTIONS}
+    effective["skip_secs"] = config.video_reader.skip_secs
+    effective["roads_info"] = roads_info
+    payload = json.dumps(effective, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus пула подключений
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Checked out DB connections', ['pool'], multiprocess_mode='livesum')
+DB_POOL_MAX = Gauge('db_pool_connections_max', 'Max DB connections in pool', ['pool'], multiprocess_mode='livesum')
+DB_POOL_CHECKOUT_TIME = Histogram('db_pool_checkout_seconds', 'Time waiting for a DB connection', ['pool'])
+DB_POOL_EXHAUSTED = Counter('db_pool_exhausted', 'Checkouts failed because pool was saturated', ['pool'])
+
+
+class DBConnectionPool:
+    def __init__(
+        self,
+        conn_params: dict,
+        minconn: Optional[int] = None,
+        maxconn: int = 10,
+        checkout_timeout: float = 5.0,
+        health_check_secs: float = 30.0,
+        connect_timeout: int = 5,
+        name: str = "default",
+    ) -> None:
+        """
+        Общий пул подключений к PostgreSQL с выдачей подключения на время запроса.
+
+        Если все maxconn подключений заняты, вызывающий ждет освобождения не дольше
+        checkout_timeout секунд. Подключение, простоявшее без дела дольше
+        health_check_secs, перед выдачей проверяется запросом SELECT 1 и
+        пересоздается, если оказалось мертвым; только что открытое подключение не
+        проверяется. Создание пула не требует доступной БД: заранее открываемые
+        подключения открываются по возможности.
+
+        Простаивающих подключений пул держит не больше minconn, остальные закрывает
+        при возврате, поэтому minconn стоит задавать равным ожидаемому числу
+        одновременных запросов процесса, иначе каждый пик платит за новое подключение.
+
+        Args:
+            conn_params (dict): параметры psycopg2.connect.
+            minconn (Optional[int]): число подключений, открываемых заранее и держащихся
+                открытыми (None — maxconn).
+            maxconn (int): максимальное число подключений.
+            checkout_timeout (float): максимальное ожидание свободного подключения (в сек).
+            health_check_secs (float): после какого простоя проверять подключение (в сек).
+            connect_timeout (int): таймаут установки подключения (в сек).
+            name (str): имя пула в метриках.
+        """
+        minconn = maxconn if minconn is None else min(minconn, maxconn)
+        self.name = name
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_secs = health_check_secs
+        self._pool = pg_pool.ThreadedConnectionPool(
+            0, maxconn, **{"connect_timeout": connect_timeout, **conn_params}
+        )
+        self._pool.minconn = minconn  # столько простаивающих подключений пул держит открытыми
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._in_use = DB_POOL_IN_USE.labels(name)
+        self._checkout_time = DB_POOL_CHECKOUT_TIME.labels(name)
+        self._exhausted = DB_POOL_EXHAUSTED.labels(name)
+        DB_POOL_MAX.labels(name).set(maxconn)
+        self._warm_up(minconn)
+
+    @contextmanager
+    def connection(self) -> Iterator["psycopg2.extensions.connection"]:
+        """Выдает подключение из пула; при исключении транзакция откатывается."""
+        t_start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            self._exhausted.inc()
+            raise pg_pool.PoolError(f"DB pool '{self.name}' exhausted ({self.maxconn} connections)")
+        self._checkout_time.observe(time.monotonic() - t_start)
+        self._in_use.inc()
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                broken = bool(conn.closed) or not self._rollback(conn)
+            raise
+        finally:
+            if conn is not None:
+                broken = broken or bool(conn.closed)
+                if not broken:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn, close=broken)
+                # Пул закрывает лишние простаивающие подключения сверх minconn
+                if conn.closed:
+                    self._last_used.pop(id(conn), None)
+            self._in_use.dec()
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+    def _warm_up(self, count: int) -> None:
+        # Открываем подключения заранее; недоступная БД не мешает созданию пула
+        connections = []
+        try:
+            for _ in range(count):
+                conn = self._pool.getconn()
+                self._last_used[id(conn)] = time.monotonic()
+                connections.append(conn)
+        except psycopg2.Error as error:
+            logger.warning(f"DB pool '{self.name}': database unavailable at start: {error}")
+        for conn in connections:
+            self._pool.putconn(conn)
+
+    def _checkout(self) -> "psycopg2.extensions.connection":
+        conn = self._pool.getconn()
+        # Неизвестное подключение только что открыто пулом — проверять его не нужно
+        last_used = self._last_used.setdefault(id(conn), time.monotonic())
+        idle = time.monotonic() - last_used
+        if conn.closed or (idle > self.health_check_secs and not self._is_alive(conn)):
+            logger.warning(f"DB pool '{self.name}': dropping dead connection")
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            conn = self._pool.getconn()
+            self._last_used[id(conn)] = time.monotonic()
+        return conn
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _rollback(conn) -> bool:
+        try:
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+_pools: Dict[tuple, DBConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def connection_params(connection_info) -> dict:
+    """Параметры psycopg2.connect из секции connection_info конфигурации."""
+    return {
+        "user": connection_info.user,
+        "password": connection_info.password,
+        "host": connection_info.host,
+        "port": str(connection_info.port),
+        "database": connection_info.database,
+    }
+
+
+def get_db_pool(conn_params: dict, **pool_settings) -> DBConnectionPool:
+    """Возвращает общий для процесса пул для заданных параметров подключения."""
+    key = tuple(sorted((k, str(v)) for k, v in conn_params.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = DBConnectionPool(conn_params, **pool_settings)
+            logger.info(f"Created DB pool for {conn_params.get('host')}/{conn_params.get('database', conn_params.get('dbname'))}")
+        return _pools[key]
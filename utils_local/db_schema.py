@@ -0,0 +1,522 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Tuple
+
+from psycopg2.extras import Json, execute_values
+
+logger = logging.getLogger(__name__)
+
+N_ROAD_COLUMNS = 5  # Типизированные колонки road_1..road_5 (остальные дороги остаются в data)
+
+# Колонки traffic_info в порядке значений строки фонового писателя
+TRAFFIC_INFO_COLUMNS = (
+    "timestamp_date",
+    "file_id",
+    "timestamp",
+    "frame_num",
+    "cars",
+    *(f"road_{i}" for i in range(1, N_ROAD_COLUMNS + 1)),
+    "data",
+)
+
+# Колонки таблицы фактов треков (одна строка на завершенный трек)
+TRACK_FACTS_COLUMNS = (
+    "file_id",
+    "track_id",
+    "class_name",
+    "start_road",
+    "end_road",
+    "timestamp_first",
+    "timestamp_init_road",
+    "timestamp_last",
+)
+
+# Гранулярности сводных таблиц traffic_info: суффикс таблицы -> аргумент date_trunc
+ROLLUP_GRANULARITIES = {"minutely": "minute", "hourly": "hour"}
+# Поля datetime от крупных к мелким: усечение до единицы сводки обнуляет все поля мельче нее
+_TIME_FIELDS = ("hour", "minute", "second", "microsecond")
+
+# (номер версии, описание, функция миграции от курсора)
+Migration = Tuple[int, str, Callable[["psycopg2.extensions.cursor"], None]]
+
+
+def apply_migrations(connection, component: str, migrations: List[Migration]) -> int:
+    """
+    Применяет недостающие миграции компонента схемы в одной транзакции.
+
+    Примененные версии хранятся в таблице schema_migrations. Параллельные процессы
+    сериализуются advisory-блокировкой на имя компонента.
+
+    Args:
+        connection: подключение psycopg2.
+        component (str): имя компонента схемы (обычно имя таблицы).
+        migrations (List[Migration]): миграции в порядке возрастания версий.
+
+    Returns:
+        int: текущая версия схемы компонента.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                component VARCHAR(255) NOT NULL,
+                version INTEGER NOT NULL,
+                description TEXT,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (component, version)
+            );
+            """
+        )
+        connection.commit()
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (component,))
+        cursor.execute("SELECT version FROM schema_migrations WHERE component = %s;", (component,))
+        applied = {row[0] for row in cursor.fetchall()}
+        for version, description, migration in migrations:
+            if version in applied:
+                continue
+            logger.info(f"Applying migration {component} v{version}: {description}")
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (component, version, description) VALUES (%s, %s, %s);",
+                (component, version, description),
+            )
+            applied.add(version)
+    connection.commit()
+    return max(applied, default=0)
+
+
+def reset_component(connection, component: str, tables: List[str]) -> None:
+    """Удаляет таблицы компонента вместе с историей его миграций (для тестовых перезапусков)."""
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
+        if _table_exists(cursor, "schema_migrations"):
+            cursor.execute("DELETE FROM schema_migrations WHERE component = %s;", (component,))
+    connection.commit()
+
+
+def traffic_info_migrations(table_name: str) -> List[Migration]:
+    """Версионированная схема таблицы статистики кадров."""
+    road_columns = ",\n".join(f"    road_{i} REAL" for i in range(1, N_ROAD_COLUMNS + 1))
+
+    def create_partitioned_table(cursor) -> None:
+        # Старая таблица-куча (без партиций) сохраняется под именем <table>_legacy
+        legacy_table = f"{table_name}_legacy"
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s;", (table_name,))
+        row = cursor.fetchone()
+        has_legacy = row is not None and row[0] == "r"
+        if has_legacy:
+            cursor.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_table};")
+            # Имена индекса первичного ключа и последовательности освобождаем для новой таблицы
+            cursor.execute(f"ALTER INDEX IF EXISTS {table_name}_pkey RENAME TO {legacy_table}_pkey;")
+            cursor.execute(f"ALTER SEQUENCE IF EXISTS {table_name}_id_seq RENAME TO {legacy_table}_id_seq;")
+
+        cursor.execute(
+            f"""
+            CREATE TABLE {table_name} (
+                id BIGSERIAL,
+                timestamp_date TIMESTAMPTZ NOT NULL DEFAULT now(),  -- время записи (ключ партиционирования)
+                file_id VARCHAR(255) NOT NULL,
+                timestamp DOUBLE PRECISION,  -- время кадра от начала видео (в сек)
+                frame_num INTEGER,
+                cars INTEGER,
+{road_columns},
+                data JSONB,
+                PRIMARY KEY (id, timestamp_date)
+            ) PARTITION BY RANGE (timestamp_date);
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX {table_name}_file_id_timestamp_idx ON {table_name} (file_id, timestamp);"
+        )
+        cursor.execute(
+            f"CREATE INDEX {table_name}_timestamp_date_idx ON {table_name} (timestamp_date);"
+        )
+
+        if has_legacy:
+            # Переносим историю в партицию текущего дня (старая схема не хранила время записи)
+            now = datetime.now(timezone.utc)
+            _create_partition(cursor, table_name, now.date())
+            cursor.execute(
+                f"""
+                INSERT INTO {table_name} (file_id, timestamp, cars, data)
+                SELECT file_id, timestamp, (data->>'cars_amount')::INTEGER, data FROM {legacy_table};
+                """
+            )
+
+    def create_default_partition(cursor) -> None:
+        # Строки вне созданных дневных партиций (обслуживание не успело, сдвиг часов, запись из
+        # дискового буфера спустя дни) попадают сюда, а не отклоняются; _create_partition переносит их
+        # в партицию дня при ее создании
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {_default_partition_name(table_name)} PARTITION OF {table_name} DEFAULT;"
+        )
+
+    return [
+        (1, "partitioned table with typed hot columns and (file_id, timestamp) index", create_partitioned_table),
+        (2, "default partition for rows outside the daily partitions", create_default_partition),
+    ]
+
+
+def traffic_info_rollup_migrations(table_name: str) -> List[Migration]:
+    """Сводные таблицы <table>_minutely и <table>_hourly (суммы за интервал по file_id)."""
+    road_columns = ",\n".join(
+        f"    road_{i}_sum DOUBLE PRECISION NOT NULL DEFAULT 0" for i in range(1, N_ROAD_COLUMNS + 1)
+    )
+    road_sums = ", ".join(f"COALESCE(SUM(road_{i}), 0)" for i in range(1, N_ROAD_COLUMNS + 1))
+
+    def create_rollup_tables(cursor) -> None:
+        for suffix, unit in ROLLUP_GRANULARITIES.items():
+            rollup_table = f"{table_name}_{suffix}"
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {rollup_table} (
+                    bucket TIMESTAMPTZ NOT NULL,  -- начало интервала
+                    file_id VARCHAR(255) NOT NULL,
+                    samples INTEGER NOT NULL DEFAULT 0,  -- число записей traffic_info за интервал
+                    cars_sum BIGINT NOT NULL DEFAULT 0,
+                    cars_max INTEGER,
+{road_columns},
+                    PRIMARY KEY (bucket, file_id)
+                );
+                """
+            )
+            # Заполнение по уже накопленной истории (один раз); отсчеты — только строки с cars,
+            # как в traffic_info_rollup_upsert
+            cursor.execute(
+                f"""
+                INSERT INTO {rollup_table}
+                SELECT date_trunc('{unit}', timestamp_date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', file_id, COUNT(cars),
+                       COALESCE(SUM(cars), 0), MAX(cars), {road_sums}
+                FROM {table_name} GROUP BY 1, 2
+                ON CONFLICT DO NOTHING;
+                """
+            )
+
+    def recount_samples(cursor) -> None:
+        # Сводки, заполненные до v2, считали отсчетами и строки-снимки без cars; cars_sum, cars_max
+        # и суммы по дорогам от них не менялись (NULL не входит в агрегаты), пересчитывается только samples.
+        # Интервалы, сырые данные которых уже удалены по retention, остаются как есть
+        for suffix, unit in ROLLUP_GRANULARITIES.items():
+            rollup_table = f"{table_name}_{suffix}"
+            cursor.execute(
+                f"""
+                UPDATE {rollup_table} AS rollup SET samples = raw.samples
+                FROM (
+                    SELECT date_trunc('{unit}', timestamp_date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+                           file_id, COUNT(cars) AS samples
+                    FROM {table_name} GROUP BY 1, 2
+                ) AS raw
+                WHERE rollup.bucket = raw.bucket AND rollup.file_id = raw.file_id
+                  AND rollup.samples <> raw.samples;
+                """
+            )
+
+    return [
+        (1, "minutely and hourly rollup tables", create_rollup_tables),
+        (2, "count only rows with cars as rollup samples", recount_samples),
+    ]
+
+
+def traffic_info_rollup_upsert(table_name: str) -> Callable:
+    """
+    Функция инкрементального обновления сводных таблиц по пакету строк traffic_info.
+
+    Выполняется в той же транзакции, что и вставка пакета, поэтому сводки всегда
+    согласованы с сырыми данными.
+    """
+    i_date = TRAFFIC_INFO_COLUMNS.index("timestamp_date")
+    i_file = TRAFFIC_INFO_COLUMNS.index("file_id")
+    i_cars = TRAFFIC_INFO_COLUMNS.index("cars")
+    i_road = TRAFFIC_INFO_COLUMNS.index("road_1")
+    road_names = [f"road_{i}_sum" for i in range(1, N_ROAD_COLUMNS + 1)]
+    truncate = {suffix: _truncate_to(unit) for suffix, unit in ROLLUP_GRANULARITIES.items()}
+
+    def upsert(cursor, batch: List[tuple]) -> None:
+        # Строки без cars (снимки в data, например финальная строка видео) не являются отсчетами
+        # и не должны занижать средние cars_sum / samples
+        samples = [row for row in batch if row[i_cars] is not None]
+        if not samples:
+            return
+        for suffix, trunc in truncate.items():
+            rollup_table = f"{table_name}_{suffix}"
+            groups = defaultdict(lambda: [0, 0, None] + [0.0] * N_ROAD_COLUMNS)
+            for row in samples:
+                group = groups[(trunc(row[i_date]), row[i_file])]
+                cars = row[i_cars]
+                group[0] += 1
+                group[1] += cars
+                group[2] = cars if group[2] is None else max(group[2], cars)
+                for j in range(N_ROAD_COLUMNS):
+                    group[3 + j] += row[i_road + j] or 0
+            updates = ", ".join(
+                [
+                    f"samples = {rollup_table}.samples + EXCLUDED.samples",
+                    f"cars_sum = {rollup_table}.cars_sum + EXCLUDED.cars_sum",
+                    f"cars_max = GREATEST({rollup_table}.cars_max, EXCLUDED.cars_max)",
+                ]
+                + [f"{name} = {rollup_table}.{name} + EXCLUDED.{name}" for name in road_names]
+            )
+            execute_values(
+                cursor,
+                f"""
+                INSERT INTO {rollup_table} (bucket, file_id, samples, cars_sum, cars_max, {", ".join(road_names)})
+                VALUES %s
+                ON CONFLICT (bucket, file_id) DO UPDATE SET {updates};
+                """,
+                # Ключи в одном порядке во всех писателях, чтобы параллельные upsert не взаимоблокировались
+                [(*key, *values) for key, values in sorted(groups.items())],
+            )
+
+    return upsert
+
+
+def _truncate_to(unit: str) -> Callable:
+    zeros = dict.fromkeys(_TIME_FIELDS[_TIME_FIELDS.index(unit) + 1:], 0)
+    return lambda ts: ts.replace(**zeros)
+
+
+def track_facts_migrations(table_name: str) -> List[Migration]:
+    """Таблица фактов треков: окна и агрегаты по трафику считаются из нее SQL-запросами."""
+
+    def create_table(cursor) -> None:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                id BIGSERIAL PRIMARY KEY,
+                file_id VARCHAR(255) NOT NULL,  -- поток (видео), в котором был трек
+                track_id BIGINT NOT NULL,
+                class_name VARCHAR(32),
+                start_road SMALLINT,  -- дорога въезда (NULL — не определена)
+                end_road SMALLINT,  -- дорога выезда (NULL — не определена)
+                timestamp_first DOUBLE PRECISION NOT NULL,  -- время кадра от начала видео (в сек)
+                timestamp_init_road DOUBLE PRECISION,
+                timestamp_last DOUBLE PRECISION NOT NULL,
+                finished_at TIMESTAMPTZ NOT NULL DEFAULT now()  -- время записи факта
+            );
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table_name}_file_id_timestamp_idx "
+            f"ON {table_name} (file_id, timestamp_first);"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table_name}_finished_at_idx ON {table_name} (finished_at);"
+        )
+
+    return [(1, f"{table_name} fact table", create_table)]
+
+
+def processed_videos_migrations() -> List[Migration]:
+    """Таблица обработанных видео и ее почасовая сводка для /stats."""
+
+    def create_tables(cursor) -> None:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_videos (
+                id SERIAL PRIMARY KEY,
+                file_id VARCHAR(255) NOT NULL,
+                filename TEXT,
+                status VARCHAR(32),
+                result JSONB,
+                upload_time TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS processed_videos_file_id_idx ON processed_videos (file_id);"
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_videos_hourly (
+                hour TIMESTAMPTZ PRIMARY KEY,
+                total_videos INTEGER NOT NULL DEFAULT 0,
+                total_objects_detected BIGINT
+            );
+            """
+        )
+        cursor.execute(
+            """
+            INSERT INTO processed_videos_hourly
+            SELECT date_trunc('hour', upload_time), COUNT(*), SUM((result->>'objects_detected')::INT)
+            FROM processed_videos GROUP BY 1
+            ON CONFLICT DO NOTHING;
+            """
+        )
+
+    def add_content_hashes(cursor) -> None:
+        # Хэши содержимого видео и эффективной конфигурации для дедупликации повторных загрузок
+        cursor.execute(
+            """
+            ALTER TABLE processed_videos
+                ADD COLUMN IF NOT EXISTS content_hash CHAR(64),
+                ADD COLUMN IF NOT EXISTS config_hash CHAR(64);
+            """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS processed_videos_content_config_idx
+            ON processed_videos (content_hash, config_hash, upload_time DESC)
+            WHERE status = 'completed';
+            """
+        )
+
+    def add_video_info(cursor) -> None:
+        # Метаданные видео из проверки загрузки (длительность, разрешение, fps, кодек)
+        cursor.execute("ALTER TABLE processed_videos ADD COLUMN IF NOT EXISTS video_info JSONB;")
+
+    return [
+        (1, "processed_videos with hourly rollup", create_tables),
+        (2, "content and config hashes for dedup", add_content_hashes),
+        (3, "video metadata", add_video_info),
+    ]
+
+
+def record_processed_video(
+    cursor,
+    file_id: str,
+    filename: str,
+    status: str,
+    result: dict | None,
+    content_hash: str | None = None,
+    config_hash: str | None = None,
+    video_info: dict | None = None,
+) -> None:
+    """Записывает результат обработки видео и инкрементально обновляет почасовую сводку."""
+    cursor.execute(
+        """
+        INSERT INTO processed_videos (file_id, filename, status, result, content_hash, config_hash, video_info)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        RETURNING upload_time;
+        """,
+        (
+            file_id,
+            filename,
+            status,
+            Json(result) if result is not None else None,
+            content_hash,
+            config_hash,
+            Json(video_info) if video_info is not None else None,
+        ),
+    )
+    cursor.execute(
+        """
+        INSERT INTO processed_videos_hourly (hour, total_videos, total_objects_detected)
+        VALUES (date_trunc('hour', %s::timestamptz), 1, %s)
+        ON CONFLICT (hour) DO UPDATE SET
+            total_videos = processed_videos_hourly.total_videos + 1,
+            total_objects_detected = COALESCE(processed_videos_hourly.total_objects_detected, 0)
+                + COALESCE(EXCLUDED.total_objects_detected, 0);
+        """,
+        (cursor.fetchone()[0], (result or {}).get("objects_detected")),
+    )
+
+
+def find_processed_video(cursor, content_hash: str, config_hash: str) -> Tuple[str, dict] | None:
+    """Последний успешный результат обработки того же содержимого с той же конфигурацией."""
+    cursor.execute(
+        """
+        SELECT file_id, result FROM processed_videos
+        WHERE content_hash = %s AND config_hash = %s AND status = 'completed'
+        ORDER BY upload_time DESC LIMIT 1;
+        """,
+        (content_hash, config_hash),
+    )
+    return cursor.fetchone()
+
+
+class PartitionManager:
+    def __init__(self, table_name: str, retention_days: int, partitions_ahead: int) -> None:
+        """
+        Обслуживание дневных партиций таблицы: создание заранее и удаление устаревших.
+
+        Args:
+            table_name (str): имя партиционированной таблицы.
+            retention_days (int): сколько дней хранить данные (0 — хранить все).
+            partitions_ahead (int): на сколько дней вперед создавать партиции.
+        """
+        self.table_name = table_name
+        self.retention_days = retention_days
+        self.partitions_ahead = partitions_ahead
+
+    def maintain(self, connection) -> None:
+        today = datetime.now(timezone.utc).date()
+        with connection.cursor() as cursor:
+            # Обслуживание запускают писатели всех воркеров: создание партиций сериализуется
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (f"{self.table_name}_partitions",))
+            for day in range(-1, self.partitions_ahead + 1):
+                _create_partition(cursor, self.table_name, today + timedelta(days=day))
+            if self.retention_days > 0:
+                self._drop_expired(cursor, today - timedelta(days=self.retention_days))
+        connection.commit()
+
+    def _drop_expired(self, cursor, oldest_day) -> None:
+        # Удаление партиции целиком вместо DELETE: мгновенно и без раздувания таблицы
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s;
+            """,
+            (self.table_name,),
+        )
+        for (partition,) in cursor.fetchall():
+            day = _partition_day(self.table_name, partition)
+            if day is not None and day < oldest_day:
+                cursor.execute(f"DROP TABLE IF EXISTS {partition};")
+                logger.info(f"Dropped expired partition {partition}")
+        default = _default_partition_name(self.table_name)
+        if _table_exists(cursor, default):
+            cursor.execute(f"DELETE FROM {default} WHERE timestamp_date < %s;", (oldest_day,))
+            if cursor.rowcount:
+                logger.info(f"Deleted {cursor.rowcount} expired rows from {default}")
+
+
+def _partition_name(table_name: str, day) -> str:
+    return f"{table_name}_p{day:%Y%m%d}"
+
+
+def _partition_day(table_name: str, partition: str):
+    try:
+        return datetime.strptime(partition[len(table_name) + 2 :], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _default_partition_name(table_name: str) -> str:
+    return f"{table_name}_default"
+
+
+def _create_partition(cursor, table_name: str, day) -> None:
+    partition = _partition_name(table_name, day)
+    if _table_exists(cursor, partition):
+        return
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    bounds = f"FROM ('{start:%Y-%m-%d %H:%M:%S}+00') TO ('{end:%Y-%m-%d %H:%M:%S}+00')"
+    default = _default_partition_name(table_name)
+    if not _table_exists(cursor, default):
+        cursor.execute(f"CREATE TABLE {partition} PARTITION OF {table_name} FOR VALUES {bounds};")
+        return
+    # Строки этого дня, уже попавшие в партицию по умолчанию, переносятся в новую партицию:
+    # PostgreSQL не присоединяет партицию, диапазон которой пересекается с данными DEFAULT
+    cursor.execute(f"CREATE TABLE {partition} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE timestamp_date >= %s AND timestamp_date < %s RETURNING *
+        )
+        INSERT INTO {partition} SELECT * FROM moved;
+        """,
+        (start, end),
+    )
+    if cursor.rowcount:
+        logger.info(f"Moved {cursor.rowcount} rows from {default} to {partition}")
+    cursor.execute(f"ALTER TABLE {table_name} ATTACH PARTITION {partition} FOR VALUES {bounds};")
+
+
+def _table_exists(cursor, table_name: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name,))
+    return cursor.fetchone()[0]
@@ -0,0 +1,248 @@
+import fcntl
+import logging
+import os
+import pickle
+import struct
+import time
+from typing import Callable, List
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus локального спула записей в БД
+DB_SPOOL_BYTES = Gauge(
+    'db_spool_bytes', 'Bytes of DB rows spooled to local disk', ['table'], multiprocess_mode='livemax'
+)
+DB_SPOOL_ROWS_SPOOLED = Counter('db_spool_rows_spooled', 'Rows written to local spool', ['table'])
+DB_SPOOL_ROWS_REPLAYED = Counter('db_spool_rows_replayed', 'Rows replayed from local spool into DB', ['table'])
+DB_SPOOL_BYTES_DROPPED = Counter('db_spool_bytes_dropped', 'Spool bytes dropped over disk budget', ['table'])
+DB_SPOOL_ROWS_QUARANTINED = Counter(
+    'db_spool_rows_quarantined', 'Rows moved to dead-letter files after a permanent DB error', ['table']
+)
+
+_RECORD_LEN = struct.Struct("<I")
+_SEGMENT_SUFFIX = ".spool"
+_OFFSET_SUFFIX = ".offset"
+_DEAD_LETTER_SUFFIX = ".dead"
+
+
+class DiskSpool:
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        segment_max_bytes: int = 16 * 1024 * 1024,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+        fsync_secs: float = 1.0,
+    ) -> None:
+        """
+        Локальный сегментированный спул строк для записи в БД на время недоступности БД.
+
+        Пакеты строк дописываются в файлы-сегменты (запись: длина + pickle пакета),
+        fsync выполняется не чаще раза в fsync_secs. Воспроизведение идет по сегментам
+        в порядке их создания; прогресс внутри сегмента сохраняется в файле .offset,
+        поэтому после падения повторяется не более одного пакета. Активный сегмент
+        и воспроизводимые сегменты блокируются flock, так что несколько писателей
+        могут делить одну директорию. При превышении max_total_bytes удаляются
+        самые старые сегменты.
+
+        Пакеты, которые БД отвергает по постоянной причине (нарушение ограничений,
+        неверные данные), откладываются в файлы .dead в той же директории и не мешают
+        воспроизведению остальных. Формат записи тот же, поэтому после устранения
+        причины файл можно переименовать в .spool для повторного воспроизведения.
+
+        Args:
+            directory (str): директория сегментов.
+            name (str): имя спула в метриках (обычно имя таблицы).
+            segment_max_bytes (int): размер сегмента, после которого начинается новый.
+            max_total_bytes (int): бюджет диска на все сегменты и отложенные пакеты директории.
+            fsync_secs (float): максимальный интервал между fsync (в сек).
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fsync_secs = fsync_secs
+        os.makedirs(directory, exist_ok=True)
+        self._active = None  # файл активного сегмента этого писателя
+        self._active_path = None
+        self._last_fsync = 0.0
+        self._bytes = DB_SPOOL_BYTES.labels(name)
+        self._rows_spooled = DB_SPOOL_ROWS_SPOOLED.labels(name)
+        self._rows_replayed = DB_SPOOL_ROWS_REPLAYED.labels(name)
+        self._bytes_dropped = DB_SPOOL_BYTES_DROPPED.labels(name)
+        self._rows_quarantined = DB_SPOOL_ROWS_QUARANTINED.labels(name)
+        self._bytes.set(self._total_bytes())
+
+    def has_pending(self) -> bool:
+        """
+        Есть ли данные, которые этот писатель должен воспроизвести раньше новых строк.
+
+        Учитываются свой активный сегмент и сегменты, которые можно заблокировать;
+        активные сегменты других писателей общей директории не считаются.
+        """
+        if self._active is not None:
+            return True
+        return any(self._is_replayable(path) for path in self._segments())
+
+    def append(self, batch: List[tuple]) -> None:
+        """Дописывает пакет строк в активный сегмент."""
+        if self._active is None:
+            self._open_segment()
+        payload = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+        self._active.write(_RECORD_LEN.pack(len(payload)) + payload)
+        self._active.flush()
+        if time.monotonic() - self._last_fsync >= self.fsync_secs:
+            os.fsync(self._active.fileno())
+            self._last_fsync = time.monotonic()
+        self._rows_spooled.inc(len(batch))
+        if self._active.tell() >= self.segment_max_bytes:
+            self.rotate()
+        self._enforce_budget()
+        self._bytes.set(self._total_bytes())
+
+    def quarantine(self, batch: List[tuple]) -> str:
+        """Откладывает пакет, отвергнутый БД по постоянной причине, в отдельный файл .dead."""
+        path = os.path.join(self.directory, f"{time.time_ns():020d}_{os.getpid()}{_DEAD_LETTER_SUFFIX}")
+        payload = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(path, "wb") as file:
+            file.write(_RECORD_LEN.pack(len(payload)) + payload)
+            file.flush()
+            os.fsync(file.fileno())
+        self._rows_quarantined.inc(len(batch))
+        self._enforce_budget()
+        self._bytes.set(self._total_bytes())
+        return path
+
+    def rotate(self) -> None:
+        """Закрывает активный сегмент, делая его доступным для воспроизведения."""
+        if self._active is None:
+            return
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()  # закрытие файла снимает flock
+        self._active = None
+        self._active_path = None
+
+    def replay(self, write: Callable[[List[tuple]], None]) -> bool:
+        """
+        Воспроизводит сегменты по порядку через write (исключение останавливает воспроизведение).
+
+        Returns:
+            bool: True если все доступные сегменты воспроизведены.
+        """
+        self.rotate()
+        for path in self._segments():
+            if not self._replay_segment(path, write):
+                return False
+        self._bytes.set(self._total_bytes())
+        return True
+
+    def close(self) -> None:
+        self.rotate()
+
+    def _replay_segment(self, path: str, write: Callable[[List[tuple]], None]) -> bool:
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return True  # сегмент уже воспроизвел другой писатель
+        with file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True  # активный сегмент другого писателя
+            offset = self._read_offset(path)
+            file.seek(offset)
+            while True:
+                header = file.read(_RECORD_LEN.size)
+                if len(header) < _RECORD_LEN.size:
+                    break
+                payload = file.read(_RECORD_LEN.unpack(header)[0])
+                try:
+                    batch = pickle.loads(payload)
+                except Exception as error:  # недописанная при падении запись
+                    logger.error(f"Truncated record in spool segment {path}: {error}")
+                    break
+                try:
+                    write(batch)
+                except Exception as error:
+                    logger.warning(f"Spool replay paused: {error}")
+                    return False
+                offset = file.tell()
+                self._write_offset(path, offset)
+                self._rows_replayed.inc(len(batch))
+            self._remove_segment(path)
+        return True
+
+    def _open_segment(self) -> None:
+        name = f"{time.time_ns():020d}_{os.getpid()}{_SEGMENT_SUFFIX}"
+        self._active_path = os.path.join(self.directory, name)
+        self._active = open(self._active_path, "ab")
+        fcntl.flock(self._active.fileno(), fcntl.LOCK_EX)
+
+    def _segments(self) -> List[str]:
+        return self._files(_SEGMENT_SUFFIX)
+
+    def _files(self, *suffixes: str) -> List[str]:
+        # Имена начинаются с time_ns, поэтому сортировка по пути — это порядок создания
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(suffixes)
+        )
+
+    @staticmethod
+    def _is_replayable(path: str) -> bool:
+        try:
+            with open(path, "rb") as file:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (FileNotFoundError, BlockingIOError):
+            return False  # уже воспроизведен или заблокирован другим писателем
+        return True
+
+    def _total_bytes(self) -> int:
+        total = 0
+        for path in self._files(_SEGMENT_SUFFIX, _DEAD_LETTER_SUFFIX):
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _enforce_budget(self) -> None:
+        # Удаляем самые старые сегменты и отложенные пакеты (кроме активного сегмента),
+        # пока не уложимся в бюджет диска
+        total = self._total_bytes()
+        for path in self._files(_SEGMENT_SUFFIX, _DEAD_LETTER_SUFFIX):
+            if total <= self.max_total_bytes:
+                break
+            if path == self._active_path:
+                continue
+            size = os.path.getsize(path)
+            self._remove_segment(path)
+            total -= size
+            self._bytes_dropped.inc(size)
+            logger.error(f"Spool over disk budget, dropped segment {path} ({size} bytes)")
+
+    @staticmethod
+    def _read_offset(path: str) -> int:
+        try:
+            with open(path + _OFFSET_SUFFIX) as file:
+                return int(file.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _write_offset(path: str, offset: int) -> None:
+        tmp_path = path + _OFFSET_SUFFIX + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(str(offset))
+        os.replace(tmp_path, path + _OFFSET_SUFFIX)
+
+    @staticmethod
+    def _remove_segment(path: str) -> None:
+        for file_path in (path, path + _OFFSET_SUFFIX):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
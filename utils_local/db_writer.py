@@ -0,0 +1,314 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
+from prometheus_client import Counter, Gauge, Histogram
+
+from utils_local.db_pool import DBConnectionPool, connection_params, get_db_pool
+from utils_local.db_spool import DiskSpool
+from some_module.AppConfig import DbPoolConfig, DbWriterConfig
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus фонового писателя в БД
+DB_WRITER_QUEUE_DEPTH = Gauge(
+    'db_writer_queue_depth', 'Rows waiting to be written to DB', ['table'], multiprocess_mode='livesum'
+)
+DB_WRITER_FLUSH_TIME = Histogram('db_writer_flush_seconds', 'Batch flush latency', ['table'])
+DB_WRITER_ROWS_WRITTEN = Counter('db_writer_rows_written', 'Rows written to DB', ['table'])
+DB_WRITER_ROWS_DROPPED = Counter('db_writer_rows_dropped', 'Rows dropped by DB writer', ['table'])
+
+# Ошибки доступности БД: пакет повторяется, а затем уходит в спул. Остальные ошибки (нарушение
+# ограничений, неверные данные, нет партиции, сбой миграции) постоянны для пакета, и он откладывается
+CONNECTIVITY_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pg_pool.PoolError)
+
+# Подписчики на успешную запись пакета: функции от (имя таблицы, колонки, пакет),
+# например сброс кэша ответов API по file_id
+_commit_listeners: List[Callable] = []
+
+
+def add_commit_listener(listener: Callable) -> None:
+    """Регистрирует функцию, вызываемую после каждого закоммиченного пакета."""
+    _commit_listeners.append(listener)
+
+
+def _notify_commit(table_name: str, columns: List[str], batch: List[tuple]) -> None:
+    for listener in _commit_listeners:
+        try:
+            listener(table_name, columns, batch)
+        except Exception as error:
+            logger.error(f"Commit listener failed for {table_name}: {error}")
+
+
+class AsyncBatchWriter:
+    def __init__(
+        self,
+        db_pool: DBConnectionPool,
+        table_name: str,
+        columns: Sequence[str],
+        batch_size: int = 100,
+        flush_secs: float = 1.0,
+        max_queue: int = 10000,
+        max_retries: int = 3,
+        retry_backoff_secs: float = 0.5,
+        on_flush: Optional[Callable] = None,
+        maintenance: Optional[Callable] = None,
+        maintenance_secs: float = 3600.0,
+        prepare: Optional[Callable] = None,
+        spool: Optional[DiskSpool] = None,
+        replay_secs: float = 5.0,
+    ) -> None:
+        """
+        Фоновая пакетная запись строк в таблицу PostgreSQL.
+
+        Строки кладутся в ограниченную очередь в памяти и пишутся отдельным потоком
+        многострочным INSERT при наборе batch_size строк или раз в flush_secs секунд.
+        Поток обработки кадров никогда не ждет БД: при переполнении очереди строка
+        отбрасывается (с учетом в метрике db_writer_rows_dropped).
+
+        Если задан spool, пакет, который не удалось записать после всех попыток,
+        сохраняется на локальный диск. Пока в спуле есть данные, новые пакеты тоже
+        дописываются в спул (чтобы сохранить порядок), а раз в replay_secs поток
+        пробует воспроизвести спул в БД. В спул попадают только пакеты, не записанные из-за
+        недоступности БД (CONNECTIVITY_ERRORS); пакет, отвергнутый по другой причине, не повторяется
+        и откладывается в файл .dead спула (без спула — отбрасывается), чтобы не блокировать запись.
+
+        Args:
+            db_pool (DBConnectionPool): пул подключений, из которого берется подключение на время записи пакета.
+            table_name (str): имя таблицы для записи.
+            columns (Sequence[str]): колонки таблицы в порядке значений строки.
+            batch_size (int): максимальный размер пакета.
+            flush_secs (float): максимальное время ожидания набора пакета (в сек).
+            max_queue (int): максимальное число строк в очереди.
+            max_retries (int): число повторных попыток записи пакета.
+            retry_backoff_secs (float): базовая пауза между попытками (удваивается).
+            on_flush (Optional[Callable]): функция от (курсор, пакет), выполняемая в той же
+                транзакции после вставки пакета (например, обновление сводных таблиц).
+            maintenance (Optional[Callable]): обслуживание таблицы от подключения
+                (например, создание партиций), выполняется в потоке записи.
+            maintenance_secs (float): период обслуживания (в сек).
+            prepare (Optional[Callable]): подготовка схемы от подключения (миграции),
+                выполняется в потоке записи перед первой записью, пока не завершится успешно.
+            spool (Optional[DiskSpool]): локальный спул на время недоступности БД.
+            replay_secs (float): период попыток воспроизведения спула (в сек).
+        """
+        self.db_pool = db_pool
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.max_retries = max_retries
+        self.retry_backoff_secs = retry_backoff_secs
+        self.on_flush = on_flush
+        self.maintenance = maintenance
+        self.maintenance_secs = maintenance_secs
+        self._last_maintenance = time.monotonic()
+        self.prepare = prepare
+        self._prepared = prepare is None
+        self.spool = spool
+        self.replay_secs = replay_secs
+        self._last_replay = 0.0
+        self._db_unavailable = False  # последняя попытка записи не дошла до БД
+        self.insert_query = f"INSERT INTO {table_name} ({', '.join(self.columns)}) VALUES %s"
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._queue_depth = DB_WRITER_QUEUE_DEPTH.labels(table_name)
+        self._flush_time = DB_WRITER_FLUSH_TIME.labels(table_name)
+        self._rows_written = DB_WRITER_ROWS_WRITTEN.labels(table_name)
+        self._rows_dropped = DB_WRITER_ROWS_DROPPED.labels(table_name)
+        self._thread = threading.Thread(target=self._run, name=f"db_writer_{table_name}", daemon=True)
+        self._thread.start()
+
+    def write(self, row: tuple) -> bool:
+        """Ставит строку в очередь записи, не блокируясь. Возвращает False если строка отброшена."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._rows_dropped.inc()
+            logger.warning(f"DB writer queue for {self.table_name} is full, row dropped")
+            return False
+        self._queue_depth.set(self._queue.qsize())
+        return True
+
+    def close(self, timeout: float = 30.0) -> None:
+        """
+        Дописывает оставшиеся в очереди строки и останавливает поток записи.
+
+        После остановки повторы записи прекращаются: со спулом пакет после первой ошибки
+        доступности БД уходит на диск, а следующие пакеты пишутся в спул без попыток,
+        поэтому время остановки ограничено парой попыток подключения.
+        """
+        self._stop_event.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(
+                f"DB writer for {self.table_name} did not stop in {timeout:.0f} s, "
+                f"{self._queue.qsize()} queued rows may be lost"
+            )
+
+    def _run(self) -> None:
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if self.spool is not None and self.spool.has_pending():
+                if batch:
+                    self.spool.append(batch)
+                if not self._stop_event.is_set() and time.monotonic() - self._last_replay >= self.replay_secs:
+                    self._replay()
+            elif batch:
+                self._flush(batch)
+            if self.maintenance is not None and time.monotonic() - self._last_maintenance >= self.maintenance_secs:
+                self._maintain()
+        if self.spool is not None:
+            # Остаток очереди уже в спуле: одна попытка воспроизведения, если БД была доступна,
+            # иначе он дождется следующего запуска
+            if not self._db_unavailable and self.spool.has_pending():
+                self._replay()
+            self.spool.close()
+
+    def _collect_batch(self) -> List[tuple]:
+        # Набираем пакет до batch_size строк или до истечения flush_secs
+        batch = []
+        deadline = time.monotonic() + self.flush_secs
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or (self._stop_event.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(timeout, 0.1)))
+            except queue.Empty:
+                continue
+        self._queue_depth.set(self._queue.qsize())
+        return batch
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        t_start = time.monotonic()
+        with self.db_pool.connection() as connection:
+            if not self._prepared:
+                self.prepare(connection)
+                self._prepared = True
+            with connection.cursor() as cursor:
+                execute_values(cursor, self.insert_query, batch, page_size=self.batch_size)
+                if self.on_flush is not None:
+                    self.on_flush(cursor, batch)
+            connection.commit()
+        self._flush_time.observe(time.monotonic() - t_start)
+        self._rows_written.inc(len(batch))
+        _notify_commit(self.table_name, self.columns, batch)
+        logger.debug(f"Flushed {len(batch)} rows into {self.table_name}")
+
+    def _flush(self, batch: List[tuple]) -> None:
+        for attempt in range(self.max_retries + 1):
+            # При остановке со спулом не ждем повторов: пакет сразу уходит на диск
+            if attempt > 0 and self._stop_event.is_set() and self.spool is not None:
+                break
+            try:
+                self._write_batch(batch)
+                self._db_unavailable = False
+                return
+            except CONNECTIVITY_ERRORS as error:
+                self._db_unavailable = True
+                logger.error(
+                    f"Error while inserting {len(batch)} rows into {self.table_name} "
+                    f"(attempt {attempt + 1}/{self.max_retries + 1}): {error}"
+                )
+                if attempt < self.max_retries:
+                    self._stop_event.wait(self.retry_backoff_secs * 2**attempt)
+            except (Exception, psycopg2.Error) as error:
+                self._quarantine(batch, error)
+                return
+        if self.spool is not None:
+            self.spool.append(batch)
+            self._last_replay = time.monotonic()
+            logger.warning(f"DB unavailable, {len(batch)} rows for {self.table_name} spooled to disk")
+        else:
+            self._rows_dropped.inc(len(batch))
+
+    def _replay(self) -> None:
+        # Воспроизведение спула по порядку; при недоступности БД повторим через replay_secs
+        self._last_replay = time.monotonic()
+        self._db_unavailable = not self.spool.replay(self._replay_batch)
+        if not self._db_unavailable:
+            logger.info(f"Spool for {self.table_name} replayed into DB")
+
+    def _replay_batch(self, batch: List[tuple]) -> None:
+        # Только ошибки доступности БД останавливают воспроизведение, отвергнутый пакет откладывается
+        try:
+            self._write_batch(batch)
+        except CONNECTIVITY_ERRORS:
+            raise
+        except (Exception, psycopg2.Error) as error:
+            self._quarantine(batch, error)
+
+    def _quarantine(self, batch: List[tuple], error: Exception) -> None:
+        if self.spool is not None:
+            path = self.spool.quarantine(batch)
+            logger.error(f"{len(batch)} rows rejected by {self.table_name}, moved to {path}: {error}")
+        else:
+            self._rows_dropped.inc(len(batch))
+            logger.error(f"{len(batch)} rows rejected by {self.table_name}, dropped: {error}")
+
+    def _maintain(self) -> None:
+        self._last_maintenance = time.monotonic()
+        if not self._prepared:
+            return
+        try:
+            with self.db_pool.connection() as connection:
+                self.maintenance(connection)
+        except (Exception, psycopg2.Error) as error:
+            logger.error(f"Error while maintaining {self.table_name}: {error}")
+
+
+def writer_from_config(
+    config_db: DbWriterConfig,
+    config_pool: DbPoolConfig,
+    columns: Sequence[str],
+    **writer_settings,
+) -> AsyncBatchWriter:
+    """
+    Фоновый писатель узла записи в БД по его секции конфигурации.
+
+    Пул подключений общий для процесса (узлы с одинаковым connection_info делят один пул),
+    локальный спул создается, если задан spool_dir. writer_settings — параметры
+    AsyncBatchWriter, специфичные для узла (prepare, on_flush, maintenance, ...).
+    """
+    # Создание пула не требует доступной БД: обработка видео не зависит от ее доступности.
+    # Отдельное имя в метриках: серии пула API (default) и писателей не смешиваются
+    db_pool = get_db_pool(
+        connection_params(config_db.connection_info),
+        name="db_writer",
+        minconn=config_pool.minconn,
+        maxconn=config_pool.maxconn,
+        checkout_timeout=config_pool.checkout_timeout,
+        health_check_secs=config_pool.health_check_secs,
+        connect_timeout=config_pool.connect_timeout,
+    )
+
+    # Локальный спул: пока БД недоступна, строки пишутся на диск и потом воспроизводятся по порядку
+    spool = None
+    if config_db.spool_dir:
+        spool = DiskSpool(
+            config_db.spool_dir,
+            name=config_db.table_name,
+            segment_max_bytes=config_db.spool_segment_mb * 1024 * 1024,
+            max_total_bytes=config_db.spool_max_mb * 1024 * 1024,
+            fsync_secs=config_db.spool_fsync_secs,
+        )
+
+    return AsyncBatchWriter(
+        db_pool=db_pool,
+        table_name=config_db.table_name,
+        columns=columns,
+        batch_size=config_db.batch_size,
+        flush_secs=config_db.flush_secs,
+        max_queue=config_db.max_queue,
+        max_retries=config_db.max_retries,
+        spool=spool,
+        replay_secs=config_db.spool_replay_secs,
+        **writer_settings,
+    )
@@ -0,0 +1,235 @@
+import csv
+import io
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Iterator, List, Optional, Sequence
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import pyarrow as pa
+except ImportError:  # колоночный формат выгрузки доступен только при установленном pyarrow
+    pa = None
+
+from utils_local.db_pool import DBConnectionPool
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def available_formats() -> List[str]:
+    return [name for name in EXPORT_FORMATS if name != "arrow" or pa is not None]
+
+
+# Типы PostgreSQL (OID) -> типы Arrow; jsonb и прочие неизвестные типы выгружаются строками
+_PG_TO_ARROW = {
+    16: "bool_",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    700: "float32",
+    701: "float64",
+    1114: "timestamp_naive",
+    1184: "timestamp_utc",
+}
+
+
+class RowChunks:
+    def __init__(
+        self,
+        db_pool: DBConnectionPool,
+        table_name: str,
+        columns: Sequence[str],
+        start: datetime,
+        end: datetime,
+        file_id: Optional[str] = None,
+        chunk_rows: int = 5000,
+    ) -> None:
+        """
+        Строки таблицы за интервал [start, end), читаемые порциями через серверный курсор.
+
+        Фильтр по timestamp_date отсекает лишние дневные партиции, а именованный курсор
+        держит результат на стороне PostgreSQL, так что в памяти одновременно не больше
+        chunk_rows строк независимо от длины интервала. После начала итерации в
+        type_codes лежат OID типов колонок результата.
+        """
+        self.db_pool = db_pool
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.params = {"start": start, "end": end, "file_id": file_id}
+        self.query = f"""
+        SELECT {', '.join(self.columns)} FROM {table_name}
+        WHERE timestamp_date >= %(start)s AND timestamp_date < %(end)s
+          AND (%(file_id)s::text IS NULL OR file_id = %(file_id)s)
+        ORDER BY timestamp_date
+        """
+        self.type_codes: Optional[List[int]] = None
+
+    def __iter__(self) -> Iterator[List[tuple]]:
+        with self.db_pool.connection() as connection:
+            with connection.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = self.chunk_rows
+                cursor.execute(self.query, self.params)
+                while True:
+                    rows = cursor.fetchmany(self.chunk_rows)
+                    if self.type_codes is None and cursor.description is not None:
+                        self.type_codes = [column.type_code for column in cursor.description]
+                    if not rows:
+                        break
+                    yield rows
+            connection.rollback()  # только чтение, закрываем транзакцию курсора
+
+
+class ExportSlot:
+    def __init__(self, semaphore: threading.BoundedSemaphore) -> None:
+        self._semaphore = semaphore
+        self._lock = threading.Lock()
+        self._released = False
+
+    def release(self) -> None:
+        """Освобождает место выгрузки; повторные вызовы ничего не делают."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._semaphore.release()
+
+
+class ExportSlots:
+    def __init__(self, max_concurrent: int) -> None:
+        """
+        Ограничение числа одновременных выгрузок.
+
+        Выгрузка держит подключение на все время потокового ответа, поэтому число мест
+        совпадает с размером отдельного пула выгрузок: ожидание подключения исключено,
+        а лишняя выгрузка сразу получает отказ.
+        """
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self) -> Optional[ExportSlot]:
+        """Место под выгрузку или None, если все места заняты (не блокируется)."""
+        if not self._semaphore.acquire(blocking=False):
+            return None
+        return ExportSlot(self._semaphore)
+
+
+class ExportBody:
+    def __init__(self, stream: Iterator[bytes], slot: ExportSlot) -> None:
+        """
+        Тело потокового ответа выгрузки для StreamingResponse.
+
+        Порции кодируются в пуле потоков; курсор, подключение и место выгрузки освобождаются
+        сразу по завершению потока, ошибке или отключению клиента, без ожидания сборки мусора.
+        Для случая отключения close передается в StreamingResponse как background.
+        """
+        self._stream = stream
+        self._slot = slot
+        self.chunks = self._iterate()
+
+    async def close(self) -> None:
+        await self.chunks.aclose()
+        self._slot.release()  # поток мог так и не начаться
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                # Чтение порции не прерывается отменой: выполняющийся в потоке генератор нельзя закрыть
+                with anyio.CancelScope(shield=True):
+                    chunk = await run_in_threadpool(next, self._stream, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self._stream.close)
+            self._slot.release()
+
+
+def _to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def encode_csv(columns: Sequence[str], chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([_to_text(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(columns: Sequence[str], chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), separators=(",", ":"), default=_json_default) + "\n" for row in rows
+        ).encode()
+
+
+def _arrow_type(type_code: int):
+    name = _PG_TO_ARROW.get(type_code)
+    if name == "timestamp_utc":
+        return pa.timestamp("us", tz="UTC")
+    if name == "timestamp_naive":
+        return pa.timestamp("us")
+    return getattr(pa, name)() if name else pa.string()
+
+
+def _arrow_schema(columns: Sequence[str], type_codes: Sequence[int]):
+    return pa.schema([(name, _arrow_type(type_code)) for name, type_code in zip(columns, type_codes)])
+
+
+def encode_arrow(columns: Sequence[str], chunks: RowChunks) -> Iterator[bytes]:
+    """Поток Arrow IPC: одна запись RecordBatch на порцию строк, типы колонок — по типам PostgreSQL."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for rows in chunks:
+        if writer is None:
+            schema = _arrow_schema(columns, chunks.type_codes)
+            writer = pa.ipc.new_stream(sink, schema)
+        arrays = [
+            pa.array(
+                [_to_text(value) for value in values] if pa.types.is_string(field.type) else values,
+                type=field.type,
+            )
+            for field, values in zip(schema, zip(*rows))
+        ]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield _drain(sink)
+    if writer is None and chunks.type_codes is not None:
+        # Пустой результат: поток только со схемой
+        writer = pa.ipc.new_stream(sink, _arrow_schema(columns, chunks.type_codes))
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    payload = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return payload
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "arrow": encode_arrow}
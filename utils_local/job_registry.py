@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobState:
+    __slots__ = (
+        "file_id",
+        "filename",
+        "status",
+        "worker_id",
+        "frames_done",
+        "total_frames",
+        "fps",
+        "submitted_at",
+        "started_at",
+        "finished_at",
+        "result",
+        "video",
+        "version",
+        "_last_progress",
+    )
+
+    def __init__(self, file_id: str, filename: Optional[str], video: Optional[dict] = None) -> None:
+        self.file_id = file_id
+        self.filename = filename
+        self.status = QUEUED
+        self.worker_id = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.fps = 0.0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.video = video  # Метаданные видео из проверки загрузки
+        self.version = 0  # растет при каждом изменении (для SSE)
+        self._last_progress = None  # (время, кадров) предыдущего обновления прогресса
+
+    def to_dict(self) -> dict:
+        eta_secs = None
+        if self.status == PROCESSING and self.fps > 0 and self.total_frames > self.frames_done:
+            eta_secs = (self.total_frames - self.frames_done) / self.fps
+        return {
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "status": self.status,
+            "frames_done": self.frames_done,
+            "total_frames": self.total_frames,
+            "progress": self.frames_done / self.total_frames if self.total_frames else None,
+            "fps": round(self.fps, 2),
+            "eta_secs": None if eta_secs is None else round(eta_secs, 1),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "video": self.video,
+            "version": self.version,
+        }
+
+
+class JobRegistry:
+    def __init__(self, max_finished: int = 1000, fps_smoothing: float = 0.3) -> None:
+        """
+        Реестр задач обработки в памяти процесса API.
+
+        Обработчики публикуют прогресс (кадров обработано из общего числа), реестр считает
+        сглаженный fps (EWMA) и оценку времени завершения. Эндпоинты прогресса читают
+        только реестр и никогда не обращаются к PostgreSQL. Хранится не более
+        max_finished завершенных задач (самые старые удаляются).
+
+        Args:
+            max_finished (int): сколько завершенных задач хранить.
+            fps_smoothing (float): вес нового замера fps в EWMA.
+        """
+        self.max_finished = max_finished
+        self.fps_smoothing = fps_smoothing
+        self._jobs: Dict[str, JobState] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file_id: str, filename: Optional[str] = None, video: Optional[dict] = None) -> None:
+        with self._lock:
+            self._jobs[file_id] = JobState(file_id, filename, video)
+
+    def start(self, file_id: str, worker_id: int, filename: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.setdefault(file_id, JobState(file_id, filename))
+            job.status = PROCESSING
+            job.worker_id = worker_id
+            job.started_at = time.time()
+            job._last_progress = (time.monotonic(), 0)
+            job.version += 1
+
+    def progress(self, file_id: str, frames_done: int, total_frames: int) -> None:
+        with self._lock:
+            job = self._jobs.get(file_id)
+            if job is None:
+                return
+            now = time.monotonic()
+            if job._last_progress is not None:
+                last_time, last_frames = job._last_progress
+                if now > last_time and frames_done >= last_frames:
+                    fps = (frames_done - last_frames) / (now - last_time)
+                    job.fps = fps if job.fps == 0 else job.fps + self.fps_smoothing * (fps - job.fps)
+            job._last_progress = (now, frames_done)
+            job.frames_done = frames_done
+            job.total_frames = total_frames
+            job.version += 1
+
+    def finish(self, file_id: str, status: str, result: Optional[dict] = None) -> None:
+        with self._lock:
+            job = self._jobs.setdefault(file_id, JobState(file_id, None))
+            job.status = status
+            job.result = result
+            job.finished_at = time.time()
+            job.version += 1
+            self._finished[file_id] = None
+            while len(self._finished) > self.max_finished:
+                old_file_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_file_id, None)
+
+    def get(self, file_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(file_id)
+            return None if job is None else job.to_dict()
+
@@ -0,0 +1,83 @@
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ODMatrixCounter:
+    def __init__(self, bucket_secs: float, max_buckets: int) -> None:
+        """
+        Потоковый счетчик матрицы корреспонденций (origin–destination) по временным корзинам.
+
+        Каждое событие завершения трека стоит O(1): инкремент счетчика пары
+        (дорога въезда, дорога выезда) в корзине, куда попадает время последнего
+        обнаружения трека. Хранится не более max_buckets последних корзин.
+
+        Args:
+            bucket_secs (float): размер временной корзины в секундах.
+            max_buckets (int): сколько последних корзин держать в памяти.
+        """
+        self.bucket_secs = bucket_secs
+        self.max_buckets = max_buckets
+        # {номер корзины: {дорога въезда: {дорога выезда: число треков}}}
+        self.buckets: Dict[int, Dict[int, Dict[int, int]]] = {}
+        self.unresolved: Dict[int, int] = {}  # треки без определенной дороги выезда по корзинам
+        self.dropped = 0  # события, пришедшие в уже вытесненную корзину
+        self._snapshot = None  # кэш снимка, сбрасывается при изменении
+
+    def add(self, start_road: Optional[int], end_road: Optional[int], timestamp: float) -> None:
+        """Учитывает завершившийся трек.
+
+        Args:
+            start_road (Optional[int]): номер дороги въезда (трек без нее не учитывается).
+            end_road (Optional[int]): номер дороги выезда (None — выезд не определен).
+            timestamp (float): время последнего обнаружения трека (в сек).
+        """
+        if start_road is None:
+            return
+        bucket = int(timestamp // self.bucket_secs)
+        if bucket not in self.buckets and not self._open_bucket(bucket):
+            self.dropped += 1
+            return
+
+        self._snapshot = None
+        if end_road is None:
+            self.unresolved[bucket] = self.unresolved.get(bucket, 0) + 1
+            return
+        flows = self.buckets[bucket].setdefault(start_road, {})
+        flows[end_road] = flows.get(end_road, 0) + 1
+
+    def snapshot(self) -> dict:
+        """Возвращает сериализуемое в JSON представление удерживаемых корзин (кэшируется до следующего add).
+
+        Returns:
+            dict: {"bucket_secs": ..., "buckets": [{"bucket_start", "flows", "unresolved"}, ...]}
+        """
+        if self._snapshot is None:
+            self._snapshot = {
+                "bucket_secs": self.bucket_secs,
+                "buckets": [
+                    {
+                        "bucket_start": bucket * self.bucket_secs,
+                        "flows": {
+                            str(start): {str(end): count for end, count in ends.items()}
+                            for start, ends in self.buckets[bucket].items()
+                        },
+                        "unresolved": self.unresolved.get(bucket, 0),
+                    }
+                    for bucket in sorted(self.buckets)
+                ],
+            }
+        return self._snapshot
+
+    def _open_bucket(self, bucket: int) -> bool:
+        # Заводим новую корзину, вытесняя самую старую при переполнении
+        if len(self.buckets) >= self.max_buckets:
+            oldest = min(self.buckets)  # не более max_buckets ключей
+            if bucket < oldest:
+                return False
+            self.buckets.pop(oldest)
+            self.unresolved.pop(oldest, None)
+            logger.debug(f"OD bucket {oldest} evicted")
+        self.buckets[bucket] = {}
+        return True
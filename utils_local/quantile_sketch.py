@@ -0,0 +1,224 @@
+import math
+from typing import Dict, Iterable, Optional
+
+# Квантили сводки времени в кадре по дорогам
+SUMMARY_QUANTILES = {"p50": 0.5, "p90": 0.9}
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.02, max_bins: int = 512) -> None:
+        """
+        Потоковый квантильный скетч с относительной точностью (логарифмические корзины, как в DDSketch).
+
+        Память ограничена max_bins корзинами (при переполнении сливаются самые младшие),
+        скетчи с одинаковой точностью складываются без потерь — их можно объединять
+        по временным корзинам и между воркерами.
+
+        Args:
+            relative_accuracy (float): относительная ошибка оценки квантиля.
+            max_bins (int): максимальное число корзин.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = 1e-3  # значения меньше считаются нулевыми (в сек)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value < self.min_value:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Добавляет в скетч все значения другого скетча с той же точностью."""
+        if other.gamma != self.gamma:
+            raise ValueError("Sketches with different relative accuracy can't be merged")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля q (0..1), None для пустого скетча."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        accumulated = self.zero_count
+        if accumulated > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            accumulated += self.bins[key]
+            if accumulated > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "bins": {str(key): count for key, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, max_bins: int = 512) -> "QuantileSketch":
+        sketch = cls(relative_accuracy=data["relative_accuracy"], max_bins=max_bins)
+        sketch.bins = {int(key): count for key, count in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+    def _collapse(self) -> None:
+        # Сливаем самые младшие корзины в одну: точность теряется только для малых значений
+        keys = sorted(self.bins)
+        n_collapse = len(keys) - self.max_bins + 1
+        target = keys[n_collapse]
+        for key in keys[:n_collapse]:
+            self.bins[target] += self.bins.pop(key)
+
+
+class RoadTimeSketches:
+    def __init__(self, bucket_secs: float, max_buckets: int, relative_accuracy: float) -> None:
+        """
+        Распределения времени в кадре (dwell) и времени проезда от дороги въезда (travel)
+        по дорогам въезда, разбитые на временные корзины.
+
+        Args:
+            bucket_secs (float): размер временной корзины в секундах.
+            max_buckets (int): сколько последних корзин держать в памяти.
+            relative_accuracy (float): относительная точность квантильных скетчей.
+        """
+        self.bucket_secs = bucket_secs
+        self.max_buckets = max_buckets
+        self.relative_accuracy = relative_accuracy
+        # {номер корзины: {дорога въезда: {"dwell": скетч, "travel": скетч}}}
+        self.buckets: Dict[int, Dict[int, Dict[str, QuantileSketch]]] = {}
+        self._snapshot = None  # кэш сводки, сбрасывается при изменении
+        self._serialized = None  # кэш сериализованных скетчей, сбрасывается при изменении
+
+    def add(self, start_road: Optional[int], dwell: float, travel: float, timestamp: float) -> None:
+        """Учитывает завершившийся трек (трек без дороги въезда не учитывается)."""
+        if start_road is None:
+            return
+        bucket = int(timestamp // self.bucket_secs)
+        if bucket not in self.buckets:
+            if len(self.buckets) >= self.max_buckets:
+                oldest = min(self.buckets)  # не более max_buckets ключей
+                if bucket < oldest:
+                    return
+                self.buckets.pop(oldest)
+            self.buckets[bucket] = {}
+        sketches = self.buckets[bucket].get(start_road)
+        if sketches is None:
+            sketches = {
+                "dwell": QuantileSketch(self.relative_accuracy),
+                "travel": QuantileSketch(self.relative_accuracy),
+            }
+            self.buckets[bucket][start_road] = sketches
+        sketches["dwell"].add(dwell)
+        sketches["travel"].add(travel)
+        self._snapshot = None
+        self._serialized = None
+
+    def merged(self) -> Dict[int, Dict[str, QuantileSketch]]:
+        """Скетчи по дорогам, объединенные по всем удерживаемым корзинам."""
+        merged: Dict[int, Dict[str, QuantileSketch]] = {}
+        for roads in self.buckets.values():
+            for road, sketches in roads.items():
+                target = merged.setdefault(
+                    road,
+                    {
+                        "dwell": QuantileSketch(self.relative_accuracy),
+                        "travel": QuantileSketch(self.relative_accuracy),
+                    },
+                )
+                target["dwell"].merge(sketches["dwell"])
+                target["travel"].merge(sketches["travel"])
+        return merged
+
+    def snapshot(self) -> dict:
+        """Медиана и p90 времени по дорогам въезда за удерживаемое окно (в сек)."""
+        if self._snapshot is None:
+            self._snapshot = summarize(self.merged())
+        return self._snapshot
+
+    def serialized(self) -> dict:
+        """Сериализуемые в JSON скетчи удерживаемых корзин (для сохранения и последующего объединения).
+
+        Returns:
+            dict: {"bucket_secs": ..., "buckets": [{"bucket_start", "roads": {дорога: {вид: скетч}}}, ...]}
+        """
+        if self._serialized is None:
+            self._serialized = {
+                "bucket_secs": self.bucket_secs,
+                "buckets": [
+                    {
+                        "bucket_start": bucket * self.bucket_secs,
+                        "roads": {
+                            str(road): {kind: sketch.to_dict() for kind, sketch in sketches.items()}
+                            for road, sketches in self.buckets[bucket].items()
+                        },
+                    }
+                    for bucket in sorted(self.buckets)
+                ],
+            }
+        return self._serialized
+
+
+def summarize(merged: Dict[int, Dict[str, QuantileSketch]]) -> dict:
+    """Число треков, медиана и p90 по дорогам въезда и видам времени."""
+    return {
+        str(road): {
+            kind: {
+                "count": sketch.count,
+                **{name: sketch.quantile(q) for name, q in SUMMARY_QUANTILES.items()},
+            }
+            for kind, sketch in sketches.items()
+        }
+        for road, sketches in sorted(merged.items())
+    }
+
+
+def merge_serialized(
+    snapshots: Iterable[dict], start: Optional[float] = None, end: Optional[float] = None
+) -> Dict[int, Dict[str, QuantileSketch]]:
+    """
+    Объединяет сохраненные снимки RoadTimeSketches.serialized() по корзинам в интервале [start, end).
+
+    Корзина повторяется в нескольких снимках и в каждом следующем содержит все предыдущие значения,
+    поэтому берется ее последняя версия (снимки передаются в порядке времени), а затем корзины складываются.
+
+    Args:
+        snapshots (Iterable[dict]): снимки в порядке времени видео.
+        start (Optional[float]): начало интервала по времени видео (в сек), None — без ограничения.
+        end (Optional[float]): конец интервала по времени видео (в сек), None — без ограничения.
+
+    Returns:
+        Dict[int, Dict[str, QuantileSketch]]: {дорога въезда: {"dwell": скетч, "travel": скетч}}
+    """
+    latest: Dict[float, dict] = {}
+    for snapshot in snapshots:
+        for bucket in snapshot["buckets"]:
+            latest[bucket["bucket_start"]] = bucket["roads"]
+    merged: Dict[int, Dict[str, QuantileSketch]] = {}
+    for bucket_start, roads in latest.items():
+        if (start is not None and bucket_start < start) or (end is not None and bucket_start >= end):
+            continue
+        for road, sketches in roads.items():
+            target = merged.setdefault(int(road), {})
+            for kind, data in sketches.items():
+                sketch = QuantileSketch.from_dict(data)
+                if kind in target:
+                    target[kind].merge(sketch)
+                else:
+                    target[kind] = sketch
+    return merged
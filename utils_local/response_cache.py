@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+from prometheus_client import Counter
+
+# Метрики Prometheus кэша ответов API
+RESPONSE_CACHE_HITS = Counter('response_cache_hits', 'API responses served from cache', ['endpoint'])
+RESPONSE_CACHE_MISSES = Counter('response_cache_misses', 'API responses computed on cache miss', ['endpoint'])
+
+
+class CachedResponse:
+    __slots__ = ("body", "status_code", "etag", "expires", "tags")
+
+    def __init__(self, body: bytes, status_code: int, etag: str, expires: float, tags: Set[str]) -> None:
+        self.body = body
+        self.status_code = status_code
+        self.etag = etag
+        self.expires = expires
+        self.tags = tags
+
+
+class ResponseCache:
+    def __init__(self, ttl_secs: float = 5.0, max_entries: int = 1024) -> None:
+        """
+        Кэш ответов в памяти процесса с TTL и вытеснением по LRU.
+
+        Ответ хранится уже сериализованным в JSON вместе с ETag (хэш тела), поэтому
+        попадание в кэш не требует ни запроса к БД, ни повторной сериализации.
+        Записи помечаются тегами (например, file:<file_id>) и сбрасываются по тегу,
+        когда в БД появляются новые данные.
+
+        Args:
+            ttl_secs (float): время жизни записи (в сек).
+            max_entries (int): максимальное число записей, самые давно использованные вытесняются.
+        """
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._by_tag: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        endpoint = key[0] if isinstance(key, tuple) else str(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                RESPONSE_CACHE_MISSES.labels(endpoint).inc()
+                return None
+            self._entries.move_to_end(key)
+        RESPONSE_CACHE_HITS.labels(endpoint).inc()
+        return entry
+
+    def put(self, key: Hashable, content: Any, status_code: int = 200, tags: Iterable[str] = ()) -> CachedResponse:
+        body = json.dumps(content, separators=(",", ":"), default=str).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = CachedResponse(body, status_code, etag, time.monotonic() + self.ttl_secs, set(tags))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, tag: str) -> None:
+        """Сбрасывает все записи с тегом tag."""
+        with self._lock:
+            for key in list(self._by_tag.get(tag, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+logger = logging.getLogger(__name__)
+
+
+def parse_roads_info(data_json: dict) -> Dict[str, List[int]]:
+    """Приводит json с координатами дорог к формату {номер дороги: [x1, y1, x2, y2, ...]}."""
+    roads_info = {key: [int(value) for value in values] for key, values in data_json.items()}
+    for key, values in roads_info.items():
+        int(key)  # номер дороги обязан быть числом
+        if len(values) < 6 or len(values) % 2:
+            raise ValueError(f"Road {key}: polygon must contain at least 3 (x, y) points")
+    return roads_info
+
+
+class RoadsGeometry:
+    def __init__(self, roads_info: Dict[str, List[int]], version: int) -> None:
+        """
+        Предварительно скомпилированная геометрия дорог одной версии конфигурации.
+
+        Полигоны shapely подготавливаются один раз, поэтому поиск дороги для центров
+        bbox не пересобирает их на каждом кадре. Маски для заливки строятся лениво
+        под конкретный размер кадра и кэшируются.
+
+        Args:
+            roads_info (Dict[str, List[int]]): словарь полигонов дорог.
+            version (int): номер версии конфигурации дорог.
+        """
+        self.roads_info = roads_info
+        self.version = version
+        self.road_ids = [int(key) for key in roads_info]
+        # Точки полигонов в формате cv2.polylines
+        self.points = {
+            int(key): np.array(values, np.int32).reshape((-1, 1, 2))
+            for key, values in roads_info.items()
+        }
+        self.polygons = {
+            int(key): Polygon([(values[i], values[i + 1]) for i in range(0, len(values), 2)])
+            for key, values in roads_info.items()
+        }
+        for polygon in self.polygons.values():
+            shapely.prepare(polygon)
+        self.centroids = {road_id: self._centroid(points) for road_id, points in self.points.items()}
+        self._masks: Dict[Tuple[int, int], Dict[int, np.ndarray]] = {}
+
+    def find_roads(self, tracked_xyxy: List[List[float]]) -> List[Optional[int]]:
+        """Определяет номер дороги, в полигоне которой лежит центр каждого bbox.
+
+        Args:
+            tracked_xyxy (List[List[float]]): bbox в формате [x1, y1, x2, y2].
+
+        Returns:
+            List[Optional[int]]: номер дороги (первой по порядку в конфиге) или None для каждого bbox.
+        """
+        result: List[Optional[int]] = [None] * len(tracked_xyxy)
+        if not tracked_xyxy or not self.polygons:
+            return result
+        boxes = np.asarray(tracked_xyxy, dtype=np.float64).reshape(-1, 4)
+        x = (boxes[:, 0] + boxes[:, 2]) / 2
+        y = (boxes[:, 1] + boxes[:, 3]) / 2
+        unresolved = np.ones(len(boxes), dtype=bool)
+        for road_id, polygon in self.polygons.items():
+            inside = shapely.contains_xy(polygon, x, y) & unresolved
+            for i in np.flatnonzero(inside):
+                result[i] = road_id
+            unresolved &= ~inside
+            if not unresolved.any():
+                break
+        return result
+
+    def masks(self, shape: Tuple[int, int]) -> Dict[int, np.ndarray]:
+        """Бинарные маски дорог под размер кадра (height, width), строятся один раз на размер."""
+        if shape not in self._masks:
+            masks = {}
+            for road_id, points in self.points.items():
+                mask = np.zeros(shape, dtype=np.uint8)
+                masks[road_id] = cv2.fillPoly(mask, pts=[points], color=1)
+            self._masks[shape] = masks
+        return self._masks[shape]
+
+    @staticmethod
+    def _centroid(points: np.ndarray) -> Optional[Tuple[int, int]]:
+        moments = cv2.moments(points)
+        if moments["m00"] == 0:
+            return None
+        return int(moments["m10"] / moments["m00"]), int(moments["m01"] / moments["m00"])
+
+
+class RoadsRegistry:
+    def __init__(self, path: str, watch_secs: float = 0) -> None:
+        """
+        Реестр конфигурации дорог с горячей перезагрузкой.
+
+        Новая версия компилируется вне горячего пути (в потоке наблюдения за файлом
+        или в вызывающем update потоке) и подменяется одной атомарной записью ссылки,
+        так что читатели всегда видят согласованную пару (roads_info, version).
+
+        Args:
+            path (str): путь до json файла с координатами дорог.
+            watch_secs (float): период проверки изменения файла (0 — не следить).
+        """
+        self.path = path
+        self.watch_secs = watch_secs
+        self._lock = threading.Lock()  # сериализует компиляцию новых версий
+        self._mtime_ns = None
+        self.current = RoadsGeometry({}, version=0)
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"Failed to load roads info from {path}: {e}")
+        self._stop_event = threading.Event()
+        self._watcher = None
+        if watch_secs > 0:
+            self._watcher = threading.Thread(target=self._watch, name="roads_registry_watcher", daemon=True)
+            self._watcher.start()
+
+    def reload(self) -> RoadsGeometry:
+        """Перечитывает файл и публикует новую версию."""
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        with open(self.path, "r") as file:
+            data_json = json.load(file)
+        geometry = self._publish(data_json)
+        self._mtime_ns = mtime_ns
+        return geometry
+
+    def refresh(self) -> RoadsGeometry:
+        """Перечитывает файл, если он изменился после последней загрузки (одна проверка mtime)."""
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            self._mtime_ns = mtime_ns  # битый файл не перечитываем до следующего изменения
+            self.reload()
+        return self.current
+
+    def update(self, data_json: dict, persist: bool = True) -> RoadsGeometry:
+        """Публикует новую конфигурацию дорог (например, пришедшую через API).
+
+        Args:
+            data_json (dict): словарь полигонов {номер дороги: [x1, y1, ...]}.
+            persist (bool): записать ли конфигурацию в файл (атомарной заменой).
+        """
+        geometry = self._publish(data_json)
+        if persist:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(geometry.roads_info, file, indent=4)
+            os.replace(tmp_path, self.path)
+            self._mtime_ns = os.stat(self.path).st_mtime_ns
+        return geometry
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _publish(self, data_json: dict) -> RoadsGeometry:
+        roads_info = parse_roads_info(data_json)
+        with self._lock:
+            geometry = RoadsGeometry(roads_info, version=self.current.version + 1)
+            self.current = geometry  # атомарная подмена ссылки
+        logger.info(f"Roads info v{geometry.version} loaded from {self.path}")
+        return geometry
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.watch_secs):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Failed to reload roads info from {self.path}: {e}")
+
+
+_registries: Dict[str, RoadsRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_roads_registry(path: str, watch_secs: float = 0) -> RoadsRegistry:
+    """Возвращает общий для процесса реестр дорог для файла path."""
+    key = os.path.abspath(path)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = RoadsRegistry(path, watch_secs=watch_secs)
+        return _registries[key]
@@ -0,0 +1,98 @@
+import json
+import struct
+from typing import Any, Dict
+
+import numpy as np
+
+from elements.FrameElement import FrameElement
+from elements.TracksStore import TracksStore, TRACK_DTYPE
+
+# Схема сериализации FrameElement: поле -> способ кодирования.
+# Пиксельные буферы (frame, frame_result) и roads_info (есть по roads_version) не сериализуются.
+FRAME_ELEMENT_SCHEMA = {
+    "source": "scalar",
+    "timestamp": "scalar",
+    "frame_num": "scalar",
+    "file_id": "scalar",
+    "roads_version": "scalar",
+    "timestamp_date": "scalar",
+    "data": "object",
+    "info": "object",
+    "detected_conf": np.float32,
+    "detected_cls": "object",
+    "detected_xyxy": np.int32,
+    "tracked_conf": np.float32,
+    "tracked_cls": "object",
+    "tracked_xyxy": np.int32,
+    "id_list": np.int64,
+    "removed_ids": np.int64,
+    "buffer_tracks": TRACK_DTYPE,
+}
+
+_BINARY_MAGIC = b"FE1"
+_HEADER_LEN = struct.Struct("<I")
+
+
+def _fields(frame_element: FrameElement):
+    # Обход полей по схеме: (имя, способ кодирования, значение), отсутствующие поля пропускаются
+    for name, kind in FRAME_ELEMENT_SCHEMA.items():
+        if not hasattr(frame_element, name):
+            continue
+        value = getattr(frame_element, name)
+        if isinstance(value, TracksStore):
+            value = value.records
+        yield name, kind, value
+
+
+def frame_element_to_json(frame_element: FrameElement) -> bytes:
+    """Компактный JSON кадра: bbox как списки int, без пиксельных буферов."""
+    out = {}
+    for name, kind, value in _fields(frame_element):
+        if kind is TRACK_DTYPE:
+            out[name] = {field: value[field].tolist() for field in TRACK_DTYPE.names}
+        elif isinstance(kind, type):
+            out[name] = np.asarray(value, dtype=kind).tolist()
+        else:
+            out[name] = value
+    return json.dumps(out, separators=(",", ":"), default=str).encode()
+
+
+def frame_element_to_binary(frame_element: FrameElement) -> bytes:
+    """Бинарный формат кадра: magic + длина заголовка + JSON заголовок + сырые байты массивов."""
+    header = {}
+    arrays = []
+    offset = 0
+    for name, kind, value in _fields(frame_element):
+        if isinstance(kind, (type, np.dtype)):
+            array = np.ascontiguousarray(value, dtype=kind)
+            header[name] = {
+                "dtype": array.dtype.descr if array.dtype.names else array.dtype.str,
+                "shape": array.shape,
+                "offset": offset,
+                "nbytes": array.nbytes,
+            }
+            arrays.append(array.tobytes())
+            offset += array.nbytes
+        else:
+            header[name] = {"value": value}
+    header_bytes = json.dumps(header, separators=(",", ":"), default=str).encode()
+    return _BINARY_MAGIC + _HEADER_LEN.pack(len(header_bytes)) + header_bytes + b"".join(arrays)
+
+
+def frame_element_from_binary(payload: bytes) -> Dict[str, Any]:
+    """Декодирует бинарный формат в словарь полей (массивы — numpy)."""
+    if payload[: len(_BINARY_MAGIC)] != _BINARY_MAGIC:
+        raise ValueError("Not a FrameElement binary payload")
+    start = len(_BINARY_MAGIC) + _HEADER_LEN.size
+    (header_len,) = _HEADER_LEN.unpack_from(payload, len(_BINARY_MAGIC))
+    header = json.loads(payload[start : start + header_len])
+    body = memoryview(payload)[start + header_len :]
+    out = {}
+    for name, meta in header.items():
+        if "value" in meta:
+            out[name] = meta["value"]
+            continue
+        dtype = np.dtype([tuple(field) for field in meta["dtype"]]) if isinstance(meta["dtype"], list) else np.dtype(meta["dtype"])
+        chunk = body[meta["offset"] : meta["offset"] + meta["nbytes"]]
+        out[name] = np.frombuffer(chunk, dtype=dtype).reshape(meta["shape"])
+    return out
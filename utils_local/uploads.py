@@ -0,0 +1,186 @@
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+from fastapi import Request
+from prometheus_client import Counter, Histogram
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart import MultipartParser
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import parse_options_header
+
+# Метрики Prometheus загрузок
+UPLOAD_BYTES = Counter('upload_bytes', 'Bytes received in uploads')
+UPLOAD_DURATION = Histogram('upload_seconds', 'Upload streaming duration')
+UPLOAD_THROUGHPUT = Histogram(
+    'upload_throughput_bytes_per_second',
+    'Upload throughput',
+    buckets=(1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9),
+)
+UPLOADS_REJECTED = Counter('uploads_rejected', 'Uploads rejected while streaming', ['reason'])
+
+# Запас на заголовки частей и границы multipart сверх размера самого файла
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: Optional[str]  # None если файл не сохранялся
+    size: int
+    sha256: str
+
+
+class MultipartUpload:
+    def __init__(self, request: Request, field_name: str = "file") -> None:
+        """
+        Файл из тела multipart/form-data, читаемый по мере приема запроса.
+
+        Тело разбирается потоково из request.stream(), без UploadFile: Starlette не принимает
+        запрос целиком во временный файл до вызова эндпоинта, поэтому лимит размера
+        срабатывает во время приема, а файл копируется на диск один раз.
+        filename и content_type части известны после получения первой порции файла.
+        """
+        self.request = request
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        content_length = request.headers.get("content-length")
+        self.content_length = int(content_length) if content_length and content_length.isdigit() else None
+
+    async def chunks(self, chunk_bytes: int) -> AsyncIterator[bytes]:
+        """Данные поля field_name порциями около chunk_bytes."""
+        content_type, params = parse_options_header(self.request.headers.get("content-type"))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise MalformedUpload("Expected multipart/form-data body with a boundary")
+
+        pending: List[bytes] = []
+        headers = {}
+        header = {"field": b"", "value": b""}
+        state = {"in_file": False, "found": False}
+
+        def on_header_field(data: bytes, start: int, end: int) -> None:
+            header["field"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int) -> None:
+            header["value"] += data[start:end]
+
+        def on_header_end() -> None:
+            headers[header["field"].lower()] = header["value"]
+            header["field"], header["value"] = b"", b""
+
+        def on_headers_finished() -> None:
+            _, disposition = parse_options_header(headers.get(b"content-disposition"))
+            is_file = not state["found"] and disposition.get(b"name") == self.field_name.encode()
+            if is_file:
+                state["found"] = True
+                self.filename = disposition.get(b"filename", b"").decode("utf-8", errors="replace") or None
+                self.content_type = headers.get(b"content-type", b"").decode("latin-1") or None
+            state["in_file"] = is_file
+            headers.clear()
+
+        def on_part_data(data: bytes, start: int, end: int) -> None:
+            if state["in_file"]:
+                pending.append(bytes(data[start:end]))
+
+        def on_part_end() -> None:
+            state["in_file"] = False
+
+        parser = MultipartParser(
+            boundary,
+            callbacks={
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_part_data": on_part_data,
+                "on_part_end": on_part_end,
+            },
+        )
+        try:
+            async for body in self.request.stream():
+                parser.write(body)
+                # Порции копятся до chunk_bytes, чтобы не переключаться в поток записи на каждый пакет сети
+                if sum(len(chunk) for chunk in pending) >= chunk_bytes:
+                    yield b"".join(pending)
+                    pending.clear()
+            parser.finalize()
+        except MultipartParseError as error:
+            raise MalformedUpload(f"Malformed multipart body: {error}")
+        if not state["found"]:
+            raise MalformedUpload(f"Missing form field '{self.field_name}'")
+        if pending:
+            yield b"".join(pending)
+
+
+async def stream_upload(
+    upload: MultipartUpload,
+    dest_path: Optional[str] = None,
+    max_bytes: int = 4 * 1024**3,
+    chunk_bytes: int = 1024**2,
+) -> StoredUpload:
+    """
+    Потоково сохраняет загруженный файл на диск порциями по chunk_bytes.
+
+    Запрос с Content-Length больше лимита отклоняется до чтения тела. Содержимое хэшируется
+    (sha256) по мере приема, лимит размера проверяется на каждой порции, так что память
+    не зависит от размера файла. Файл пишется во временный файл рядом с dest_path
+    и переименовывается только после успешного чтения целиком.
+
+    Raises:
+        UploadTooLarge: файл больше max_bytes (временный файл удаляется).
+        MalformedUpload: тело запроса не multipart/form-data или в нем нет файла.
+    """
+    if upload.content_length is not None and upload.content_length > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        UPLOADS_REJECTED.labels("too_large").inc()
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+    t_start = time.monotonic()
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = None
+    out = None
+    if dest_path is not None:
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+        out = open(tmp_path, "wb")
+    try:
+        async for chunk in upload.chunks(chunk_bytes):
+            size += len(chunk)
+            if size > max_bytes:
+                UPLOADS_REJECTED.labels("too_large").inc()
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            if out is not None:
+                await run_in_threadpool(out.write, chunk)
+            UPLOAD_BYTES.inc(len(chunk))
+        if out is not None:
+            out.close()
+            os.replace(tmp_path, dest_path)
+    except BaseException:
+        if out is not None:
+            out.close()
+            os.remove(tmp_path)
+        raise
+
+    duration = time.monotonic() - t_start
+    UPLOAD_DURATION.observe(duration)
+    if duration > 0:
+        UPLOAD_THROUGHPUT.observe(size / duration)
+    return StoredUpload(path=dest_path, size=size, sha256=digest.hexdigest())
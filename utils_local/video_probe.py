@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from typing import Optional
+
+import cv2
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus проверки загруженных видео
+VIDEO_PROBE_TIME = Histogram('video_probe_seconds', 'Video metadata probe latency')
+VIDEO_PROBE_REJECTED = Counter('video_probe_rejected', 'Uploads rejected by the video probe', ['reason'])
+
+FFPROBE_TIMEOUT_SECS = 10
+
+
+class ProbeError(Exception):
+    def __init__(self, reason: str, message: str) -> None:
+        """reason — короткий код причины (empty, undecodable, too_large, too_long) для метрик и API."""
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass(frozen=True)
+class VideoInfo:
+    width: int
+    height: int
+    fps: Optional[float]  # None — неизвестно (например, поток без метки частоты кадров)
+    frame_count: Optional[int]
+    duration_secs: Optional[float]
+    codec: Optional[str]
+    size_bytes: int
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def probe_video(path: str) -> VideoInfo:
+    """
+    Метаданные видео из контейнера без декодирования кадров.
+
+    Используется ffprobe, если он установлен, иначе свойства cv2.VideoCapture
+    (открытие файла читает только заголовки).
+
+    Raises:
+        ProbeError: файл пустой, не открывается или в нем нет видеопотока.
+    """
+    with VIDEO_PROBE_TIME.time():
+        size_bytes = os.path.getsize(path)
+        if size_bytes == 0:
+            raise _reject("empty", "Uploaded file is empty")
+        if shutil.which("ffprobe"):
+            info = _probe_ffprobe(path, size_bytes)
+        else:
+            info = _probe_cv2(path, size_bytes)
+    if info.width <= 0 or info.height <= 0:
+        raise _reject("undecodable", "No decodable video stream")
+    if info.frame_count == 0 or info.duration_secs == 0:
+        raise _reject("empty", "Video has no frames")
+    return info
+
+
+def check_limits(info: VideoInfo, max_width: int, max_height: int, max_duration_secs: float = 0) -> None:
+    """
+    Проверка ограничений на разрешение и длительность (0 — без ограничения).
+
+    Разрешение сравнивается без учета ориентации: вертикальное 2160x3840 проходит при лимите 3840x2160.
+
+    Raises:
+        ProbeError: видео превышает ограничения.
+    """
+    long_side, short_side = max(info.width, info.height), min(info.width, info.height)
+    if long_side > max(max_width, max_height) or short_side > min(max_width, max_height):
+        raise _reject("too_large", f"Resolution {info.width}x{info.height} exceeds {max_width}x{max_height}")
+    if max_duration_secs and info.duration_secs and info.duration_secs > max_duration_secs:
+        raise _reject("too_long", f"Duration {info.duration_secs:.0f} s exceeds {max_duration_secs:.0f} s")
+
+
+def _reject(reason: str, message: str) -> ProbeError:
+    VIDEO_PROBE_REJECTED.labels(reason).inc()
+    return ProbeError(reason, message)
+
+
+def _probe_ffprobe(path: str, size_bytes: int) -> VideoInfo:
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate,nb_frames,duration:format=duration",
+        "-of", "json", path,
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, timeout=FFPROBE_TIMEOUT_SECS, check=True).stdout
+        data = json.loads(output)
+    except (subprocess.SubprocessError, ValueError) as error:
+        logger.warning(f"ffprobe failed for {path}: {error}")
+        raise _reject("undecodable", "File is not a readable video container")
+    streams = data.get("streams") or []
+    if not streams:
+        raise _reject("undecodable", "No video stream in container")
+    stream = streams[0]
+
+    fps = None
+    if stream.get("avg_frame_rate") not in (None, "0/0"):
+        fps = float(Fraction(stream["avg_frame_rate"])) or None
+    duration = stream.get("duration") or data.get("format", {}).get("duration")
+    duration_secs = float(duration) if duration not in (None, "N/A") else None
+    frame_count = int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else None
+    if frame_count is None and duration_secs is not None and fps:
+        frame_count = round(duration_secs * fps)
+    return VideoInfo(
+        width=int(stream.get("width") or 0),
+        height=int(stream.get("height") or 0),
+        fps=fps,
+        frame_count=frame_count,
+        duration_secs=duration_secs,
+        codec=stream.get("codec_name"),
+        size_bytes=size_bytes,
+    )
+
+
+def _probe_cv2(path: str, size_bytes: int) -> VideoInfo:
+    stream = cv2.VideoCapture(path)
+    try:
+        if not stream.isOpened():
+            raise _reject("undecodable", "File is not a readable video container")
+        width = int(stream.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = stream.get(cv2.CAP_PROP_FPS)
+        frames = stream.get(cv2.CAP_PROP_FRAME_COUNT)
+        fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        stream.release()
+    # Отрицательные и нулевые значения у cv2 означают «неизвестно» (потоковые контейнеры)
+    fps = fps if fps > 0 else None
+    frame_count = int(frames) if frames > 0 else None
+    codec = fourcc.to_bytes(4, "little").decode("ascii", errors="replace").strip("\x00 ") if fourcc > 0 else None
+    return VideoInfo(
+        width=width,
+        height=height,
+        fps=fps,
+        frame_count=frame_count,
+        duration_secs=frame_count / fps if frame_count and fps else None,
+        codec=codec or None,
+        size_bytes=size_bytes,
+    )
@@ -0,0 +1,487 @@
+import heapq
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from some_module.AppConfig import AppConfig
+from utils_local.job_registry import CANCELLED, COMPLETED, FAILED, JobRegistry
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus пула обработчиков видео
+WORKER_POOL_SIZE = Gauge('worker_pool_size', 'Video processing worker processes')
+WORKER_POOL_BUSY = Gauge('worker_pool_busy', 'Worker processes busy with a job')
+WORKER_POOL_QUEUED = Gauge('worker_pool_queued_jobs', 'Jobs waiting for a worker')
+WORKER_POOL_CANCELLED = Counter('worker_pool_cancelled', 'Jobs cancelled', ['state'])
+WORKER_POOL_RESTARTS = Counter('worker_pool_restarts', 'Worker processes restarted after a crash')
+
+
+# Переменная окружения, включающая в процессах обработки multiprocess-режим prometheus_client
+METRICS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Классы приоритета задач: меньше — раньше
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class PoolOverloaded(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Processing backlog is full, retry after {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+def run_job(
+    pipeline: dict,
+    config: AppConfig,
+    video_path: str,
+    file_id: str,
+    on_progress: Optional[Callable] = None,
+    cancel_event=None,
+) -> dict:
+    """
+    Обработка одного видео на уже загруженных узлах.
+
+    Узлы с состоянием конкретного видео (чтение, буфер треков, статистика, запись в БД)
+    создаются на каждую задачу, модель детекции переиспользуется, у трекера сбрасывается
+    состояние. on_progress(кадров прочитано, всего кадров) вызывается после каждого кадра,
+    cancel_event проверяется на границе кадров.
+
+    Raises:
+        JobCancelled: задача отменена через cancel_event.
+
+    Returns:
+        dict: итог обработки для processed_videos.
+    """
+    # Импорт узлов внутри процесса обработчика: родительскому процессу они не нужны
+    from elements.VideoEndBreakElement import VideoEndBreakElement
+    from nodes.CalcStatisticsNode import CalcStatisticsNode
+    from nodes.SendInfoDBNode import SendInfoDBNode
+    from nodes.SendTracksDBNode import SendTracksDBNode
+    from nodes.TrackerInfoUpdateNode import TrackerInfoUpdateNode
+    from nodes.VideoReader import VideoReader
+
+    config = config.for_job(video_path, file_id)
+    detection_node = pipeline["detection_node"]
+    detection_node.reset()
+    video_reader = VideoReader(config.video_reader)
+    tracker_node = TrackerInfoUpdateNode(config)
+    stats_node = CalcStatisticsNode(config)
+    db_node = SendInfoDBNode(config) if config.pipeline.send_info_db else None
+    tracks_db_node = SendTracksDBNode(config) if config.pipeline.send_tracks_db else None
+    video_server = pipeline.get("video_server")
+
+    objects_detected = 0
+    try:
+        for frame_element in video_reader.process():
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled(file_id)
+            frame_element = detection_node.process(frame_element)
+            frame_element = tracker_node.process(frame_element)
+            frame_element = stats_node.process(frame_element)
+            objects_detected += len(getattr(frame_element, "finished_tracks", ()))
+
+            if db_node:
+                frame_element = db_node.process(frame_element)
+            if tracks_db_node:
+                frame_element = tracks_db_node.process(frame_element)
+
+            if isinstance(frame_element, VideoEndBreakElement):
+                break
+            if video_server:
+                video_server.update_image(frame_element.frame_result)
+            if on_progress is not None:
+                on_progress(video_reader.frames_read, video_reader.total_frames)
+    finally:
+        # При отмене и ошибке тоже дописываем уже накопленные строки и освобождаем видео
+        video_reader.stream.release()
+        for node in (db_node, tracks_db_node):
+            if node is not None:
+                node.writer.close()
+    return {"objects_detected": objects_detected}
+
+
+def _worker_main(
+    worker_id: int, config: AppConfig, inbox, event_queue, cancel_event, progress_secs: float
+) -> None:
+    # Процесс обработчика: модель загружается один раз, затем задачи приходят в личную очередь
+    from nodes.DetectionTrackingNodes import DetectionTrackingNodes
+    from utils_local.db_writer import add_commit_listener
+
+    def publish_commit(table_name, columns, batch) -> None:
+        # Писатели БД работают в этом процессе: о коммите строк по file_id сообщаем процессу API
+        if "file_id" not in columns:
+            return
+        file_id_index = columns.index("file_id")
+        for committed_file_id in {row[file_id_index] for row in batch}:
+            event_queue.put(("committed", worker_id, committed_file_id))
+
+    add_commit_listener(publish_commit)
+
+    pipeline = {"detection_node": DetectionTrackingNodes(config)}
+    if config.pipeline.show_in_web:
+        from nodes.FlaskServerVideoNode import VideoServer
+
+        pipeline["video_server"] = VideoServer(config)
+    logger.info(f"Worker {worker_id} (pid {os.getpid()}) is ready")
+
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        video_path, file_id, filename = job
+        event_queue.put(("started", worker_id, file_id, filename))
+        last_progress = [0.0]
+
+        def publish_progress(frames_done: int, total_frames: int) -> None:
+            # Прогресс отправляется в процесс API не чаще раза в progress_secs
+            now = time.monotonic()
+            if now - last_progress[0] >= progress_secs:
+                last_progress[0] = now
+                event_queue.put(("progress", worker_id, file_id, frames_done, total_frames))
+
+        try:
+            result = run_job(
+                pipeline, config, video_path, file_id, on_progress=publish_progress, cancel_event=cancel_event
+            )
+            event_queue.put(("finished", worker_id, file_id, COMPLETED, result))
+        except JobCancelled:
+            logger.info(f"Worker {worker_id}: job {file_id} cancelled")
+            event_queue.put(("finished", worker_id, file_id, CANCELLED, None))
+        except Exception as error:
+            logger.exception(f"Worker {worker_id}: error processing video {file_id}")
+            event_queue.put(("finished", worker_id, file_id, FAILED, {"error": str(error)}))
+
+
+class _QueuedJob:
+    __slots__ = ("video_path", "file_id", "filename", "expected_secs", "cancelled", "started_at")
+
+    def __init__(self, video_path: str, file_id: str, filename: str, expected_secs: float) -> None:
+        self.video_path = video_path
+        self.file_id = file_id
+        self.filename = filename
+        self.expected_secs = expected_secs
+        self.cancelled = False
+        self.started_at = None
+
+
+class WorkerMetricsCollector:
+    def __init__(self, metrics_dir: str, registry: CollectorRegistry = REGISTRY) -> None:
+        """
+        Метрики процесса API вместе с метриками процессов обработки.
+
+        Писатели БД, их пулы и спулы работают в процессах обработки, которые пишут метрики
+        в файлы metrics_dir (multiprocess-режим prometheus_client). Семейства с одним именем
+        объединяются в одно, иначе ответ /metrics содержал бы повторные HELP/TYPE.
+        Серии процесса API приоритетнее одноименных серий обработчиков (без учета pid):
+        модули, импортированные в обоих процессах, создают в обработчиках нулевые копии метрик API.
+        """
+        self.metrics_dir = metrics_dir
+        self.registry = registry
+
+    def collect(self):
+        families = {metric.name: metric for metric in self.registry.collect()}
+        exported = {(sample.name, _series_key(sample.labels)) for metric in families.values() for sample in metric.samples}
+        for metric in MultiProcessCollector(None, path=self.metrics_dir).collect():
+            samples = [
+                sample for sample in metric.samples if (sample.name, _series_key(sample.labels)) not in exported
+            ]
+            if not samples:
+                continue
+            if metric.name in families:
+                families[metric.name].samples.extend(samples)
+            else:
+                metric.samples = samples
+                families[metric.name] = metric
+        return list(families.values())
+
+
+def _series_key(labels: dict) -> tuple:
+    return tuple(sorted((name, value) for name, value in labels.items() if name != "pid"))
+
+
+class ProcessingWorkerPool:
+    def __init__(
+        self,
+        config: AppConfig,
+        num_workers: int,
+        on_finished: Callable,
+        on_commit: Optional[Callable] = None,
+        registry: Optional[JobRegistry] = None,
+        progress_secs: float = 1.0,
+        max_backlog_secs: float = 0.0,
+        speed_smoothing: float = 0.3,
+        metrics_dir: Optional[str] = None,
+    ) -> None:
+        """
+        Пул долгоживущих процессов обработки видео с планировщиком задач.
+
+        Каждый процесс один раз загружает модель детекции, так что загрузка весов не
+        повторяется на каждое видео. Очередь задач ведет родительский процесс: куча
+        по (класс приоритета, ожидаемая длительность, порядок поступления), то есть
+        внутри класса короткие видео идут раньше длинных. Свободному процессу задача
+        отдается в его личную очередь. Отмена работающей задачи выставляет событие
+        процесса, которое проверяется на границе кадров.
+
+        События процессов (начало, прогресс, коммит строк в БД, завершение задачи) читаются отдельным
+        потоком и отражаются в реестре задач; упавший процесс перезапускается, а его
+        текущая задача помечается как failed.
+
+        Прием задач ограничен объемом работы, а не числом задач: сумма длительностей
+        видео в очереди плюс оставшаяся часть выполняемых не может превысить
+        max_backlog_secs. Скорость обработки (секунд видео в секунду на процесс)
+        оценивается EWMA по завершенным задачам и используется для оценки Retry-After.
+
+        Процессы обработки пишут метрики Prometheus в metrics_dir, процесс API отдает их
+        через WorkerMetricsCollector.
+
+        Args:
+            config (AppConfig): скомпилированная конфигурация приложения (передается в процессы).
+            num_workers (int): число процессов обработки на хосте.
+            on_finished (Callable): вызывается в потоке пула как on_finished(file_id, filename, status, result).
+            on_commit (Optional[Callable]): вызывается в потоке пула как on_commit(file_id) после коммита
+                строк задачи в БД процессом обработки.
+            registry (Optional[JobRegistry]): реестр задач для эндпоинтов прогресса.
+            progress_secs (float): как часто обработчики публикуют прогресс (в сек).
+            max_backlog_secs (float): предел видео в очереди и обработке (в сек), 0 — без ограничения.
+            speed_smoothing (float): вес нового замера скорости обработки в EWMA.
+            metrics_dir (Optional[str]): каталог файлов метрик процессов обработки
+                (очищается при старте), None — временный каталог.
+        """
+        self.config = config
+        self.num_workers = num_workers
+        self.on_finished = on_finished
+        self.on_commit = on_commit
+        self.registry = registry if registry is not None else JobRegistry()
+        self.progress_secs = progress_secs
+        self.max_backlog_secs = max_backlog_secs
+        self.speed_smoothing = speed_smoothing
+        self.metrics_dir = metrics_dir
+        self._speed = 0.0  # секунд видео в секунду на процесс, 0 — еще не измерена
+        # spawn: процессы не наследуют состояние CUDA и потоков родителя
+        self._context = mp.get_context("spawn")
+        self._event_queue = self._context.Queue()
+        self._inboxes = {worker_id: self._context.Queue() for worker_id in range(num_workers)}
+        self._cancel_events = {worker_id: self._context.Event() for worker_id in range(num_workers)}
+        self._workers: Dict[int, mp.Process] = {}
+        self._idle = set(range(num_workers))
+        self._heap: List[tuple] = []
+        self._queued: Dict[str, _QueuedJob] = {}  # file_id -> задача в куче
+        self._running: Dict[int, _QueuedJob] = {}  # worker_id -> выполняемая задача
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._listener = threading.Thread(target=self._listen, name="worker_pool_listener", daemon=True)
+
+    def start(self) -> None:
+        # Файлы метрик прошлого запуска не переносятся: счетчики начинаются заново, как и в процессе API
+        if self.metrics_dir is None:
+            self.metrics_dir = tempfile.mkdtemp(prefix="worker_metrics_")
+        else:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+            os.makedirs(self.metrics_dir)
+        # Режим значений prometheus_client выбирается при импорте, поэтому переменная окружения
+        # действует только на процессы обработки (spawn), процесс API ее уже не читает
+        os.environ[METRICS_DIR_ENV] = self.metrics_dir
+        for worker_id in range(self.num_workers):
+            self._start_worker(worker_id)
+        WORKER_POOL_SIZE.set(self.num_workers)
+        self._listener.start()
+
+    def submit(
+        self,
+        video_path: str,
+        file_id: str,
+        filename: Optional[str] = None,
+        priority: str = "normal",
+        expected_secs: float = 0.0,
+        video_info: Optional[dict] = None,
+    ) -> None:
+        """
+        Ставит видео в очередь обработки.
+
+        Args:
+            video_path (str): путь до видео.
+            file_id (str): идентификатор задачи.
+            filename (Optional[str]): исходное имя файла для отчетов.
+            priority (str): класс приоритета из PRIORITY_CLASSES.
+            expected_secs (float): ожидаемая длительность (длительность видео по метаданным).
+            video_info (Optional[dict]): метаданные видео для реестра задач.
+
+        Raises:
+            PoolOverloaded: с задачей очередь превысит max_backlog_secs.
+        """
+        job = _QueuedJob(video_path, file_id, filename or os.path.basename(video_path), expected_secs)
+        with self._lock:
+            retry_after = self._retry_after(expected_secs)
+            if retry_after is not None:
+                raise PoolOverloaded(retry_after)
+            self.registry.submit(file_id, job.filename, video_info)
+            heapq.heappush(self._heap, (PRIORITY_CLASSES[priority], expected_secs, next(self._seq), job))
+            self._queued[file_id] = job
+            WORKER_POOL_QUEUED.set(len(self._queued))
+            self._dispatch()
+
+    def backlog_secs(self) -> float:
+        """Секунд видео в очереди и еще не обработанных в выполняемых задачах."""
+        with self._lock:
+            return self._backlog_secs()
+
+    def retry_after(self, expected_secs: float = 0.0) -> Optional[float]:
+        """Через сколько секунд в очереди освободится место под задачу; None если место есть."""
+        with self._lock:
+            return self._retry_after(expected_secs)
+
+    def _backlog_secs(self) -> float:
+        now = time.monotonic()
+        speed = self._speed or 1.0
+        backlog = sum(job.expected_secs for job in self._queued.values())
+        for job in self._running.values():
+            backlog += max(job.expected_secs - (now - job.started_at) * speed, 0.0)
+        return backlog
+
+    def _retry_after(self, expected_secs: float) -> Optional[float]:
+        if self.max_backlog_secs <= 0:
+            return None
+        backlog = self._backlog_secs()
+        excess = backlog + expected_secs - self.max_backlog_secs
+        # Пустая очередь принимает задачу любой длины, иначе длинное видео не пройдет никогда
+        if excess <= 0 or backlog <= 0:
+            return None
+        # До измерения скорости считаем, что видео обрабатывается в реальном времени
+        return excess / ((self._speed or 1.0) * self.num_workers)
+
+    def cancel(self, file_id: str) -> bool:
+        """Отменяет задачу в очереди или останавливает выполняемую. False если задача не найдена."""
+        with self._lock:
+            job = self._queued.pop(file_id, None)
+            if job is not None:
+                job.cancelled = True  # из кучи удаляется лениво при выдаче
+                WORKER_POOL_QUEUED.set(len(self._queued))
+                WORKER_POOL_CANCELLED.labels("queued").inc()
+            else:
+                for worker_id, running in self._running.items():
+                    if running.file_id == file_id:
+                        self._cancel_events[worker_id].set()
+                        WORKER_POOL_CANCELLED.labels("running").inc()
+                        return True
+                return False
+        self._finish(file_id, job.filename, CANCELLED, None)
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop_event.set()
+        for inbox in self._inboxes.values():
+            inbox.put(None)
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+            mark_process_dead(process.pid, self.metrics_dir)
+        self._listener.join(timeout)
+
+    def _dispatch(self) -> None:
+        # Вызывается под self._lock: свободным процессам выдаются задачи с вершины кучи
+        while self._idle and self._heap:
+            job = heapq.heappop(self._heap)[-1]
+            if job.cancelled:
+                continue
+            worker_id = self._idle.pop()
+            del self._queued[job.file_id]
+            job.started_at = time.monotonic()
+            self._running[worker_id] = job
+            # Событие отмены сбрасывается до выдачи: процесс получит задачу только после
+            # завершения предыдущей, поэтому старая отмена не заденет новую задачу
+            self._cancel_events[worker_id].clear()
+            self._inboxes[worker_id].put((job.video_path, job.file_id, job.filename))
+        WORKER_POOL_QUEUED.set(len(self._queued))
+        WORKER_POOL_BUSY.set(len(self._running))
+
+    def _start_worker(self, worker_id: int) -> None:
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.config,
+                self._inboxes[worker_id],
+                self._event_queue,
+                self._cancel_events[worker_id],
+                self.progress_secs,
+            ),
+            name=f"video_worker_{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def _listen(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                event = self._event_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            self._handle_event(event)
+
+    def _handle_event(self, event: tuple) -> None:
+        kind, worker_id, file_id = event[:3]
+        if kind == "started":
+            self.registry.start(file_id, worker_id, event[3])
+        elif kind == "progress":
+            self.registry.progress(file_id, frames_done=event[3], total_frames=event[4])
+        elif kind == "committed":
+            if self.on_commit is not None:
+                self.on_commit(file_id)
+        elif kind == "finished":
+            status, result = event[3], event[4]
+            with self._lock:
+                job = self._running.pop(worker_id, None)
+                if job is not None and status == COMPLETED:
+                    self._update_speed(job)
+                self._idle.add(worker_id)
+                self._dispatch()
+            self._finish(file_id, job.filename if job is not None else None, status, result)
+
+    def _update_speed(self, job: _QueuedJob) -> None:
+        elapsed = time.monotonic() - job.started_at
+        if job.expected_secs <= 0 or elapsed <= 0:
+            return
+        speed = job.expected_secs / elapsed
+        self._speed = speed if self._speed == 0 else self._speed + self.speed_smoothing * (speed - self._speed)
+
+    def _check_workers(self) -> None:
+        # Перезапуск упавших процессов (например, по OOM); их текущая задача считается проваленной
+        for worker_id, process in list(self._workers.items()):
+            if process.is_alive() or self._stop_event.is_set():
+                continue
+            logger.error(f"Worker {worker_id} died with exit code {process.exitcode}, restarting")
+            WORKER_POOL_RESTARTS.inc()
+            # Живые gauge упавшего процесса (очередь писателя, занятые подключения) больше не актуальны
+            mark_process_dead(process.pid, self.metrics_dir)
+            self._start_worker(worker_id)
+            with self._lock:
+                job = self._running.pop(worker_id, None)
+                self._idle.add(worker_id)
+                self._dispatch()
+            if job is not None:
+                self._finish(job.file_id, job.filename, FAILED, {"error": f"worker exit code {process.exitcode}"})
+
+    def _finish(self, file_id: str, filename: Optional[str], status: str, result: Optional[dict]) -> None:
+        self.registry.finish(file_id, status, result)
+        try:
+            self.on_finished(file_id, filename, status, result)
+        except Exception as error:
+            logger.error(f"Error while finishing job {file_id}: {error}")